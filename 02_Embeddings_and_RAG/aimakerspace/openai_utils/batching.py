@@ -0,0 +1,103 @@
+"""Token-aware request batching and retry with backoff for the OpenAI API."""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_encodings = {}
+
+
+def retryable_errors() -> Tuple[type, ...]:
+    """Errors worth retrying: throttling, timeouts, dropped connections and 5xx."""
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+def _encoding(model: str):
+    # tiktoken is optional and slow to import, so it is only loaded on first count.
+    if model not in _encodings:
+        encoding = None
+        try:
+            import tiktoken
+
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # Not installed, or offline when the BPE files are first downloaded: estimate instead.
+            encoding = None
+        _encodings[model] = encoding
+    return _encodings[model]
+
+
+def count_tokens(texts: Sequence[str], model: str) -> List[int]:
+    """Token count of each text, exact with ``tiktoken`` and an upper-bound estimate without."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts))]
+    # BPE tokens average about four bytes of English; assume three to stay under limits.
+    return [len(text.encode("utf-8")) // 3 + 1 for text in texts]
+
+
+def token_batches(
+    token_counts: Sequence[int], max_tokens: int, max_items: int
+) -> List[range]:
+    """Packs consecutive inputs into batches of at most ``max_tokens`` tokens and ``max_items`` inputs.
+
+    An input larger than ``max_tokens`` on its own still gets a batch; the API
+    rejects it with a clear error rather than it being silently dropped.
+    """
+    batches, start, tokens = [], 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (tokens + count > max_tokens or i - start >= max_items):
+            batches.append(range(start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append(range(start, len(token_counts)))
+    return batches
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff: uniform over ``[0, min(max_delay, base * 2**attempt)]``."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+async def aretry(
+    call: Callable[[], Awaitable[T]],
+    max_retries: int,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+) -> T:
+    for attempt in range(max_retries + 1):
+        try:
+            return await call()
+        except retryable_errors():
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+
+
+def retry(
+    call: Callable[[], T],
+    max_retries: int,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+) -> T:
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except retryable_errors():
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
@@ -1,17 +1,39 @@
 from dotenv import load_dotenv
 from openai import AsyncOpenAI, OpenAI
 import openai
-from typing import List
+from typing import Callable, List
 import os
 import asyncio
 
+from aimakerspace.openai_utils.batching import aretry, count_tokens, retry, token_batches
+
+# Called as progress(texts_done, texts_total) after each request completes.
+ProgressCallback = Callable[[int, int], None]
+
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "text-embedding-3-small"):
+    """OpenAI embeddings client.
+
+    Batch methods pack the input into requests of at most ``max_batch_tokens``
+    tokens and ``max_batch_size`` inputs. At most ``max_concurrency``
+    requests are in flight at once, and rate-limit, timeout, connection and
+    5xx errors are retried up to ``max_retries`` times with jittered
+    exponential backoff. Results are always returned in input order.
+    """
+
+    def __init__(
+        self,
+        embeddings_model_name: str = "text-embedding-3-small",
+        max_batch_tokens: int = 200_000,
+        max_batch_size: int = 2048,
+        max_concurrency: int = 8,
+        max_retries: int = 6,
+    ):
         load_dotenv()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.async_client = AsyncOpenAI()
-        self.client = OpenAI()
+        # Retries happen in aretry / retry; the SDK's own would multiply the attempts.
+        self.async_client = AsyncOpenAI(max_retries=0)
+        self.client = OpenAI(max_retries=0)
 
         if self.openai_api_key is None:
             raise ValueError(
@@ -19,40 +41,92 @@ class EmbeddingModel:
             )
         openai.api_key = self.openai_api_key
         self.embeddings_model_name = embeddings_model_name
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+    def _batches(self, list_of_text: List[str]) -> List[List[str]]:
+        token_counts = count_tokens(list_of_text, self.embeddings_model_name)
+        return [
+            list_of_text[batch.start:batch.stop]
+            for batch in token_batches(token_counts, self.max_batch_tokens, self.max_batch_size)
+        ]
+
+    @staticmethod
+    def _unpack(embedding_response) -> List[List[float]]:
+        data = sorted(embedding_response.data, key=lambda embedding: embedding.index)
+        return [embeddings.embedding for embeddings in data]
+
+    async def async_get_embeddings(
+        self, list_of_text: List[str], progress: ProgressCallback = None
+    ) -> List[List[float]]:
+        """Embeds ``list_of_text``; ``progress`` is called as each request completes."""
+        batches = self._batches(list_of_text)
+        results: List[List[List[float]]] = [None] * len(batches)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        done = 0
+
+        async def process_batch(i: int, batch: List[str]) -> None:
+            nonlocal done
+            # Backoff sleeps hold the slot, so throttling also lowers concurrency.
+            async with semaphore:
+                embedding_response = await aretry(
+                    lambda: self.async_client.embeddings.create(
+                        input=batch, model=self.embeddings_model_name
+                    ),
+                    self.max_retries,
+                )
+            results[i] = self._unpack(embedding_response)
+            done += len(batch)
+            if progress is not None:
+                progress(done, len(list_of_text))
+
+        tasks = [asyncio.ensure_future(process_batch(i, batch)) for i, batch in enumerate(batches)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
 
-    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        batch_size = 1024
-        batches = [list_of_text[i:i + batch_size] for i in range(0, len(list_of_text), batch_size)]
-        
-        async def process_batch(batch):
-            embedding_response = await self.async_client.embeddings.create(
-                input=batch, model=self.embeddings_model_name
-            )
-            return [embeddings.embedding for embeddings in embedding_response.data]
-        
-        # Use asyncio.gather to process all batches concurrently
-        results = await asyncio.gather(*[process_batch(batch) for batch in batches])
-        
         # Flatten the results
         return [embedding for batch_result in results for embedding in batch_result]
 
     async def async_get_embedding(self, text: str) -> List[float]:
-        embedding = await self.async_client.embeddings.create(
-            input=text, model=self.embeddings_model_name
+        embedding = await aretry(
+            lambda: self.async_client.embeddings.create(
+                input=text, model=self.embeddings_model_name
+            ),
+            self.max_retries,
         )
 
         return embedding.data[0].embedding
 
-    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        embedding_response = self.client.embeddings.create(
-            input=list_of_text, model=self.embeddings_model_name
-        )
+    def get_embeddings(
+        self, list_of_text: List[str], progress: ProgressCallback = None
+    ) -> List[List[float]]:
+        embeddings, done = [], 0
+        for batch in self._batches(list_of_text):
+            embedding_response = retry(
+                lambda: self.client.embeddings.create(
+                    input=batch, model=self.embeddings_model_name
+                ),
+                self.max_retries,
+            )
+            embeddings.extend(self._unpack(embedding_response))
+            done += len(batch)
+            if progress is not None:
+                progress(done, len(list_of_text))
 
-        return [embeddings.embedding for embeddings in embedding_response.data]
+        return embeddings
 
     def get_embedding(self, text: str) -> List[float]:
-        embedding = self.client.embeddings.create(
-            input=text, model=self.embeddings_model_name
+        embedding = retry(
+            lambda: self.client.embeddings.create(
+                input=text, model=self.embeddings_model_name
+            ),
+            self.max_retries,
         )
 
         return embedding.data[0].embedding
@@ -0,0 +1,205 @@
+"""Near-duplicate detection for chunks, ahead of embedding.
+
+Boilerplate, repeated headers, mirrored pages and lightly edited copies make
+many chunks of a corpus near-identical. ``NearDuplicateIndex`` maps each
+such chunk to the first chunk it resembles, its canonical chunk, so only
+canonical chunks need to be embedded and stored::
+
+    chunks = CharacterTextSplitter().split_texts(documents)
+    entries, new = NearDuplicateIndex(threshold=0.8).assign(chunks)
+    unique = [chunk for chunk, is_new in zip(chunks, new) if is_new]
+    # chunks[i] is a near-copy of unique[entries[i]]
+    await vector_db.abuild_from_list(unique)
+
+Similarity is the Jaccard similarity of the chunks' sets of byte
+``shingle_size``-grams, estimated from MinHash signatures. Signatures use
+one-permutation hashing: every shingle is hashed once into one of
+``num_perm`` bins and each bin keeps its minimum, with empty bins filled
+from their neighbours. That costs one hash per shingle instead of one per
+shingle and permutation, and it is all NumPy. Candidate pairs come from
+banded locality-sensitive hashing and are kept when the estimated
+similarity reaches ``threshold``.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+_PRIME = np.uint64(0x100000001B3)
+# splitmix64 finaliser constants.
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = 0x9E3779B97F4A7C15
+# Densification offset per bin borrowed from, so borrowed values stay distinct.
+_STEP = np.uint32(0x9E3779B1)
+# Bytes hashed at once, to bound temporary memory.
+_BLOCK_BYTES = 1 << 24
+
+
+def _shingle_hashes(data: np.ndarray, shingle_size: int, seed: int) -> np.ndarray:
+    """64-bit hashes of every ``shingle_size``-byte window of ``data``."""
+    n = len(data) - shingle_size + 1
+    padded = np.concatenate([data, np.zeros(8, dtype=np.uint8)])
+    hashes = np.full(n, (seed * _GOLDEN) & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+    # Every 8 bytes of a window are read as one unaligned little-endian integer.
+    for start in range(0, shingle_size, 8):
+        words = np.ndarray((n,), dtype="<u8", buffer=padded, offset=start, strides=(1,))
+        width = min(8, shingle_size - start)
+        if width < 8:
+            words = words & np.uint64((1 << (8 * width)) - 1)
+        hashes *= _PRIME
+        hashes ^= words
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= _MIX1
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= _MIX2
+    hashes ^= hashes >> np.uint64(31)
+    return hashes
+
+
+def _densify(signatures: np.ndarray) -> np.ndarray:
+    """Fills each empty bin from the next non-empty bin to its right, wrapping around."""
+    empty = signatures == _EMPTY
+    rows = np.flatnonzero(empty.any(axis=1))
+    if not len(rows):
+        return signatures
+    num_perm = signatures.shape[1]
+    columns = np.arange(2 * num_perm)
+    doubled = np.tile(signatures[rows], 2)
+    source = np.where(np.tile(~empty[rows], 2), columns, 2 * num_perm)
+    source = np.minimum.accumulate(source[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+    distance = (source - columns[:num_perm]).astype(np.uint32)
+    filled = np.take_along_axis(doubled, source, axis=1) + distance * _STEP
+    signatures[rows] = np.where(empty[rows], filled, signatures[rows])
+    return signatures
+
+
+def _signature_block(encoded: List[bytes], num_perm: int, shingle_size: int, seed: int) -> np.ndarray:
+    n = len(encoded)
+    # Zero padding after every text keeps windows from spanning two texts.
+    pad = bytes(shingle_size)
+    data = np.frombuffer(pad.join(encoded) + pad, dtype=np.uint8)
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=n)
+    offsets = np.zeros(n, dtype=np.int64)
+    np.cumsum(lengths[:-1] + shingle_size, out=offsets[1:])
+    # Texts shorter than a shingle still get one (padded) shingle.
+    counts = np.maximum(lengths - shingle_size + 1, 1)
+    firsts = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) + np.repeat(offsets - firsts, counts)
+    hashes = _shingle_hashes(data, shingle_size, seed)[positions]
+
+    bins = ((hashes >> np.uint64(32)) * np.uint64(num_perm)) >> np.uint64(32)
+    slots = np.repeat(np.arange(n, dtype=np.int64) * num_perm, counts) + bins.astype(np.int64)
+    signatures = np.full(n * num_perm, _EMPTY, dtype=np.uint32)
+    np.minimum.at(signatures, slots, (hashes & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+    return _densify(signatures.reshape(n, num_perm))
+
+
+def minhash_signatures(
+    texts: Sequence[str], num_perm: int = 128, shingle_size: int = 8, seed: int = 0
+) -> np.ndarray:
+    """``(len(texts), num_perm)`` uint32 MinHash signatures of the texts' byte shingles.
+
+    The fraction of equal positions in two signatures estimates the Jaccard
+    similarity of the two shingle sets.
+    """
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    start = 0
+    while start < len(texts):
+        encoded, size, stop = [], 0, start
+        while stop < len(texts) and size < _BLOCK_BYTES:
+            encoded.append(texts[stop].encode("utf-8"))
+            size += len(encoded[-1]) + shingle_size
+            stop += 1
+        signatures[start:stop] = _signature_block(encoded, num_perm, shingle_size, seed)
+        start = stop
+    return signatures
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """``(bands, rows)`` for banded LSH over ``num_perm`` signature positions.
+
+    Picks the most rows per band whose S-curve midpoint ``(1 / bands) **
+    (1 / rows)`` is still at or below ``threshold``. Pairs somewhat below the
+    threshold still become candidates, and verification drops them.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+class NearDuplicateIndex:
+    """Incremental near-duplicate detector with one entry per canonical chunk.
+
+    ``assign`` maps every text to an entry: the first earlier entry whose
+    estimated Jaccard similarity reaches ``threshold``, or a new entry of its
+    own. Entries are numbered from 0 in the order they are created, across
+    calls. Only the signatures of entries are kept: ``4 * num_perm`` bytes
+    each, plus one hash table slot per band.
+    """
+
+    def __init__(
+        self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 8, seed: int = 0
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        if num_perm < 1 or shingle_size < 1:
+            raise ValueError("num_perm and shingle_size must be positive")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self._band_weights = rng.integers(1, 1 << 63, self.rows, dtype=np.uint64) | np.uint64(1)
+        self._tables: List[Dict[int, int]] = [{} for _ in range(self.bands)]
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        banded = signatures[:, : self.bands * self.rows].reshape(len(signatures), self.bands, self.rows)
+        return (banded.astype(np.uint64) * self._band_weights).sum(axis=2)
+
+    def _add(self, signature: np.ndarray, keys: List[int]) -> int:
+        if self._count == len(self._signatures):
+            grown = np.empty((max(16, 2 * self._count), self.num_perm), dtype=np.uint32)
+            grown[: self._count] = self._signatures[: self._count]
+            self._signatures = grown
+        entry = self._count
+        self._signatures[entry] = signature
+        self._count += 1
+        for table, key in zip(self._tables, keys):
+            table.setdefault(key, entry)
+        return entry
+
+    def assign(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns ``(entries, new)``: the entry of each text, and where a text created its entry.
+
+        Texts are matched against earlier texts of the same call too, so
+        ``texts[i]`` with ``new[i]`` false is a near-copy of an earlier text.
+        """
+        signatures = minhash_signatures(texts, self.num_perm, self.shingle_size, self.seed)
+        entries = np.empty(len(texts), dtype=np.int64)
+        new = np.zeros(len(texts), dtype=bool)
+        for i, keys in enumerate(self._band_keys(signatures).tolist()):
+            candidates = {table.get(key, -1) for table, key in zip(self._tables, keys)}
+            candidates.discard(-1)
+            entry = -1
+            if candidates:
+                ids = np.sort(np.fromiter(candidates, dtype=np.int64, count=len(candidates)))
+                similarity = np.count_nonzero(self._signatures[ids] == signatures[i], axis=1)
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.threshold * self.num_perm:
+                    entry = int(ids[best])
+            if entry < 0:
+                entry = self._add(signatures[i], keys)
+                new[i] = True
+            entries[i] = entry
+        return entries, new
@@ -0,0 +1,371 @@
+"""Approximate nearest-neighbour indexes that plug into ``VectorDatabase``.
+
+An index never owns the vectors. ``VectorDatabase`` keeps the float32 matrix
+and hands every index a ``fetch(rows)`` callable that returns the requested
+rows as unit-length float32 vectors, so cosine similarity is a plain dot
+product. Indexes only decide *which* rows are worth scoring.
+"""
+
+import heapq
+import math
+import random
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from aimakerspace.quantization import cluster_sums
+from aimakerspace.topk import top_k_indices
+
+VectorFetcher = Callable[[np.ndarray], np.ndarray]
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def spherical_kmeans(
+    data: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0
+) -> np.ndarray:
+    """Clusters unit vectors by cosine similarity and returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        sums, counts = cluster_sums(data, labels, n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+class VectorIndex(ABC):
+    """Interface shared by the approximate indexes.
+
+    ``add`` is called by ``VectorDatabase`` after every insert with the affected
+    row numbers and their raw vectors; a row that is already indexed has been
+    overwritten. ``remove`` is called with tombstoned rows, which must never be
+    returned again, and ``reset`` before the database renumbers its rows during
+    compaction. ``search`` returns ``(rows, scores)`` sorted best first.
+    """
+
+    @abstractmethod
+    def add(self, rows: np.ndarray, vectors: np.ndarray, fetch: VectorFetcher) -> None:
+        ...
+
+    @abstractmethod
+    def remove(self, rows: np.ndarray) -> None:
+        ...
+
+    @abstractmethod
+    def reset(self) -> None:
+        ...
+
+    @abstractmethod
+    def search(
+        self, query: np.ndarray, k: int, fetch: VectorFetcher
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class IVFIndex(VectorIndex):
+    """Inverted-file index with a spherical k-means coarse quantizer.
+
+    Rows are buffered and searched exhaustively until ``train_size`` of them
+    have arrived; the quantizer is then trained on the buffer and every later
+    insert is routed to its nearest centroid. A query scores the ``nprobe``
+    closest centroids and then only the rows in those lists, so raising
+    ``nprobe`` trades latency for recall.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        train_size: int = None,
+        n_iter: int = 20,
+        seed: int = 0,
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size or nlist * 39
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: np.ndarray = None
+        self._pending: Dict[int, np.ndarray] = {}
+        self._lists: List[List[int]] = []
+        self._list_arrays: List[np.ndarray] = []
+        self._assignment = np.empty(0, dtype=np.int32)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray, fetch: VectorFetcher) -> None:
+        unit = _normalize_rows(vectors)
+        if self.is_trained:
+            self._assign(np.asarray(rows, dtype=np.int64), unit)
+            return
+        for row, vector in zip(np.asarray(rows).tolist(), unit):
+            self._pending[row] = vector
+        if len(self._pending) >= self.train_size:
+            self.train()
+
+    def train(self) -> None:
+        """Trains the quantizer on the buffered rows and assigns them to lists."""
+        if not self._pending:
+            return
+        rows = np.fromiter(self._pending.keys(), dtype=np.int64, count=len(self._pending))
+        data = np.stack(list(self._pending.values()))
+        self.centroids = spherical_kmeans(data, self.nlist, self.n_iter, self.seed)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._list_arrays = [None] * len(self.centroids)
+        self._pending = {}
+        self._assign(rows, data)
+
+    def remove(self, rows: np.ndarray) -> None:
+        for row in np.asarray(rows).tolist():
+            if self._pending.pop(row, None) is not None or row >= len(self._assignment):
+                continue
+            label = self._assignment[row]
+            if label >= 0:
+                self._assignment[row] = -1
+                self._list_arrays[label] = None
+
+    def reset(self) -> None:
+        """Forgets every row but keeps a trained quantizer."""
+        self._pending = {}
+        self._lists = [[] for _ in range(len(self.centroids))] if self.is_trained else []
+        self._list_arrays = [None] * len(self._lists)
+        self._assignment = np.empty(0, dtype=np.int32)
+
+    def _assign(self, rows: np.ndarray, unit: np.ndarray) -> None:
+        if len(rows) and rows.max() >= len(self._assignment):
+            grown = np.full(max(rows.max() + 1, 2 * len(self._assignment)), -1, dtype=np.int32)
+            grown[: len(self._assignment)] = self._assignment
+            self._assignment = grown
+        labels = np.argmax(unit @ self.centroids.T, axis=1)
+        self._assignment[rows] = labels
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            self._lists[label].append(row)
+            self._list_arrays[label] = None
+
+    def _list_rows(self, label: int) -> np.ndarray:
+        if self._list_arrays[label] is None:
+            rows = np.asarray(self._lists[label], dtype=np.int64)
+            # Rows overwritten or removed since they were listed are no longer in this list.
+            rows = np.unique(rows[self._assignment[rows] == label])
+            self._lists[label] = rows.tolist()
+            self._list_arrays[label] = rows
+        return self._list_arrays[label]
+
+    def search(
+        self, query: np.ndarray, k: int, fetch: VectorFetcher
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        query = _normalize_rows(query)
+        candidates = []
+        if self._pending:
+            candidates.append(np.fromiter(self._pending.keys(), dtype=np.int64))
+        if self.is_trained:
+            probe = top_k_indices(self.centroids @ query, self.nprobe)
+            candidates.extend(self._list_rows(label) for label in probe)
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(candidates)
+        scores = fetch(rows) @ query
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+
+class HNSWIndex(VectorIndex):
+    """Hierarchical navigable small-world graph over the database rows.
+
+    ``M`` bounds the links per node (``2 * M`` on the bottom layer),
+    ``ef_construction`` is the beam width used while linking new rows and
+    ``ef_search`` the beam width at query time; larger beams find more of the
+    true neighbours at the cost of more dot products.
+
+    Removed rows stay in the graph as waypoints, so connectivity is preserved,
+    but are never returned or linked to; ``reset`` and a rebuild drop them.
+    """
+
+    def __init__(
+        self,
+        M: int = 16,
+        ef_construction: int = 100,
+        ef_search: int = 50,
+        seed: int = 0,
+    ):
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._level_mult = 1 / math.log(max(M, 2))
+        self._rng = random.Random(seed)
+        self._graph: List[Dict[int, List[int]]] = []
+        self._levels: Dict[int, int] = {}
+        self._deleted = set()
+        self._entry: int = None
+
+    def __len__(self) -> int:
+        return len(self._levels) - len(self._deleted)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray, fetch: VectorFetcher) -> None:
+        for row, vector in zip(np.asarray(rows).tolist(), _normalize_rows(vectors)):
+            self._insert(row, vector, fetch)
+
+    def remove(self, rows: np.ndarray) -> None:
+        self._deleted.update(row for row in np.asarray(rows).tolist() if row in self._levels)
+
+    def reset(self) -> None:
+        self._graph = []
+        self._levels = {}
+        self._deleted = set()
+        self._entry = None
+
+    def _insert(self, row: int, vector: np.ndarray, fetch: VectorFetcher) -> None:
+        level = self._levels.get(row)
+        if level is None:
+            level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+            self._levels[row] = level
+        while len(self._graph) <= level:
+            self._graph.append({})
+
+        if self._entry is None or self._entry == row:
+            for layer in range(level + 1):
+                self._graph[layer].setdefault(row, [])
+            self._entry = row
+            return
+
+        top = self._levels[self._entry]
+        entry_points = [self._entry]
+        for layer in range(top, level, -1):
+            entry_points = [max(self._search_layer(vector, entry_points, 1, layer, fetch))[1]]
+
+        for layer in range(min(level, top), -1, -1):
+            found = [
+                (score, node)
+                for score, node in self._search_layer(
+                    vector, entry_points, self.ef_construction, layer, fetch, live_only=True
+                )
+                if node != row
+            ]
+            neighbours = self._select(
+                np.array([node for _, node in found], dtype=np.int64),
+                np.array([score for score, _ in found], dtype=np.float32),
+                self.M,
+                fetch,
+            )
+            self._graph[layer][row] = neighbours
+            max_links = 2 * self.M if layer == 0 else self.M
+            for node in neighbours:
+                links = self._graph[layer].setdefault(node, [])
+                if row not in links:
+                    links.append(row)
+                if len(links) > max_links:
+                    self._graph[layer][node] = self._prune(node, links, max_links, fetch)
+            entry_points = [node for _, node in found] or entry_points
+
+        for layer in range(top + 1, level + 1):
+            self._graph[layer].setdefault(row, [])
+        if level > top:
+            self._entry = row
+
+    def _prune(
+        self, node: int, links: List[int], max_links: int, fetch: VectorFetcher
+    ) -> List[int]:
+        candidates = np.asarray(links, dtype=np.int64)
+        scores = fetch(candidates) @ fetch(np.array([node]))[0]
+        return self._select(candidates, scores, max_links, fetch)
+
+    @staticmethod
+    def _select(
+        candidates: np.ndarray, scores: np.ndarray, limit: int, fetch: VectorFetcher
+    ) -> List[int]:
+        """Up to ``limit`` of ``candidates`` chosen by the HNSW neighbour heuristic.
+
+        Taken best first, a candidate is kept only if it is closer to the
+        node than to every candidate already kept. Plain top-``limit`` links
+        all point into the node's own cluster, and on clustered data the
+        graph falls apart into islands a search cannot leave.
+        """
+        if len(candidates) <= limit:
+            return candidates.tolist()
+        order = np.argsort(-scores, kind="stable")
+        candidates, scores = candidates[order], scores[order]
+        unit = fetch(candidates)
+        similarity = unit @ unit.T
+        kept: List[int] = []
+        for i in range(len(candidates)):
+            if not kept or similarity[i, kept].max() < scores[i]:
+                kept.append(i)
+                if len(kept) == limit:
+                    break
+        return candidates[kept].tolist()
+
+    def _search_layer(
+        self,
+        query: np.ndarray,
+        entry_points: List[int],
+        ef: int,
+        layer: int,
+        fetch: VectorFetcher,
+        live_only: bool = False,
+    ) -> List[Tuple[float, int]]:
+        """Beam search on one layer; returns up to ``ef`` ``(score, row)`` pairs.
+
+        With ``live_only`` removed rows are still traversed but not returned.
+        """
+        graph = self._graph[layer]
+        skip = self._deleted if live_only else ()
+        visited = set(entry_points)
+        entry_scores = (fetch(np.asarray(entry_points, dtype=np.int64)) @ query).tolist()
+        candidates = [(-score, node) for score, node in zip(entry_scores, entry_points)]
+        heapq.heapify(candidates)
+        results = [
+            (score, node) for score, node in zip(entry_scores, entry_points) if node not in skip
+        ]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_score, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_score < results[0][0]:
+                break
+            neighbours = [n for n in graph.get(node, ()) if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            scores = (fetch(np.asarray(neighbours, dtype=np.int64)) @ query).tolist()
+            for score, neighbour in zip(scores, neighbours):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, neighbour))
+                    if neighbour in skip:
+                        continue
+                    heapq.heappush(results, (score, neighbour))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def search(
+        self, query: np.ndarray, k: int, fetch: VectorFetcher
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if self._entry is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = _normalize_rows(query)
+        entry_points = [self._entry]
+        for layer in range(self._levels[self._entry], 0, -1):
+            entry_points = [max(self._search_layer(query, entry_points, 1, layer, fetch))[1]]
+        found = sorted(
+            self._search_layer(
+                query, entry_points, max(self.ef_search, k), 0, fetch, live_only=True
+            ),
+            reverse=True,
+        )[:k]
+        rows = np.array([node for _, node in found], dtype=np.int64)
+        scores = np.array([score for score, _ in found], dtype=np.float32)
+        return rows, scores
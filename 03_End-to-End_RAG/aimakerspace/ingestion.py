@@ -0,0 +1,303 @@
+"""Streaming ingestion: loader -> splitter -> embedder -> ``VectorDatabase``.
+
+Each stage runs as its own task and hands work to the next through a bounded
+``asyncio.Queue``, so a slow stage applies backpressure upstream instead of
+letting documents, chunks or embeddings pile up in memory. Reading, splitting,
+embedding requests and inserts all overlap, and apart from the index itself
+memory is bounded by the queue sizes.
+
+With a ``checkpoint_dir`` the database and the set of fully ingested
+documents are saved every ``checkpoint_every`` chunks and at the end, and
+``IngestionPipeline.from_checkpoint`` resumes after a crash, skipping the
+documents already done and dropping the rows of any document that was only
+partly inserted, so it is ingested again in full::
+
+    pipeline = IngestionPipeline(VectorDatabase(), checkpoint_dir="ingest")
+    await pipeline.run(TextFileLoader("data").iter_documents())
+    # after a crash:
+    pipeline = IngestionPipeline.from_checkpoint("ingest")
+    await pipeline.run(TextFileLoader("data").iter_documents())
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from aimakerspace.dedup import NearDuplicateIndex
+from aimakerspace.text_utils import CharacterTextSplitter
+from aimakerspace.token_splitter import TokenTextSplitter
+from aimakerspace.vectordatabase import VectorDatabase
+
+# A bare text, or ``(source, text)`` where ``source`` identifies the document.
+Document = Union[str, Tuple[str, str]]
+
+_DONE = object()
+_STATE_FILE = "state.json"
+_INDEX_PREFIX = "index-"
+
+
+def _identify(document: Document) -> Tuple[str, str, Optional[str]]:
+    """Returns ``(document_id, text, source)``; bare texts are identified by their hash."""
+    if isinstance(document, tuple):
+        source, text = document
+        return source, text, source
+    return hashlib.sha1(document.encode("utf-8")).hexdigest(), document, None
+
+
+class IngestionPipeline:
+    """Moves documents into ``vector_db`` through bounded, concurrent stages.
+
+    Chunks are embedded in batches of ``batch_size`` with up to
+    ``embed_workers`` batches in flight. Chunks of documents given as
+    ``(source, text)`` get ``{"source": source}`` metadata, chunks of bare
+    texts ``{"document": <sha1 of the text>}``. With a
+    ``TokenTextSplitter`` the token counts of its spans are handed to the
+    embedding model, so chunks are not tokenized twice.
+
+    With a ``deduplicator`` (a ``NearDuplicateIndex``) every chunk is checked
+    against the chunks seen before, between splitting and embedding. Only
+    canonical chunks are embedded and stored, tagged with their position in
+    their document as ``{"chunk": j}``. A near-duplicate is not dropped. It
+    is recorded in ``duplicates`` as ``(document_id, j, canonical_document_id,
+    canonical_j)``, so its provenance survives and the canonical row can be
+    found with ``find_ids({"source": canonical_document_id, "chunk":
+    canonical_j})`` (``"document"`` for bare texts). ``duplicates`` is saved
+    with every checkpoint and restored by ``from_checkpoint``, with or
+    without a ``deduplicator``.
+    """
+
+    def __init__(
+        self,
+        vector_db: VectorDatabase,
+        splitter: Union[CharacterTextSplitter, TokenTextSplitter] = None,
+        batch_size: int = 256,
+        queue_size: int = 4,
+        embed_workers: int = 2,
+        checkpoint_dir: str = None,
+        checkpoint_every: int = 10_000,
+        deduplicator: NearDuplicateIndex = None,
+    ):
+        self.vector_db = vector_db
+        self.splitter = splitter or CharacterTextSplitter()
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.embed_workers = embed_workers
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.deduplicator = deduplicator
+        self.duplicates: List[Tuple[str, int, str, int]] = []
+        # (document_id, chunk) of every deduplicator entry, in entry order.
+        self._entry_chunks: List[Tuple[str, int]] = []
+        self.completed: Set[str] = set()
+        # Document id -> chunks not inserted yet, while a run is in progress.
+        self._remaining: Dict[str, int] = {}
+        self._generation = 0
+
+    @classmethod
+    def from_checkpoint(
+        cls,
+        checkpoint_dir: str,
+        embedding_model=None,
+        index=None,
+        lexical=None,
+        **kwargs: Any,
+    ) -> "IngestionPipeline":
+        """Reopens the database and progress saved in ``checkpoint_dir``."""
+        with open(os.path.join(checkpoint_dir, _STATE_FILE), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        vector_db = VectorDatabase.load(
+            os.path.join(checkpoint_dir, f"{_INDEX_PREFIX}{state['generation']}"),
+            embedding_model=embedding_model,
+            index=index,
+            lexical=lexical,
+        )
+        pipeline = cls(vector_db, checkpoint_dir=checkpoint_dir, **kwargs)
+        pipeline.completed = set(state["completed"])
+        pipeline._generation = state["generation"]
+        partial = state.get("partial", [])
+        if partial:
+            vector_db.delete_where(
+                {"$or": [{"source": {"$in": partial}}, {"document": {"$in": partial}}]}
+            )
+        # Duplicates of a partly inserted document are recorded again when it is re-ingested.
+        pipeline.duplicates = [
+            tuple(entry) for entry in state.get("duplicates", []) if entry[0] not in partial
+        ]
+        if pipeline.deduplicator is not None:
+            pipeline._restore_entries()
+        return pipeline
+
+    def _restore_entries(self) -> None:
+        """Rebuilds the deduplicator from the stored canonical chunks, in row order."""
+        ids = self.vector_db.find_ids({"chunk": {"$gte": 0}})
+        _, new = self.deduplicator.assign(self.vector_db.get_texts(ids))
+        for row in ids[new].tolist():
+            metadata = self.vector_db.metadata.get(row)
+            self._entry_chunks.append((metadata.get("source", metadata.get("document")), int(metadata["chunk"])))
+
+    def checkpoint(self) -> None:
+        """Saves the database to a new generation directory, then points the state file at it.
+
+        The previous generation is only removed once the new state is in place,
+        so a crash at any point leaves one complete, consistent checkpoint.
+        """
+        self._write_checkpoint(sorted(self.completed), sorted(self._remaining), list(self.duplicates))
+
+    def _write_checkpoint(
+        self, completed: List[str], partial: List[str], duplicates: List[Tuple[str, int, str, int]]
+    ) -> None:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        generation = self._generation + 1
+        self.vector_db.save(os.path.join(self.checkpoint_dir, f"{_INDEX_PREFIX}{generation}"))
+        state_path = os.path.join(self.checkpoint_dir, _STATE_FILE)
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "generation": generation,
+                    "completed": completed,
+                    "partial": partial,
+                    "duplicates": duplicates,
+                },
+                f,
+            )
+        os.replace(state_path + ".tmp", state_path)
+        self._generation = generation
+        for name in os.listdir(self.checkpoint_dir):
+            if name.startswith(_INDEX_PREFIX) and name != f"{_INDEX_PREFIX}{generation}":
+                shutil.rmtree(os.path.join(self.checkpoint_dir, name), ignore_errors=True)
+
+    def _record_duplicates(self, document_id: str, entries: np.ndarray, new: np.ndarray) -> List[int]:
+        """Records the chunks of ``document_id`` that are near-duplicates; returns the positions of the rest."""
+        for j, (entry, is_new) in enumerate(zip(entries.tolist(), new.tolist())):
+            if is_new:
+                self._entry_chunks.append((document_id, j))
+            else:
+                self.duplicates.append((document_id, j, *self._entry_chunks[entry]))
+        return np.flatnonzero(new).tolist()
+
+    def _split(self, text: str) -> Tuple[List[str], List[Optional[int]]]:
+        if isinstance(self.splitter, TokenTextSplitter):
+            spans = self.splitter.split_spans([text])
+            return [span.text([text]) for span in spans], [span.token_count for span in spans]
+        chunks = self.splitter.split(text)
+        return chunks, [None] * len(chunks)
+
+    async def run(
+        self, documents: Union[Iterable[Document], AsyncIterable[Document]]
+    ) -> Dict[str, float]:
+        """Ingests ``documents`` and returns counts and timings.
+
+        A synchronous iterable is advanced in a worker thread, so file reads
+        overlap with the other stages.
+        """
+        started = time.perf_counter()
+        stats = {"documents": 0, "skipped": 0, "chunks": 0, "duplicates": 0}
+        document_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        batch_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        insert_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        remaining = self._remaining = {}
+
+        async def read() -> None:
+            if hasattr(documents, "__aiter__"):
+                async for document in documents:
+                    await document_queue.put(document)
+            else:
+                iterator = iter(documents)
+                while (document := await asyncio.to_thread(next, iterator, _DONE)) is not _DONE:
+                    await document_queue.put(document)
+            await document_queue.put(_DONE)
+
+        async def split() -> None:
+            texts: List[str] = []
+            metadata: List[Dict[str, Any]] = []
+            owners: List[str] = []
+            counts: List[Optional[int]] = []
+            while (document := await document_queue.get()) is not _DONE:
+                document_id, text, source = _identify(document)
+                if document_id in self.completed:
+                    stats["skipped"] += 1
+                    continue
+                chunks, token_counts = await asyncio.to_thread(self._split, text)
+                stats["documents"] += 1
+                positions = range(len(chunks))
+                if self.deduplicator is not None and chunks:
+                    entries, new = await asyncio.to_thread(self.deduplicator.assign, chunks)
+                    positions = self._record_duplicates(document_id, entries, new)
+                    stats["duplicates"] += len(chunks) - len(positions)
+                if not positions:
+                    self.completed.add(document_id)
+                    continue
+                remaining[document_id] = remaining.get(document_id, 0) + len(positions)
+                for j in positions:
+                    texts.append(chunks[j])
+                    entry = {"document": document_id} if source is None else {"source": source}
+                    if self.deduplicator is not None:
+                        entry["chunk"] = j
+                    metadata.append(entry)
+                    owners.append(document_id)
+                    counts.append(token_counts[j])
+                    if len(texts) >= self.batch_size:
+                        await batch_queue.put((texts, metadata, owners, counts))
+                        texts, metadata, owners, counts = [], [], [], []
+            if texts:
+                await batch_queue.put((texts, metadata, owners, counts))
+            for _ in range(self.embed_workers):
+                await batch_queue.put(_DONE)
+
+        async def embed() -> None:
+            embedding_model = self.vector_db.embedding_model
+            while (batch := await batch_queue.get()) is not _DONE:
+                texts, metadata, owners, counts = batch
+                if None in counts:
+                    embeddings = await embedding_model.async_get_embeddings(texts)
+                else:
+                    embeddings = await embedding_model.async_get_embeddings(texts, token_counts=counts)
+                await insert_queue.put((texts, embeddings, metadata, owners))
+            await insert_queue.put(_DONE)
+
+        async def insert() -> None:
+            workers_left, since_checkpoint = self.embed_workers, 0
+            while workers_left:
+                item = await insert_queue.get()
+                if item is _DONE:
+                    workers_left -= 1
+                    continue
+                texts, embeddings, metadata, owners = item
+                self.vector_db.append(texts, np.asarray(embeddings, dtype=np.float32), metadata)
+                for owner in owners:
+                    remaining[owner] -= 1
+                    if not remaining[owner]:
+                        del remaining[owner]
+                        self.completed.add(owner)
+                stats["chunks"] += len(texts)
+                since_checkpoint += len(texts)
+                if self.checkpoint_dir and since_checkpoint >= self.checkpoint_every:
+                    # Upstream stages keep running while the snapshot is written.
+                    await asyncio.to_thread(
+                        self._write_checkpoint, sorted(self.completed), sorted(remaining), list(self.duplicates)
+                    )
+                    since_checkpoint = 0
+            if self.checkpoint_dir:
+                await asyncio.to_thread(
+                    self._write_checkpoint, sorted(self.completed), sorted(remaining), list(self.duplicates)
+                )
+
+        tasks = [
+            asyncio.ensure_future(stage)
+            for stage in (read(), split(), *(embed() for _ in range(self.embed_workers)), insert())
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        stats["seconds"] = time.perf_counter() - started
+        return stats
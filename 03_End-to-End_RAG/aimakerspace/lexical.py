@@ -0,0 +1,175 @@
+"""BM25 inverted index and score fusion for hybrid lexical + vector retrieval."""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Unicode letters and digits, so accented and non-Latin words are terms too.
+# Keeps hyphenated and dotted identifiers such as form numbers ("I-9", "W-2",
+# "1040-ES") and decimal amounts together as single terms.
+_TOKEN_PATTERN = re.compile(r"[^\W_]+(?:[-.'][^\W_]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    # NFKC composes accents written as combining marks, which are not word characters.
+    return _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+class BM25Index:
+    """Okapi BM25 over database rows, scored with NumPy over compiled postings.
+
+    Postings are appended as flat ``(term, row, generation, tf)`` arrays as
+    rows are added, and compiled into CSR arrays (``indptr`` / ``doc_ids`` /
+    ``term_freqs``) on the next query, so a query costs one vectorised pass
+    over the posting list of each query term. A row that is re-added or
+    removed bumps its generation, and its old postings are dropped at compile
+    time.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self._pending: List[Tuple[np.ndarray, ...]] = []
+        self._generation = np.zeros(0, dtype=np.int64)
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._indexed = np.zeros(0, dtype=bool)
+        self._compiled = None
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._indexed))
+
+    def _reserve(self, size: int) -> None:
+        if size <= len(self._indexed):
+            return
+        capacity = max(size, 2 * len(self._indexed), 16)
+        for name in ("_generation", "_doc_len", "_indexed"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, rows: Sequence[int], texts: Sequence[str]) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._reserve(int(rows.max()) + 1)
+        term_ids, posting_rows, term_freqs = [], [], []
+        for row, text in zip(rows.tolist(), texts):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    term_id = self.vocabulary[term] = len(self.vocabulary)
+                term_ids.append(term_id)
+                posting_rows.append(row)
+                term_freqs.append(tf)
+            self._doc_len[row] = sum(counts.values())
+        self._generation[rows] += 1
+        self._indexed[rows] = True
+        posting_rows = np.asarray(posting_rows, dtype=np.int64)
+        self._pending.append((
+            np.asarray(term_ids, dtype=np.int64),
+            posting_rows,
+            self._generation[posting_rows],
+            np.asarray(term_freqs, dtype=np.float32),
+        ))
+        self._compiled = None
+
+    def reset(self) -> None:
+        """Forgets every row and term, e.g. before a compacted database re-adds its rows."""
+        self.__init__(self.k1, self.b)
+
+    def remove(self, rows: Sequence[int]) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self._indexed)]
+        self._indexed[rows] = False
+        self._doc_len[rows] = 0
+        self._generation[rows] += 1
+        self._compiled = None
+
+    def _compile(self):
+        if self._compiled is not None:
+            return self._compiled
+        if self._pending:
+            term_ids, rows, generations, term_freqs = (
+                np.concatenate(parts) for parts in zip(*self._pending)
+            )
+        else:
+            term_ids = rows = generations = np.zeros(0, dtype=np.int64)
+            term_freqs = np.zeros(0, dtype=np.float32)
+        current = self._generation[rows] == generations
+        term_ids, rows, generations, term_freqs = (
+            term_ids[current], rows[current], generations[current], term_freqs[current]
+        )
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, rows, generations, term_freqs = (
+            term_ids[order], rows[order], generations[order], term_freqs[order]
+        )
+        # Keep only the live postings, so stale ones are not re-filtered next time.
+        self._pending = [(term_ids, rows, generations, term_freqs)]
+        indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocabulary)), out=indptr[1:])
+        live_docs = len(self)
+        avg_len = float(self._doc_len.sum()) / live_docs if live_docs else 0.0
+        self._compiled = (indptr, rows, term_freqs, live_docs, avg_len)
+        return self._compiled
+
+    def scores(self, query: str, n: int) -> np.ndarray:
+        """BM25 score of every one of the first ``n`` rows against ``query``."""
+        indptr, doc_ids, term_freqs, live_docs, avg_len = self._compile()
+        scores = np.zeros(n, dtype=np.float32)
+        if not live_docs:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len / max(avg_len, 1e-9))
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = indptr[term_id], indptr[term_id + 1]
+            if start == stop:
+                continue
+            docs, tf = doc_ids[start:stop], term_freqs[start:stop]
+            df = stop - start
+            idf = math.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+            # Each row appears at most once per posting list, so plain fancy-index add is safe.
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        return scores
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[np.ndarray], k: int = 60
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuses ranked row lists with RRF: ``score(row) = sum 1 / (k + rank)``."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(np.asarray(ranking).tolist(), start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return _sorted_items(fused)
+
+
+def weighted_fusion(
+    results: Sequence[Tuple[np.ndarray, np.ndarray]], weights: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuses ``(rows, scores)`` lists by a weighted sum of min-max normalised scores."""
+    fused: Dict[int, float] = {}
+    for (rows, scores), weight in zip(results, weights):
+        scores = np.asarray(scores, dtype=np.float32)
+        if not len(scores):
+            continue
+        low, span = scores.min(), scores.max() - scores.min()
+        normalised = (scores - low) / span if span > 0 else np.ones_like(scores)
+        for row, score in zip(np.asarray(rows).tolist(), normalised.tolist()):
+            fused[row] = fused.get(row, 0.0) + weight * score
+    return _sorted_items(fused)
+
+
+def _sorted_items(fused: Dict[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+    rows = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
@@ -0,0 +1,333 @@
+"""Columnar metadata for ``VectorDatabase`` rows and the filters evaluated over it.
+
+Filters are dictionaries in the familiar Mongo-style syntax::
+
+    {"source": "The_Direct_Loan_Program.pdf"}               # equality
+    {"source": {"$in": ["a.pdf", "b.pdf"]}}                 # set membership
+    {"page": {"$gte": 3, "$lt": 10}}                        # range
+    {"$or": [{"tenant": "acme"}, {"public": True}]}         # boolean combinations
+
+Top-level fields are AND-ed. Supported operators are ``$eq``, ``$ne``, ``$in``,
+``$nin``, ``$gt``, ``$gte``, ``$lt``, ``$lte``, ``$and`` and ``$or``. A row
+without the field never matches a positive condition and always matches
+``$ne`` / ``$nin``.
+"""
+
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def _grow(array: np.ndarray, size: int, fill) -> np.ndarray:
+    grown = np.full(max(size, 2 * len(array), 16), fill, dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class _CategoricalColumn:
+    """Dictionary-encoded column with cached per-value bitmaps.
+
+    Holds strings and booleans only, so values survive the JSON value
+    dictionary written by ``state`` unchanged.
+    """
+
+    kind = "categorical"
+    expected = "string or boolean"
+
+    def __init__(self, values: List[Any] = None, codes: np.ndarray = None):
+        self.values: List[Any] = values or []
+        self.ids = {value: i for i, value in enumerate(self.values)}
+        self.codes = codes if codes is not None else np.full(0, -1, dtype=np.int32)
+        self._bitmaps: Dict[int, np.ndarray] = {}
+
+    def accepts(self, value: Any) -> bool:
+        return isinstance(value, (str, bool))
+
+    def set(self, rows: np.ndarray, values: List[Any]) -> None:
+        if len(rows) and rows.max() >= len(self.codes):
+            self.codes = _grow(self.codes, rows.max() + 1, -1)
+        for row, value in zip(rows.tolist(), values):
+            code = self.ids.get(value)
+            if code is None:
+                code = self.ids[value] = len(self.values)
+                self.values.append(value)
+            self.codes[row] = code
+        self._bitmaps.clear()
+
+    def clear(self, rows: np.ndarray) -> None:
+        rows = rows[rows < len(self.codes)]
+        self.codes[rows] = -1
+        self._bitmaps.clear()
+
+    def get(self, row: int) -> Tuple[bool, Any]:
+        if row >= len(self.codes) or self.codes[row] < 0:
+            return False, None
+        return True, self.values[self.codes[row]]
+
+    def _codes(self, n: int) -> np.ndarray:
+        if len(self.codes) < n:
+            self.codes = _grow(self.codes, n, -1)
+        return self.codes[:n]
+
+    def equal(self, value: Any, n: int) -> np.ndarray:
+        code = self.ids.get(value)
+        if code is None:
+            return np.zeros(n, dtype=bool)
+        bitmap = self._bitmaps.get(code)
+        if bitmap is None or len(bitmap) != n:
+            bitmap = self._bitmaps[code] = self._codes(n) == code
+        return bitmap
+
+    def isin(self, values: Iterable[Any], n: int) -> np.ndarray:
+        codes = [self.ids[value] for value in values if value in self.ids]
+        return np.isin(self._codes(n), codes)
+
+    def between(self, low, low_inclusive, high, high_inclusive, n: int) -> np.ndarray:
+        # Ranges over strings (e.g. ISO dates) are resolved on the value dictionary.
+        matching = [
+            value
+            for value in self.values
+            if (low is None or value > low or (low_inclusive and value == low))
+            and (high is None or value < high or (high_inclusive and value == high))
+        ]
+        return self.isin(matching, n)
+
+    def take(self, rows: np.ndarray, n: int) -> None:
+        self.codes = self._codes(n)[rows]
+        self._bitmaps.clear()
+
+    def state(self, rows, n: int) -> Tuple[Dict, np.ndarray]:
+        return {"kind": self.kind, "values": self.values}, self._codes(n)[rows]
+
+
+class _NumericColumn:
+    """Float column with a lazily rebuilt sort order for range lookups.
+
+    Dates and datetimes are stored as POSIX timestamps and converted back
+    on ``get``: a ``"date"`` column returns dates, a ``"datetime"`` column
+    naive local datetimes.
+    """
+
+    def __init__(self, kind: str = "number", values: np.ndarray = None):
+        self.kind = kind
+        self.expected = {"number": "numeric", "date": "date", "datetime": "datetime"}[kind]
+        self.values = values if values is not None else np.full(0, np.nan)
+        self._order: np.ndarray = None
+        self._sorted: np.ndarray = None
+
+    def accepts(self, value: Any) -> bool:
+        if self.kind == "datetime":
+            return isinstance(value, date)
+        if self.kind == "date":
+            return isinstance(value, date) and not isinstance(value, datetime)
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    @staticmethod
+    def to_number(value: Any) -> float:
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, date):
+            return datetime.combine(value, time()).timestamp()
+        return float(value)
+
+    def set(self, rows: np.ndarray, values: List[Any]) -> None:
+        if len(rows) and rows.max() >= len(self.values):
+            self.values = _grow(self.values, rows.max() + 1, np.nan)
+        self.values[rows] = [self.to_number(value) for value in values]
+        self._order = None
+
+    def clear(self, rows: np.ndarray) -> None:
+        self.values[rows[rows < len(self.values)]] = np.nan
+        self._order = None
+
+    def get(self, row: int) -> Tuple[bool, Any]:
+        if row >= len(self.values) or np.isnan(self.values[row]):
+            return False, None
+        value = float(self.values[row])
+        if self.kind == "datetime":
+            return True, datetime.fromtimestamp(value)
+        if self.kind == "date":
+            return True, datetime.fromtimestamp(value).date()
+        return True, int(value) if value.is_integer() else value
+
+    def _values(self, n: int) -> np.ndarray:
+        if len(self.values) < n:
+            self.values = _grow(self.values, n, np.nan)
+            self._order = None
+        return self.values[:n]
+
+    def between(self, low, low_inclusive, high, high_inclusive, n: int) -> np.ndarray:
+        values = self._values(n)
+        if self._order is None or len(self._order) != n:
+            self._order = np.argsort(values, kind="stable")  # NaNs sort last
+            self._sorted = values[self._order]
+        start, stop = 0, int(np.count_nonzero(~np.isnan(values)))
+        if low is not None:
+            side = "left" if low_inclusive else "right"
+            start = int(np.searchsorted(self._sorted[:stop], self.to_number(low), side))
+        if high is not None:
+            side = "right" if high_inclusive else "left"
+            stop = int(np.searchsorted(self._sorted[:stop], self.to_number(high), side))
+        mask = np.zeros(n, dtype=bool)
+        mask[self._order[start:max(start, stop)]] = True
+        return mask
+
+    def equal(self, value: Any, n: int) -> np.ndarray:
+        return self.between(value, True, value, True, n)
+
+    def isin(self, values: Iterable[Any], n: int) -> np.ndarray:
+        return np.isin(self._values(n), [self.to_number(value) for value in values])
+
+    def take(self, rows: np.ndarray, n: int) -> None:
+        self.values = self._values(n)[rows]
+        self._order = None
+
+    def state(self, rows, n: int) -> Tuple[Dict, np.ndarray]:
+        return {"kind": self.kind}, self._values(n)[rows]
+
+
+def _new_column(value: Any):
+    if isinstance(value, datetime):
+        return _NumericColumn("datetime")
+    if isinstance(value, date):
+        return _NumericColumn("date")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _NumericColumn("number")
+    return _CategoricalColumn()
+
+
+class MetadataStore:
+    """Per-row metadata held column by column.
+
+    Column types are inferred from the first value written: numbers, dates and
+    datetimes become sorted numeric columns; strings and booleans become a
+    dictionary-encoded column with equality bitmaps. Any other value (a list,
+    tuple, dict or object) raises ``TypeError``, as does a value that does not
+    fit its column's type.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, Any] = {}
+
+    def set(self, rows: np.ndarray, metadatas: List[Optional[Dict[str, Any]]]) -> None:
+        """Replaces the metadata of ``rows``; ``None`` entries are left untouched."""
+        rows = np.asarray(rows, dtype=np.int64)
+        given = [i for i, metadata in enumerate(metadatas) if metadata is not None]
+        if not given:
+            return
+        self.validate(metadatas)
+        replaced = rows[given]
+        for column in self.columns.values():
+            column.clear(replaced)
+
+        for field, (field_rows, values) in self._by_field(rows, metadatas).items():
+            column = self.columns.get(field)
+            if column is None:
+                column = self.columns[field] = _new_column(values[0])
+            column.set(np.asarray(field_rows, dtype=np.int64), values)
+
+    def validate(self, metadatas: List[Optional[Dict[str, Any]]]) -> None:
+        """Raises ``TypeError`` if a value does not fit its column's type."""
+        by_field = self._by_field(np.zeros(len(metadatas), dtype=np.int64), metadatas)
+        for field, (_, values) in by_field.items():
+            column = self.columns.get(field) or _new_column(values[0])
+            bad = next((value for value in values if not column.accepts(value)), None)
+            if bad is not None:
+                raise TypeError(
+                    f"Metadata field '{field}' takes {column.expected} values, got {bad!r}"
+                )
+
+    @staticmethod
+    def _by_field(
+        rows: np.ndarray, metadatas: List[Optional[Dict[str, Any]]]
+    ) -> Dict[str, Tuple[List[int], List[Any]]]:
+        by_field: Dict[str, Tuple[List[int], List[Any]]] = {}
+        for row, metadata in zip(rows.tolist(), metadatas):
+            for field, value in (metadata or {}).items():
+                if value is None:
+                    continue
+                field_rows, values = by_field.setdefault(field, ([], []))
+                field_rows.append(row)
+                values.append(value)
+        return by_field
+
+    def get(self, row: int) -> Dict[str, Any]:
+        metadata = {}
+        for field, column in self.columns.items():
+            present, value = column.get(row)
+            if present:
+                metadata[field] = value
+        return metadata
+
+    def take(self, rows: np.ndarray, n: int) -> None:
+        """Keeps only ``rows`` out of the first ``n``, renumbered in order, as during compaction."""
+        for column in self.columns.values():
+            column.take(rows, n)
+
+    def mask(self, filter: Dict[str, Any], n: int) -> np.ndarray:
+        """Evaluates ``filter`` over the first ``n`` rows into a boolean mask."""
+        result = np.ones(n, dtype=bool)
+        for field, condition in filter.items():
+            if field == "$and":
+                for clause in condition:
+                    result &= self.mask(clause, n)
+            elif field == "$or":
+                matched = np.zeros(n, dtype=bool)
+                for clause in condition:
+                    matched |= self.mask(clause, n)
+                result &= matched
+            else:
+                result &= self._field_mask(field, condition, n)
+        return result
+
+    def _field_mask(self, field: str, condition: Any, n: int) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        column = self.columns.get(field)
+        mask = np.ones(n, dtype=bool)
+        bounds = {op: value for op, value in condition.items() if op in _RANGE_OPERATORS}
+        for op, value in condition.items():
+            if op in _RANGE_OPERATORS:
+                continue
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Unsupported filter operator '{op}' on field '{field}'")
+            if column is None:
+                matched = np.zeros(n, dtype=bool)
+            elif op in ("$eq", "$ne"):
+                matched = column.equal(value, n)
+            else:
+                matched = column.isin(value, n)
+            mask &= ~matched if op in ("$ne", "$nin") else matched
+        if bounds:
+            if column is None:
+                return np.zeros(n, dtype=bool)
+            low = bounds.get("$gte", bounds.get("$gt"))
+            high = bounds.get("$lte", bounds.get("$lt"))
+            mask &= column.between(low, "$gte" in bounds, high, "$lte" in bounds, n)
+        return mask
+
+    def state(self, rows, n: int) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+        """Describes ``rows`` out of the first ``n`` as JSON-serialisable column info plus arrays."""
+        description, arrays = [], {}
+        for i, (field, column) in enumerate(self.columns.items()):
+            info, array = column.state(rows, n)
+            description.append({"name": field, **info})
+            arrays[f"column_{i}"] = array
+        return description, arrays
+
+    @classmethod
+    def from_state(
+        cls, description: List[Dict], arrays: Dict[str, np.ndarray]
+    ) -> "MetadataStore":
+        store = cls()
+        for i, info in enumerate(description):
+            array = arrays[f"column_{i}"]
+            if info["kind"] == "categorical":
+                column = _CategoricalColumn(list(info["values"]), array.astype(np.int32))
+            else:
+                column = _NumericColumn(info["kind"], array.astype(np.float64))
+            store.columns[info["name"]] = column
+        return store
@@ -1,13 +1,29 @@
-from openai import OpenAI, AsyncOpenAI
-from dotenv import load_dotenv
 import os
+import re
+from typing import TYPE_CHECKING
 
-load_dotenv()
+from aimakerspace.openai_utils.clients import get_async_client, get_client, load_environment
+
+if TYPE_CHECKING:
+    from aimakerspace.openai_utils.response_cache import ResponseCache
+
+# Word-sized pieces a cached response is replayed in by ``astream``.
+_REPLAY_PIECE = re.compile(r"\s*\S+\s*|\s+")
 
 
 class ChatOpenAI:
-    def __init__(self, model_name: str = "gpt-4o-mini"):
+    """Chat completions client.
+
+    With a ``cache`` (see ``aimakerspace.openai_utils.response_cache``)
+    ``run`` and ``astream`` answer repeated requests from it without calling
+    the API; ``astream`` replays a cached response word by word. Only text
+    responses are cached, and a stream only once it has been read to the end.
+    """
+
+    def __init__(self, model_name: str = "gpt-4o-mini", cache: "ResponseCache" = None):
         self.model_name = model_name
+        self.cache = cache
+        load_environment()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         if self.openai_api_key is None:
             raise ValueError("OPENAI_API_KEY is not set")
@@ -16,21 +32,36 @@ class ChatOpenAI:
         if not isinstance(messages, list):
             raise ValueError("messages must be a list")
 
-        client = OpenAI()
+        if self.cache is not None and text_only:
+            cached = self.cache.get(self.model_name, messages, kwargs)
+            if cached is not None:
+                return cached
+
+        client = get_client()
         response = client.chat.completions.create(
             model=self.model_name, messages=messages, **kwargs
         )
 
         if text_only:
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if self.cache is not None and content is not None:
+                self.cache.put(self.model_name, messages, kwargs, content)
+            return content
 
         return response
     
     async def astream(self, messages, **kwargs):
         if not isinstance(messages, list):
             raise ValueError("messages must be a list")
-        
-        client = AsyncOpenAI()
+
+        if self.cache is not None:
+            cached = await self.cache.aget(self.model_name, messages, kwargs)
+            if cached is not None:
+                for piece in _REPLAY_PIECE.findall(cached):
+                    yield piece
+                return
+
+        client = get_async_client()
 
         stream = await client.chat.completions.create(
             model=self.model_name,
@@ -39,7 +70,11 @@ class ChatOpenAI:
             **kwargs
         )
 
+        pieces = []
         async for chunk in stream:
             content = chunk.choices[0].delta.content
             if content is not None:
+                pieces.append(content)
                 yield content
+        if self.cache is not None:
+            await self.cache.aput(self.model_name, messages, kwargs, "".join(pieces))
@@ -0,0 +1,145 @@
+"""Process-wide OpenAI clients with pooled, keep-alive HTTP connections.
+
+``ChatOpenAI`` and ``EmbeddingModel`` take their clients from here instead of
+building their own, so every call reuses warm connections rather than paying
+a new TCP + TLS handshake.
+
+The synchronous client is shared by all threads. An async client's
+connections belong to the event loop that opened them, so async clients are
+kept per running loop and dropped along with it. Clients are also keyed by
+the ``OPENAI_API_KEY`` / ``OPENAI_BASE_URL`` in effect, so changing either
+gets a fresh client.
+
+Callers that retry on their own (``EmbeddingModel`` wraps every request in
+``retry`` / ``aretry``) ask for ``max_retries=0``. They get a copy of the
+shared client that uses the same connection pool but does not retry inside
+the SDK, so one failing request is not sent ``(1 + sdk) * (1 + ours)``
+times and the caller's backoff alone controls the timing.
+
+``openai``, ``httpx`` and ``dotenv`` are only imported when the first client
+is requested, which keeps importing ``aimakerspace`` cheap.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 60.0
+    max_retries: int = 2
+
+    def limits(self) -> "httpx.Limits":
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+_lock = threading.Lock()
+_config = PoolConfig()
+_env_loaded = False
+_clients: Dict[Tuple, "OpenAI"] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def load_environment() -> None:
+    """Loads ``.env`` into the environment once per process, on first use rather than at import."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+def _credentials() -> Tuple[Optional[str], Optional[str]]:
+    load_environment()
+    return os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_BASE_URL")
+
+
+def configure_clients(**settings) -> PoolConfig:
+    """Updates the pool settings (see ``PoolConfig``); clients created afterwards use them.
+
+    Existing synchronous clients are closed. Async clients are released and
+    closed by their event loops.
+    """
+    global _config
+    with _lock:
+        _config = replace(_config, **settings)
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _async_clients.clear()
+        return _config
+
+
+def get_client(max_retries: Optional[int] = None) -> "OpenAI":
+    """The shared synchronous client for the current credentials.
+
+    ``max_retries`` overrides ``PoolConfig.max_retries`` on a copy that
+    shares the pool.
+    """
+    from openai import DefaultHttpxClient, OpenAI
+
+    key = _credentials()
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OpenAI(
+                api_key=key[0],
+                base_url=key[1],
+                timeout=_config.timeout,
+                max_retries=_config.max_retries,
+                http_client=DefaultHttpxClient(limits=_config.limits(), timeout=_config.timeout),
+            )
+        return _with_retries(_clients, key, client, max_retries)
+
+
+def get_async_client(max_retries: Optional[int] = None) -> "AsyncOpenAI":
+    """The shared async client for the running event loop and current credentials."""
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    loop = asyncio.get_running_loop()
+    key = _credentials()
+    with _lock:
+        for stale in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[stale]
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = AsyncOpenAI(
+                api_key=key[0],
+                base_url=key[1],
+                timeout=_config.timeout,
+                max_retries=_config.max_retries,
+                http_client=DefaultAsyncHttpxClient(limits=_config.limits(), timeout=_config.timeout),
+            )
+        return _with_retries(clients, key, client, max_retries)
+
+
+def _with_retries(clients: Dict[Tuple, Any], key: Tuple, client: Any, max_retries: Optional[int]) -> Any:
+    """``client``, or its cached copy with ``max_retries`` SDK retries; called under ``_lock``."""
+    if max_retries is None or max_retries == client.max_retries:
+        return client
+    variant_key = (*key, max_retries)
+    variant = clients.get(variant_key)
+    if variant is None:
+        variant = clients[variant_key] = client.with_options(max_retries=max_retries)
+    return variant
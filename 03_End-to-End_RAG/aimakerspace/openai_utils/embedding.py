@@ -1,52 +1,299 @@
-from dotenv import load_dotenv
-from openai import AsyncOpenAI, OpenAI
-import openai
-from typing import List
+from typing import TYPE_CHECKING, Callable, Dict, List, Sequence, Union
+import numpy as np
+import base64
 import os
 import asyncio
 
+from aimakerspace.openai_utils.batching import aretry, count_tokens, retry, token_batches
+from aimakerspace.openai_utils.clients import get_async_client, get_client, load_environment
+from aimakerspace.openai_utils.embedding_cache import SQLiteEmbeddingCache
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+# Called as progress(texts_done, texts_total) after each request completes.
+ProgressCallback = Callable[[int, int], None]
+
+# A list of floats, or a float32 row when the model returns matrices.
+Embedding = Union[List[float], np.ndarray]
+
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "text-embedding-3-small"):
-        load_dotenv()
+    """OpenAI embeddings client.
+
+    Texts are de-duplicated within each batch before any request is made. With
+    a ``cache`` (e.g. ``SQLiteEmbeddingCache("embeddings.db")``) only texts
+    never embedded by this model before are sent to the API, and concurrent
+    ``async_get_embeddings`` calls asking for the same text share one request.
+    Requests go through the pooled clients of ``aimakerspace.openai_utils.clients``.
+
+    Texts that do need the API are packed into requests of at most
+    ``max_batch_tokens`` tokens and ``max_batch_size`` inputs. At most
+    ``max_concurrency`` requests are in flight at once, and rate-limit,
+    timeout, connection and 5xx errors are retried up to ``max_retries``
+    times with jittered exponential backoff. Results are always returned in
+    input order.
+
+    With ``encoding_format="base64"`` the API returns raw little-endian
+    float32 bytes instead of JSON numbers. They are decoded with
+    ``np.frombuffer`` straight into one preallocated ``(n, dim)`` float32
+    matrix, which ``get_embeddings`` / ``async_get_embeddings`` return
+    (``get_embedding`` returns a float32 row), so no Python float objects
+    are created.
+
+    ``dimensions`` asks ``text-embedding-3-*`` models for shorter vectors
+    (e.g. 256 or 512 instead of 1536), which shrinks storage and scan cost
+    at a small loss of recall. Cached embeddings are kept per dimension.
+    """
+
+    def __init__(
+        self,
+        embeddings_model_name: str = "text-embedding-3-small",
+        cache: SQLiteEmbeddingCache = None,
+        max_batch_tokens: int = 200_000,
+        max_batch_size: int = 2048,
+        max_concurrency: int = 8,
+        max_retries: int = 6,
+        encoding_format: str = "float",
+        dimensions: int = None,
+    ):
+        if encoding_format not in ("float", "base64"):
+            raise ValueError(f"encoding_format must be 'float' or 'base64', got '{encoding_format}'")
+        if dimensions is not None and dimensions < 1:
+            raise ValueError(f"dimensions must be positive, got {dimensions}")
+        load_environment()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.async_client = AsyncOpenAI()
-        self.client = OpenAI()
+        self._client: "OpenAI" = None
+        self._async_client: "AsyncOpenAI" = None
 
         if self.openai_api_key is None:
             raise ValueError(
                 "OPENAI_API_KEY environment variable is not set. Please set it to your OpenAI API key."
             )
-        openai.api_key = self.openai_api_key
         self.embeddings_model_name = embeddings_model_name
+        self.cache = cache
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.encoding_format = encoding_format
+        self.dimensions = dimensions
+        self._in_flight: Dict[str, asyncio.Future] = {}
 
-    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        embedding_response = await self.async_client.embeddings.create(
-            input=list_of_text, model=self.embeddings_model_name
-        )
+    @property
+    def client(self) -> "OpenAI":
+        """The process-wide pooled client, unless one was assigned to this model.
 
-        return [embeddings.embedding for embeddings in embedding_response.data]
+        The shared client is taken with SDK retries off, since every request
+        already goes through ``retry`` / ``aretry``.
+        """
+        return self._client or get_client(max_retries=0)
 
-    async def async_get_embedding(self, text: str) -> List[float]:
-        embedding = await self.async_client.embeddings.create(
-            input=text, model=self.embeddings_model_name
-        )
+    @client.setter
+    def client(self, client: "OpenAI") -> None:
+        self._client = client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """The pooled async client of the running event loop, unless one was assigned."""
+        return self._async_client or get_async_client(max_retries=0)
+
+    @async_client.setter
+    def async_client(self, client: "AsyncOpenAI") -> None:
+        self._async_client = client
+
+    @property
+    def returns_matrix(self) -> bool:
+        return self.encoding_format == "base64"
+
+    @property
+    def _cache_model(self) -> str:
+        # Shortened embeddings differ from full ones, so they get their own cache keys.
+        if self.dimensions is None:
+            return self.embeddings_model_name
+        return f"{self.embeddings_model_name}@{self.dimensions}"
+
+    def _lookup(self, texts: List[str]) -> Dict[str, Embedding]:
+        if self.cache is None:
+            return {}
+        found = self.cache.get_many(self._cache_model, texts)
+        if self.returns_matrix:
+            return found
+        return {text: vector.tolist() for text, vector in found.items()}
+
+    def _store(self, texts: List[str], embeddings: List[Embedding]) -> None:
+        if self.cache is not None and texts:
+            self.cache.put_many(self._cache_model, texts, embeddings)
 
-        return embedding.data[0].embedding
+    def _batches(self, list_of_text: List[str], known_counts: Dict[str, int] = None) -> List[List[str]]:
+        known_counts = known_counts or {}
+        unknown = [text for text in list_of_text if text not in known_counts]
+        counted = dict(zip(unknown, count_tokens(unknown, self.embeddings_model_name)))
+        token_counts = [known_counts[text] if text in known_counts else counted[text] for text in list_of_text]
+        return [
+            list_of_text[batch.start:batch.stop]
+            for batch in token_batches(token_counts, self.max_batch_tokens, self.max_batch_size)
+        ]
 
-    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        embedding_response = self.client.embeddings.create(
-            input=list_of_text, model=self.embeddings_model_name
+    def _create_kwargs(self, input) -> Dict:
+        kwargs = {"input": input, "model": self.embeddings_model_name}
+        if self.returns_matrix:
+            kwargs["encoding_format"] = "base64"
+        if self.dimensions is not None:
+            kwargs["dimensions"] = self.dimensions
+        return kwargs
+
+    def _unpack(self, embedding_response) -> List[Embedding]:
+        data = sorted(embedding_response.data, key=lambda embedding: embedding.index)
+        if self.returns_matrix:
+            # Read-only float32 views over the decoded bytes; no copy until assembly.
+            return [
+                np.frombuffer(base64.b64decode(embeddings.embedding), dtype="<f4")
+                for embeddings in data
+            ]
+        return [embeddings.embedding for embeddings in data]
+
+    def _assemble(self, list_of_text: List[str], found: Dict[str, Embedding]):
+        if not self.returns_matrix:
+            return [found[text] for text in list_of_text]
+        dim = len(next(iter(found.values()))) if found else 0
+        matrix = np.empty((len(list_of_text), dim), dtype=np.float32)
+        for i, text in enumerate(list_of_text):
+            matrix[i] = found[text]
+        return matrix
+
+    async def _async_request(
+        self, list_of_text: List[str], progress: ProgressCallback = None, known_counts: Dict[str, int] = None
+    ) -> List[Embedding]:
+        batches = self._batches(list_of_text, known_counts)
+        results: List[List[Embedding]] = [None] * len(batches)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        done = 0
+
+        async def process_batch(i: int, batch: List[str]) -> None:
+            nonlocal done
+            # Backoff sleeps hold the slot, so throttling also lowers concurrency.
+            async with semaphore:
+                embedding_response = await aretry(
+                    lambda: self.async_client.embeddings.create(**self._create_kwargs(batch)),
+                    self.max_retries,
+                )
+            results[i] = self._unpack(embedding_response)
+            done += len(batch)
+            if progress is not None:
+                progress(done, len(list_of_text))
+
+        tasks = [asyncio.ensure_future(process_batch(i, batch)) for i, batch in enumerate(batches)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return [embedding for batch_result in results for embedding in batch_result]
+
+    def _request(
+        self, list_of_text: List[str], progress: ProgressCallback = None, known_counts: Dict[str, int] = None
+    ) -> List[Embedding]:
+        embeddings, done = [], 0
+        for batch in self._batches(list_of_text, known_counts):
+            embedding_response = retry(
+                lambda: self.client.embeddings.create(**self._create_kwargs(batch)),
+                self.max_retries,
+            )
+            embeddings.extend(self._unpack(embedding_response))
+            done += len(batch)
+            if progress is not None:
+                progress(done, len(list_of_text))
+
+        return embeddings
+
+    async def async_get_embeddings(
+        self,
+        list_of_text: List[str],
+        progress: ProgressCallback = None,
+        token_counts: Sequence[int] = None,
+    ) -> Union[List[List[float]], np.ndarray]:
+        """Embeds ``list_of_text``; ``progress`` reports texts sent to the API as requests complete.
+
+        ``token_counts`` (e.g. from ``TokenTextSplitter`` spans) are used to pack
+        requests instead of tokenizing the texts again.
+        """
+        unique = list(dict.fromkeys(list_of_text))
+        found = self._lookup(unique)
+        # Texts another coroutine is already fetching are awaited, not re-requested.
+        waiting = {
+            text: self._in_flight[text]
+            for text in unique
+            if text not in found and text in self._in_flight
+        }
+        misses = [text for text in unique if text not in found and text not in waiting]
+
+        if misses:
+            loop = asyncio.get_running_loop()
+            futures = {text: loop.create_future() for text in misses}
+            self._in_flight.update(futures)
+            try:
+                embeddings = await self._async_request(
+                    misses, progress, None if token_counts is None else dict(zip(list_of_text, token_counts))
+                )
+                self._store(misses, embeddings)
+                for text, embedding in zip(misses, embeddings):
+                    futures[text].set_result(embedding)
+                    found[text] = embedding
+            except BaseException as error:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(error)
+                        # Mark retrieved so unobserved failures are not logged.
+                        future.exception()
+                raise
+            finally:
+                for text in misses:
+                    self._in_flight.pop(text, None)
+        for text, future in waiting.items():
+            found[text] = await future
+
+        return self._assemble(list_of_text, found)
+
+    async def async_get_embedding(self, text: str) -> Embedding:
+        if self.cache is not None:
+            return (await self.async_get_embeddings([text]))[0]
+        embedding = await aretry(
+            lambda: self.async_client.embeddings.create(**self._create_kwargs(text)),
+            self.max_retries,
         )
 
-        return [embeddings.embedding for embeddings in embedding_response.data]
+        return self._unpack(embedding)[0]
+
+    def get_embeddings(
+        self,
+        list_of_text: List[str],
+        progress: ProgressCallback = None,
+        token_counts: Sequence[int] = None,
+    ) -> Union[List[List[float]], np.ndarray]:
+        unique = list(dict.fromkeys(list_of_text))
+        found = self._lookup(unique)
+        misses = [text for text in unique if text not in found]
+        if misses:
+            embeddings = self._request(
+                misses, progress, None if token_counts is None else dict(zip(list_of_text, token_counts))
+            )
+            self._store(misses, embeddings)
+            found.update(zip(misses, embeddings))
+
+        return self._assemble(list_of_text, found)
 
-    def get_embedding(self, text: str) -> List[float]:
-        embedding = self.client.embeddings.create(
-            input=text, model=self.embeddings_model_name
+    def get_embedding(self, text: str) -> Embedding:
+        if self.cache is not None:
+            return self.get_embeddings([text])[0]
+        embedding = retry(
+            lambda: self.client.embeddings.create(**self._create_kwargs(text)),
+            self.max_retries,
         )
 
-        return embedding.data[0].embedding
+        return self._unpack(embedding)[0]
 
 
 if __name__ == "__main__":
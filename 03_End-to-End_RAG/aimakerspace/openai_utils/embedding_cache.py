@@ -0,0 +1,75 @@
+"""Persistent, content-addressed embedding cache backed by SQLite."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Sequence
+
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement.
+_LOOKUP_CHUNK = 500
+
+
+def embedding_key(model: str, text: str) -> bytes:
+    """SHA-256 of the model name and the text, so different models never collide."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class SQLiteEmbeddingCache:
+    """Stores embeddings as little-endian float32 blobs keyed by ``embedding_key``.
+
+    Safe to share between threads; several processes may also open the same
+    file, since the database runs in WAL mode.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Returns the cached embedding of every text that has one."""
+        keys = {embedding_key(model, text): text for text in texts}
+        found: Dict[str, np.ndarray] = {}
+        key_list = list(keys)
+        with self._lock:
+            for start in range(0, len(key_list), _LOOKUP_CHUNK):
+                chunk = key_list[start:start + _LOOKUP_CHUNK]
+                rows = self._connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = np.frombuffer(blob, dtype="<f4")
+        return found
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence) -> None:
+        rows = [
+            (embedding_key(model, text), model, np.asarray(vector, dtype="<f4").tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
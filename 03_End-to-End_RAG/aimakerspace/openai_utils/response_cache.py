@@ -0,0 +1,294 @@
+"""Exact and semantic caches for chat completions.
+
+``ResponseCache`` answers a request that was seen before without calling the
+API. Requests are keyed by ``response_key``: a SHA-256 of the model, the
+messages and the sampling kwargs. The exact layer is an in-memory
+``LRUCache``, optionally backed by a SQLite file that survives restarts.
+With a ``SemanticResponseCache`` as well, a request that misses the exact
+layer can still be answered when its last user message is close enough to
+one answered before, under the same model, other messages and kwargs::
+
+    cache = ResponseCache("responses.db", ttl=24 * 3600, semantic=SemanticResponseCache(threshold=0.95))
+    chat = ChatOpenAI(cache=cache)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from aimakerspace.cache import LRUCache
+from aimakerspace.vectordatabase import VectorDatabase
+
+Messages = List[Dict[str, Any]]
+
+
+def response_key(model: str, messages: Messages, kwargs: Dict[str, Any]) -> str:
+    """SHA-256 of the model, messages and kwargs; key order in dicts does not matter."""
+    payload = json.dumps([model, messages, kwargs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _split_query(model: str, messages: Messages, kwargs: Dict[str, Any]) -> Tuple[Optional[str], str]:
+    """Returns ``(query, scope)``: the last user message's text and the key of everything else."""
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].get("role") == "user":
+            if not isinstance(messages[i].get("content"), str):
+                break
+            return messages[i]["content"], response_key(model, messages[:i] + messages[i + 1:], kwargs)
+    return None, ""
+
+
+class SemanticResponseCache:
+    """Finds a cached response whose query embedding is within ``threshold`` cosine similarity.
+
+    Every row of ``vector_db`` is one answered query: its text is the
+    ``response_key`` of the request, its vector the query's embedding, and
+    its metadata the request's scope and creation time. Responses themselves
+    stay in the exact layer of the owning ``ResponseCache``, which can evict
+    them first. So the ``candidates`` closest rows within the threshold are
+    tried in order, and rows whose response is gone are deleted. Only rows
+    with the same scope are searched. Past ``maxsize`` rows the oldest are
+    evicted. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        vector_db: VectorDatabase = None,
+        threshold: float = 0.95,
+        maxsize: int = 10_000,
+        candidates: int = 4,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.vector_db = vector_db if vector_db is not None else VectorDatabase(compact_threshold=0.5)
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.candidates = candidates
+        self._clock = clock
+        # Query embeddings from lookups, so a miss is not embedded again when stored.
+        self._vectors = LRUCache(maxsize=256)
+        # Guards vector_db: a search must not run while rows are appended, deleted or compacted.
+        self._lock = threading.Lock()
+
+    def _filter(self, scope: str, ttl: Optional[float]) -> Dict[str, Any]:
+        if ttl is None:
+            return {"scope": scope}
+        return {"scope": scope, "created": {"$gte": self._clock() - ttl}}
+
+    def _match(
+        self,
+        query: str,
+        vector,
+        scope: str,
+        ttl: Optional[float],
+        resolve: Optional[Callable[[str], Optional[Any]]],
+    ) -> Optional[Any]:
+        vector = np.asarray(vector, dtype=np.float32)
+        self._vectors.put(query, vector)
+        with self._lock:
+            ids, scores = self.vector_db.search_ids(vector, self.candidates, filter=self._filter(scope, ttl))
+            ids = ids[scores >= self.threshold]
+            found, stale = None, []
+            for row, key in zip(ids.tolist(), self.vector_db.get_texts(ids)):
+                found = key if resolve is None else resolve(key)
+                if found is not None:
+                    break
+                stale.append(row)
+            self.vector_db.delete_ids(stale)
+        return found
+
+    def get(
+        self,
+        query: str,
+        scope: str,
+        ttl: Optional[float] = None,
+        resolve: Callable[[str], Optional[Any]] = None,
+    ) -> Optional[Any]:
+        """The closest cached request within the threshold, if any.
+
+        Returns its ``response_key``, or with ``resolve``, the first non-None
+        ``resolve(response_key)`` among the candidates, closest first.
+        """
+        vector = self._vectors.get(query)
+        if vector is None:
+            vector = self.vector_db.embedding_model.get_embedding(query)
+        return self._match(query, vector, scope, ttl, resolve)
+
+    async def aget(
+        self,
+        query: str,
+        scope: str,
+        ttl: Optional[float] = None,
+        resolve: Callable[[str], Optional[Any]] = None,
+    ) -> Optional[Any]:
+        vector = self._vectors.get(query)
+        if vector is None:
+            vector = await self.vector_db.embedding_model.async_get_embedding(query)
+        return self._match(query, vector, scope, ttl, resolve)
+
+    def _add(self, query: str, vector, scope: str, key: str) -> None:
+        with self._lock:
+            self.vector_db.append(
+                [key],
+                np.asarray(vector, dtype=np.float32)[None, :],
+                [{"scope": scope, "created": self._clock()}],
+            )
+            excess = len(self.vector_db) - self.maxsize
+            if excess > 0:
+                # Ids grow in insertion order, so the lowest live ids are the oldest rows.
+                self.vector_db.delete_ids(self.vector_db.find_ids({"created": {"$gte": 0}})[:excess])
+
+    def put(self, query: str, scope: str, key: str) -> None:
+        vector = self._vectors.get(query)
+        if vector is None:
+            vector = self.vector_db.embedding_model.get_embedding(query)
+        self._add(query, vector, scope, key)
+
+    async def aput(self, query: str, scope: str, key: str) -> None:
+        vector = self._vectors.get(query)
+        if vector is None:
+            vector = await self.vector_db.embedding_model.async_get_embedding(query)
+        self._add(query, vector, scope, key)
+
+
+class ResponseCache:
+    """Chat responses by ``response_key``: memory first, then SQLite, then the semantic layer.
+
+    The memory layer holds at most ``maxsize`` responses, least recently
+    used first out. With a ``path`` responses are also written to SQLite,
+    and a response found there is promoted to memory. ``max_disk_entries``
+    bounds the file, evicting the least recently used rows. Responses older
+    than ``ttl`` seconds are misses in every layer. Safe to share between
+    threads.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        max_disk_entries: int = None,
+        semantic: SemanticResponseCache = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.semantic = semantic
+        self._clock = clock
+        self.memory = LRUCache(maxsize, ttl, clock)
+        self.hits = self.semantic_hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("PRAGMA synchronous=NORMAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+                    "created REAL NOT NULL, used REAL NOT NULL)"
+                )
+                self._connection.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+
+    def _lookup(self, key: str) -> Optional[str]:
+        response = self.memory.get(key)
+        if response is not None or self._connection is None:
+            return response
+        now = self._clock()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        self.memory.put(key, row[0])
+        return row[0]
+
+    def _count(self, response: Optional[str], semantic: bool = False) -> Optional[str]:
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            elif semantic:
+                self.semantic_hits += 1
+            else:
+                self.hits += 1
+        return response
+
+    def get(self, model: str, messages: Messages, kwargs: Dict[str, Any]) -> Optional[str]:
+        """The cached response to this request, or None."""
+        response = self._lookup(response_key(model, messages, kwargs))
+        if response is not None or self.semantic is None:
+            return self._count(response)
+        query, scope = _split_query(model, messages, kwargs)
+        if query is None:
+            return self._count(None)
+        return self._count(self.semantic.get(query, scope, self.ttl, self._lookup), semantic=True)
+
+    async def aget(self, model: str, messages: Messages, kwargs: Dict[str, Any]) -> Optional[str]:
+        response = self._lookup(response_key(model, messages, kwargs))
+        if response is not None or self.semantic is None:
+            return self._count(response)
+        query, scope = _split_query(model, messages, kwargs)
+        if query is None:
+            return self._count(None)
+        return self._count(await self.semantic.aget(query, scope, self.ttl, self._lookup), semantic=True)
+
+    def _store(self, key: str, model: str, response: str) -> None:
+        self.memory.put(key, response)
+        if self._connection is None:
+            return
+        now = self._clock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            if self.max_disk_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+
+    def put(self, model: str, messages: Messages, kwargs: Dict[str, Any], response: str) -> None:
+        key = response_key(model, messages, kwargs)
+        self._store(key, model, response)
+        if self.semantic is not None:
+            query, scope = _split_query(model, messages, kwargs)
+            if query is not None:
+                self.semantic.put(query, scope, key)
+
+    async def aput(self, model: str, messages: Messages, kwargs: Dict[str, Any], response: str) -> None:
+        key = response_key(model, messages, kwargs)
+        self._store(key, model, response)
+        if self.semantic is not None:
+            query, scope = _split_query(model, messages, kwargs)
+            if query is not None:
+                await self.semantic.aput(query, scope, key)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+        }
+
+    def close(self) -> None:
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
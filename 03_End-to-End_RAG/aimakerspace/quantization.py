@@ -0,0 +1,375 @@
+"""Compressed storage codecs for ``VectorDatabase``.
+
+Codecs encode unit-length vectors (``VectorDatabase`` keeps the original
+norms separately) and score a unit query directly against the codes, so the
+compressed matrix can be scanned without decoding it first.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Rows decoded at once while scanning codes, to bound temporary memory.
+_BLOCK_ROWS = 1 << 16
+
+
+def kmeans(
+    data: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0
+) -> np.ndarray:
+    """Plain Lloyd's k-means under Euclidean distance."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _nearest_centroid(data, centroids)
+        sums, counts = cluster_sums(data, labels, n_clusters)
+        centroids = sums / np.maximum(counts, 1)[:, None]
+        empty = counts == 0
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+
+def cluster_sums(
+    data: np.ndarray, labels: np.ndarray, n_clusters: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-cluster sums and sizes, via one sort and ``np.add.reduceat``."""
+    counts = np.bincount(labels, minlength=n_clusters)
+    sums = np.zeros((n_clusters, data.shape[1]), dtype=np.float32)
+    occupied = np.flatnonzero(counts)
+    if len(occupied):
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts[occupied])[:-1]))
+        sums[occupied] = np.add.reduceat(data[order], starts, axis=0)
+    return sums, counts
+
+
+def _nearest_centroid(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+    return np.argmax(data @ centroids.T - 0.5 * np.sum(centroids**2, axis=1), axis=1)
+
+
+class VectorCodec(ABC):
+    """Base class for vector codecs.
+
+    ``score`` returns approximate inner products between a unit query and the
+    decoded rows; the default implementation decodes in blocks.
+    ``check_dimension`` rejects a dimension the codec cannot encode, before
+    ``VectorDatabase`` stores anything.
+
+    ``VectorDatabase`` trains a codec once it holds ``min_train_rows`` rows
+    and keeps rows as float32 until then. ``covers`` tells it whether new
+    vectors still fit the trained codec; if not, ``widen`` extends it and the
+    stored rows are re-encoded.
+    """
+
+    name = ""
+    code_dtype = np.uint8
+    min_train_rows = 1
+
+    @property
+    def is_trained(self) -> bool:
+        return True
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def check_dimension(self, dim: int) -> None:
+        pass
+
+    def train(self, vectors: np.ndarray) -> None:
+        pass
+
+    def covers(self, vectors: np.ndarray) -> bool:
+        return True
+
+    def widen(self, vectors: np.ndarray) -> None:
+        pass
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        ...
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = self.decode(block) @ query
+        return scores
+
+    def state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """Returns ``(params, arrays)`` needed to rebuild a trained codec."""
+        return {}, {}
+
+    @classmethod
+    def from_state(cls, params: Dict, arrays: Dict[str, np.ndarray]) -> "VectorCodec":
+        return cls(**params)
+
+
+class Float16Codec(VectorCodec):
+    """Half-precision storage: 2x smaller than float32, near-lossless for unit vectors."""
+
+    name = "float16"
+    code_dtype = np.float16
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+
+
+class Int8Codec(VectorCodec):
+    """Per-dimension scalar quantization to 8 bits: 4x smaller than float32.
+
+    Each dimension is mapped linearly from its trained ``[min, max]`` range
+    onto 256 levels. Vectors reaching outside the range widen it (with some
+    headroom) instead of being clipped.
+    """
+
+    name = "int8"
+
+    def __init__(self, min_train_rows: int = 1024):
+        self.min_train_rows = min_train_rows
+        self.offset: np.ndarray = None
+        self.scale: np.ndarray = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.offset is not None
+
+    def _set_range(self, low: np.ndarray, high: np.ndarray) -> None:
+        self.offset = low.astype(np.float32)
+        self.scale = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+
+    def train(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._set_range(vectors.min(axis=0), vectors.max(axis=0))
+
+    def covers(self, vectors: np.ndarray) -> bool:
+        # Within half a level of either end still rounds to a valid code.
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low, high = self.offset - self.scale / 2, self.offset + 255.5 * self.scale
+        return bool((vectors.min(axis=0) >= low).all() and (vectors.max(axis=0) <= high).all())
+
+    def widen(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low, high = self.offset, self.offset + 255 * self.scale
+        new_low = np.minimum(low, vectors.min(axis=0))
+        new_high = np.maximum(high, vectors.max(axis=0))
+        # Headroom on the sides that grew, so a slowly drifting range is not re-encoded on every write.
+        margin = 0.05 * (new_high - new_low)
+        self._set_range(
+            np.where(new_low < low, new_low - margin, low),
+            np.where(new_high > high, new_high + margin, high),
+        )
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(levels, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.offset + codes.astype(np.float32) * self.scale
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # q . (offset + code * scale) == q . offset + code . (q * scale)
+        bias = float(query @ self.offset)
+        weights = query * self.scale
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weights + bias
+        return scores
+
+    def state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        return {"min_train_rows": self.min_train_rows}, {"offset": self.offset, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, params: Dict, arrays: Dict[str, np.ndarray]) -> "Int8Codec":
+        codec = cls(**params)
+        codec.offset, codec.scale = arrays.get("offset"), arrays.get("scale")
+        return codec
+
+
+class ProductQuantizationCodec(VectorCodec):
+    """Product quantization with asymmetric distance computation.
+
+    The vector is split into ``m`` sub-vectors and each is replaced by the
+    index of its nearest of ``n_centroids`` (at most 256) k-means centroids,
+    so a 1536-dim float32 vector (6 KB) becomes ``m`` bytes. A query builds an
+    ``(m, n_centroids)`` table of sub-vector inner products once, and each
+    row's score is the sum of ``m`` table lookups.
+
+    Training waits for ``min_train_rows`` rows, by default ``10 *
+    n_centroids``, so the centroids are not fitted to a handful of vectors.
+    """
+
+    name = "pq"
+
+    def __init__(
+        self,
+        m: int = 96,
+        n_centroids: int = 256,
+        n_iter: int = 20,
+        train_size: int = 65536,
+        seed: int = 0,
+        min_train_rows: int = None,
+    ):
+        if not 1 < n_centroids <= 256:
+            raise ValueError("n_centroids must be between 2 and 256")
+        self.m = m
+        self.n_centroids = n_centroids
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.seed = seed
+        self.min_train_rows = 10 * n_centroids if min_train_rows is None else min_train_rows
+        self.centroids: np.ndarray = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def code_size(self, dim: int) -> int:
+        return self.m
+
+    def check_dimension(self, dim: int) -> None:
+        if dim % self.m:
+            raise ValueError(
+                f"Dimension {dim} is not divisible into m={self.m} sub-vectors; "
+                f"pick an m that divides {dim}"
+            )
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.check_dimension(vectors.shape[-1])
+        return vectors.reshape(*vectors.shape[:-1], self.m, vectors.shape[-1] // self.m)
+
+    def train(self, vectors: np.ndarray) -> None:
+        sub_vectors = self._split(vectors)
+        if len(sub_vectors) > self.train_size:
+            sample = np.random.default_rng(self.seed).choice(
+                len(sub_vectors), self.train_size, replace=False
+            )
+            sub_vectors = sub_vectors[sample]
+        # Pad to n_centroids so every sub-quantizer has the same table width.
+        centroids = np.zeros(
+            (self.m, self.n_centroids, sub_vectors.shape[-1]), dtype=np.float32
+        )
+        for j in range(self.m):
+            trained = kmeans(sub_vectors[:, j], self.n_centroids, self.n_iter, self.seed + j)
+            centroids[j, : len(trained)] = trained
+            centroids[j, len(trained):] = trained[0]
+        self.centroids = centroids
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_vectors = self._split(vectors)
+        codes = np.empty((len(sub_vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest_centroid(sub_vectors[:, j], self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.centroids[np.arange(self.m), codes].reshape(len(codes), -1)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        table = np.einsum("jcd,jd->jc", self.centroids, self._split(query))
+        subspaces = np.arange(self.m)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = table[subspaces, block].sum(axis=1)
+        return scores
+
+    def state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        params = {
+            "m": self.m,
+            "n_centroids": self.n_centroids,
+            "n_iter": self.n_iter,
+            "train_size": self.train_size,
+            "seed": self.seed,
+            "min_train_rows": self.min_train_rows,
+        }
+        return params, {"centroids": self.centroids}
+
+    @classmethod
+    def from_state(
+        cls, params: Dict, arrays: Dict[str, np.ndarray]
+    ) -> "ProductQuantizationCodec":
+        codec = cls(**params)
+        codec.centroids = arrays.get("centroids")
+        return codec
+
+
+class MatryoshkaCodec(VectorCodec):
+    """Keeps only the first ``dims`` components of each vector, renormalized.
+
+    Matryoshka-trained embeddings (``text-embedding-3-*``) front-load their
+    information, so a short prefix ranks nearly as well as the full vector.
+    Scanning 256 of 1536 dimensions reads 6x less memory. Used with the
+    full float32 matrix (``keep_vectors=True``), ``VectorDatabase`` re-ranks
+    the best ``k * rescore`` prefix candidates against the full vectors.
+    Without it, ``decode`` zero-pads the prefix back to full length.
+    """
+
+    name = "matryoshka"
+
+    def __init__(self, dims: int = 256, half_precision: bool = False):
+        if dims < 1:
+            raise ValueError(f"dims must be positive, got {dims}")
+        self.dims = dims
+        self.half_precision = half_precision
+        self.code_dtype = np.float16 if half_precision else np.float32
+        self.dim: int = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.dim is not None
+
+    def code_size(self, dim: int) -> int:
+        return min(self.dims, dim)
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.dim = np.asarray(vectors).shape[-1]
+
+    def _prefix(self, vectors: np.ndarray) -> np.ndarray:
+        prefix = np.asarray(vectors, dtype=np.float32)[..., : self.dims]
+        norms = np.linalg.norm(prefix, axis=-1, keepdims=True)
+        return np.divide(prefix, norms, out=np.zeros_like(prefix), where=norms > 0)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return self._prefix(vectors).astype(self.code_dtype, copy=False)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        vectors = np.zeros((len(codes), self.dim), dtype=np.float32)
+        vectors[:, : codes.shape[1]] = codes
+        return vectors
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        prefix = self._prefix(query)
+        if codes.dtype == np.float32:
+            return codes @ prefix
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ prefix
+        return scores
+
+    def state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        return {"dims": self.dims, "half_precision": self.half_precision, "dim": self.dim}, {}
+
+    @classmethod
+    def from_state(cls, params: Dict, arrays: Dict[str, np.ndarray]) -> "MatryoshkaCodec":
+        codec = cls(params["dims"], params["half_precision"])
+        codec.dim = params["dim"]
+        return codec
+
+
+CODECS = {
+    codec.name: codec
+    for codec in (Float16Codec, Int8Codec, ProductQuantizationCodec, MatryoshkaCodec)
+}
@@ -0,0 +1,241 @@
+"""Incremental re-indexing of a document tree, driven by a fingerprint manifest.
+
+``IncrementalIndexer`` keeps ``manifest.json`` next to a saved
+``VectorDatabase``. For every indexed file it records the size, modification
+time, SHA-256 of the content and the hash of each chunk. A run stats every
+file under ``root`` and:
+
+- skips files whose size and mtime match the manifest, without reading them;
+- only refreshes the fingerprint of files whose content hash still matches
+  (e.g. files that were merely touched);
+- loads and splits new and changed files, embedding only the chunks whose
+  hash is not among the file's previous chunks. Unchanged chunks keep their
+  stored vectors;
+- deletes the chunks of files that are gone.
+
+Each save writes the index to a new ``index-<generation>`` directory and
+then points the manifest at it, so the manifest always describes the index
+it names, and a crash at any point leaves the previous pair intact.
+
+Rows carry ``{"source": path}`` metadata, ``path`` being relative to
+``root``, which is how a file's chunks are found again::
+
+    indexer = IncrementalIndexer("data", "index")
+    stats = asyncio.run(indexer.run())  # rerun nightly; only changes cost anything
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.text_utils import CharacterTextSplitter, PDFLoader, TextFileLoader
+from aimakerspace.vectordatabase import VectorDatabase
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2
+_INDEX_PREFIX = "index-"
+# Version 1 manifests kept the index in this directory.
+_LEGACY_INDEX_DIR = "index"
+
+
+def _load_text(path: str) -> str:
+    return TextFileLoader(path).load_documents()[0]
+
+
+def _load_pdf(path: str) -> str:
+    return PDFLoader(path).load_documents()[0]
+
+
+# File extension -> function returning the file's text.
+DEFAULT_LOADERS: Dict[str, Callable[[str], str]] = {".txt": _load_text, ".pdf": _load_pdf}
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class IncrementalIndexer:
+    """Keeps the index in ``index_dir`` in step with the files under ``root``.
+
+    An existing index and manifest in ``index_dir`` are reopened. New chunks
+    are embedded in groups of about ``batch_chunks``, so a large change set
+    is never held in memory all at once.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        index_dir: str,
+        embedding_model: EmbeddingModel = None,
+        splitter: CharacterTextSplitter = None,
+        loaders: Dict[str, Callable[[str], str]] = None,
+        batch_chunks: int = 4096,
+    ):
+        if not os.path.isdir(root):
+            raise ValueError(f"'{root}' is not a directory")
+        self.root = root
+        self.index_dir = index_dir
+        self.splitter = splitter or CharacterTextSplitter()
+        self.loaders = loaders or DEFAULT_LOADERS
+        self.batch_chunks = batch_chunks
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._generation = 0
+        manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version", 0) > MANIFEST_VERSION:
+                raise ValueError(
+                    f"Manifest version {manifest['version']} is newer than supported version {MANIFEST_VERSION}"
+                )
+            self.files = manifest["files"]
+            self._generation = manifest.get("generation", 0)
+            self.vector_db = VectorDatabase.load(
+                os.path.join(index_dir, manifest.get("index", _LEGACY_INDEX_DIR)),
+                embedding_model=embedding_model,
+            )
+        else:
+            self.vector_db = VectorDatabase(embedding_model)
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        found = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if os.path.splitext(name)[1].lower() in self.loaders:
+                    path = os.path.join(directory, name)
+                    found[os.path.relpath(path, self.root)] = os.stat(path)
+        return found
+
+    def save(self) -> None:
+        """Writes the index to a new generation directory, then points the manifest at it.
+
+        Files of the loaded index may be memory-mapped, so they are never
+        written over. Older generations are only removed once the new manifest
+        is in place.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        generation = self._generation + 1
+        index_name = f"{_INDEX_PREFIX}{generation}"
+        # Left over when a crash came before the manifest was switched.
+        shutil.rmtree(os.path.join(self.index_dir, index_name), ignore_errors=True)
+        self.vector_db.save(os.path.join(self.index_dir, index_name))
+        manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "generation": generation, "index": index_name, "files": self.files},
+                f,
+            )
+        os.replace(manifest_path + ".tmp", manifest_path)
+        self._generation = generation
+        for name in os.listdir(self.index_dir):
+            if (name.startswith(_INDEX_PREFIX) or name == _LEGACY_INDEX_DIR) and name != index_name:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    async def run(self) -> Dict[str, float]:
+        """Brings the index up to date, saves it if anything changed, and returns counts and timings."""
+        started = time.perf_counter()
+        stats = dict.fromkeys(
+            ("unchanged", "touched", "added", "changed", "removed", "chunks_embedded", "chunks_reused"), 0
+        )
+        on_disk = await asyncio.to_thread(self._scan)
+
+        for source in [source for source in self.files if source not in on_disk]:
+            del self.files[source]
+            stats["removed"] += 1
+        # Also catches rows of files the manifest does not list, e.g. from an index built elsewhere.
+        orphans = self.vector_db.delete_where({"source": {"$nin": sorted(on_disk)}}) if len(self.vector_db) else 0
+
+        stale = []
+        for source, stat in on_disk.items():
+            entry = self.files.get(source)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                stats["unchanged"] += 1
+                continue
+            sha256 = await asyncio.to_thread(file_sha256, os.path.join(self.root, source))
+            if entry and entry["sha256"] == sha256:
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                stats["touched"] += 1
+                continue
+            stats["changed" if entry else "added"] += 1
+            stale.append((source, stat, sha256))
+
+        group, group_chunks = [], 0
+        for source, stat, sha256 in stale:
+            prepared = await asyncio.to_thread(self._prepare, source, stat, sha256)
+            group.append(prepared)
+            group_chunks += sum(row < 0 for row in prepared["reuse"])
+            if group_chunks >= self.batch_chunks:
+                await self._commit(group, stats)
+                group, group_chunks = [], 0
+        if group:
+            await self._commit(group, stats)
+
+        if orphans or stats["removed"] or stats["touched"] or stale:
+            await asyncio.to_thread(self.save)
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+    def _prepare(self, source: str, stat: os.stat_result, sha256: str) -> Dict[str, Any]:
+        """Loads and splits one file and matches its chunks against the ones already indexed."""
+        extension = os.path.splitext(source)[1].lower()
+        chunks = self.splitter.split(self.loaders[extension](os.path.join(self.root, source)))
+        hashes = [chunk_hash(chunk) for chunk in chunks]
+        old_ids = self.vector_db.find_ids({"source": source})
+        old_hashes = self.files.get(source, {}).get("chunks")
+        if old_hashes is None or len(old_hashes) != len(old_ids):
+            # A version 1 manifest, or rows the manifest does not describe.
+            old_hashes = [chunk_hash(text) for text in self.vector_db.get_texts(old_ids)]
+        # Ids grow in insertion order, so they line up with the manifest's chunk order.
+        known = dict(zip(old_hashes, old_ids.tolist()))
+        return {
+            "source": source,
+            "entry": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "chunks": hashes},
+            "chunks": chunks,
+            "old_ids": old_ids,
+            "reuse": [known.get(chunk, -1) for chunk in hashes],
+        }
+
+    async def _commit(self, group: List[Dict[str, Any]], stats: Dict[str, float]) -> None:
+        """Embeds the new chunks of ``group`` in one call and swaps each file's rows."""
+        missing: List[Tuple[int, int]] = [
+            (i, j) for i, prepared in enumerate(group) for j, row in enumerate(prepared["reuse"]) if row < 0
+        ]
+        embeddings = None
+        if missing:
+            texts = [group[i]["chunks"][j] for i, j in missing]
+            embeddings = np.asarray(
+                await self.vector_db.embedding_model.async_get_embeddings(texts), dtype=np.float32
+            )
+            stats["chunks_embedded"] += len(texts)
+        position = {pair: n for n, pair in enumerate(missing)}
+
+        for i, prepared in enumerate(group):
+            chunks, reuse = prepared["chunks"], np.asarray(prepared["reuse"], dtype=np.int64)
+            if chunks:
+                dim = embeddings.shape[1] if embeddings is not None else self.vector_db.dimension
+                vectors = np.empty((len(chunks), dim), dtype=np.float32)
+                reused = reuse >= 0
+                if reused.any():
+                    vectors[reused] = self.vector_db.get_vectors(reuse[reused])
+                    stats["chunks_reused"] += int(reused.sum())
+                for j in np.flatnonzero(~reused).tolist():
+                    vectors[j] = embeddings[position[(i, j)]]
+            self.vector_db.delete_ids(prepared["old_ids"])
+            if chunks:
+                self.vector_db.append(chunks, vectors, [{"source": prepared["source"]}] * len(chunks))
+            self.files[prepared["source"]] = prepared["entry"]
@@ -0,0 +1,74 @@
+"""Compact storage for chunk texts, addressed by dense integer ids.
+
+Every text is kept UTF-8 encoded in one contiguous buffer, with an int64
+offsets array marking where each one starts. That is one allocation for the
+whole corpus instead of one Python string object per chunk, and a text is
+only decoded when it is asked for.
+"""
+
+from typing import Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+
+class TextStore:
+    """Append-only texts; text ``i`` is ``buffer[offsets[i]:offsets[i + 1]]``.
+
+    ``buffer`` may be a read-only memory map (see ``VectorDatabase.load``).
+    It is copied into memory on the first append.
+    """
+
+    def __init__(self, buffer: Union[bytearray, np.ndarray] = None, offsets: np.ndarray = None):
+        self._buffer = bytearray() if buffer is None else buffer
+        if offsets is None:
+            self._offsets = np.zeros(16, dtype=np.int64)
+            self._count = 0
+        else:
+            self._offsets = np.asarray(offsets, dtype=np.int64)
+            self._count = len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return str(self._buffer[start:end], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(self._count))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer) + self._offsets.nbytes
+
+    def get_many(self, ids: Sequence[int]) -> List[str]:
+        return [self[i] for i in np.asarray(ids, dtype=np.int64).tolist()]
+
+    def append_many(self, texts: Sequence[str]) -> None:
+        if not texts:
+            return
+        encoded = [text.encode("utf-8") for text in texts]
+        if not isinstance(self._buffer, bytearray):
+            self._buffer = bytearray(self._buffer)
+        needed = self._count + len(encoded) + 1
+        if needed > len(self._offsets):
+            grown = np.empty(max(needed, 2 * len(self._offsets)), dtype=np.int64)
+            grown[: self._count + 1] = self._offsets[: self._count + 1]
+            self._offsets = grown
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        np.cumsum(lengths, out=self._offsets[self._count + 1 : needed])
+        self._offsets[self._count + 1 : needed] += self._offsets[self._count]
+        self._buffer += b"".join(encoded)
+        self._count += len(encoded)
+
+    def take(self, ids: np.ndarray) -> "TextStore":
+        """A new store holding texts ``ids``, in that order."""
+        starts, ends = self._offsets[ids], self._offsets[np.asarray(ids) + 1]
+        buffer = bytearray().join(self._buffer[start:end] for start, end in zip(starts.tolist(), ends.tolist()))
+        offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=offsets[1:])
+        return TextStore(buffer, offsets)
+
+    def buffers(self) -> Tuple[memoryview, np.ndarray]:
+        """Views of the used ``(buffer, offsets)``, ready to be written to disk."""
+        return memoryview(self._buffer)[: self._offsets[self._count]], self._offsets[: self._count + 1]
@@ -1,13 +1,41 @@
+import codecs
+import io
+import itertools
+import mmap
 import os
-from typing import List
-import PyPDF2
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 
 class TextFileLoader:
-    def __init__(self, path: str, encoding: str = "utf-8"):
+    """Loads ``.txt`` files from a single file or a directory tree.
+
+    ``load`` / ``load_documents`` keep every document in ``self.documents``.
+    ``iter_documents`` streams them instead. Files are read on ``workers``
+    threads in groups of ``files_per_task``, at most ``2 * workers`` groups
+    ahead of the consumer, so trees of many small files are bound by disk
+    I/O and memory stays bounded.
+
+    Files of at least ``mmap_threshold`` bytes are memory-mapped and decoded
+    straight from the mapping. ``iter_blocks`` decodes such a file in
+    ``block_size`` pieces for ``CharacterTextSplitter.split_blocks``, so a
+    large file is split without ever holding its whole text.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        encoding: str = "utf-8",
+        workers: int = 8,
+        files_per_task: int = 32,
+        mmap_threshold: int = 1 << 24,
+    ):
         self.documents = []
         self.path = path
         self.encoding = encoding
+        self.workers = workers
+        self.files_per_task = files_per_task
+        self.mmap_threshold = mmap_threshold
 
     def load(self):
         if os.path.isdir(self.path):
@@ -20,22 +48,88 @@ class TextFileLoader:
             )
 
     def load_file(self):
-        with open(self.path, "r", encoding=self.encoding) as f:
-            self.documents.append(f.read())
+        self.documents.append(self._read(self.path))
 
     def load_directory(self):
-        for root, _, files in os.walk(self.path):
-            for file in files:
-                if file.endswith(".txt"):
-                    with open(
-                        os.path.join(root, file), "r", encoding=self.encoding
-                    ) as f:
-                        self.documents.append(f.read())
+        for _, text in self.iter_documents():
+            self.documents.append(text)
 
     def load_documents(self):
         self.load()
         return self.documents
 
+    def _paths(self) -> Iterator[str]:
+        if os.path.isfile(self.path) and self.path.endswith(".txt"):
+            return iter([self.path])
+        if os.path.isdir(self.path):
+            return (
+                os.path.join(root, file)
+                for root, _, files in os.walk(self.path)
+                for file in files
+                if file.endswith(".txt")
+            )
+        raise ValueError(
+            "Provided path is neither a valid directory nor a .txt file."
+        )
+
+    def _decoder(self) -> io.IncrementalNewlineDecoder:
+        # Same newline handling as text-mode open(): \r\n and \r become \n.
+        return io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(self.encoding)(), translate=True
+        )
+
+    def _read(self, path: str) -> str:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < max(self.mmap_threshold, 1):
+                return self._decoder().decode(f.read(), final=True)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return self._decoder().decode(mapped, final=True)
+
+    def _read_many(self, paths: List[str]) -> List[str]:
+        return [self._read(path) for path in paths]
+
+    def iter_documents(self) -> Iterator[Tuple[str, str]]:
+        """Yields ``(path, text)`` in directory-walk order, without keeping earlier files."""
+        paths = self._paths()
+        if self.workers <= 1:
+            for path in paths:
+                yield path, self._read(path)
+            return
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Files go to the pool in groups so per-task overhead is paid once per group.
+        groups = iter(lambda: list(itertools.islice(paths, self.files_per_task)), [])
+        pending = deque()
+        with ThreadPoolExecutor(self.workers) as pool:
+            try:
+                for group in groups:
+                    pending.append((group, pool.submit(self._read_many, group)))
+                    if len(pending) >= 2 * self.workers:
+                        group, future = pending.popleft()
+                        yield from zip(group, future.result())
+                while pending:
+                    group, future = pending.popleft()
+                    yield from zip(group, future.result())
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def iter_blocks(self, path: str = None, block_size: int = 1 << 20) -> Iterator[str]:
+        """Decodes one file (default: ``self.path``) from a memory map, ``block_size`` bytes at a time."""
+        decoder = self._decoder()
+        with open(path or self.path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, len(mapped), block_size):
+                    text = decoder.decode(mapped[start:start + block_size])
+                    if text:
+                        yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
 
 class CharacterTextSplitter:
     def __init__(
@@ -62,64 +156,119 @@ class CharacterTextSplitter:
             chunks.extend(self.split(text))
         return chunks
 
+    def split_blocks(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Yields the chunks of ``"".join(blocks)`` while holding about one chunk and one block."""
+        step = self.chunk_size - self.chunk_overlap
+        buffer = ""
+        for block in blocks:
+            buffer += block
+            start = 0
+            while start + self.chunk_size <= len(buffer):
+                yield buffer[start : start + self.chunk_size]
+                start += step
+            buffer = buffer[start:]
+        for start in range(0, len(buffer), step):
+            yield buffer[start : start + self.chunk_size]
+
+
+def _iter_pdf(path: str) -> Iterator[Tuple[str, int, str]]:
+    """Yields ``(path, page_number, text)`` for every page of one PDF, 1-based."""
+    import PyPDF2
+
+    for number, page in enumerate(PyPDF2.PdfReader(path).pages, 1):
+        yield path, number, page.extract_text()
+
+
+def _extract_pdf(path: str) -> List[Tuple[str, int, str]]:
+    return list(_iter_pdf(path))
+
 
 class PDFLoader:
-    def __init__(self, path: str):
+    """Extracts text from a PDF file or every ``.pdf`` under a directory.
+
+    Extraction is CPU-bound, so from ``min_files_for_pool`` files up, whole
+    files are spread over a pool of ``workers`` processes (default: one per
+    core), at most ``2 * workers`` at a time. Each file is parsed once, by
+    one process. Fewer files, or ``workers=1``, are extracted in this
+    process, where starting a pool would cost more than it saves.
+    ``iter_pages`` yields ``(path, page_number, text)``, file by file in
+    completion order. ``load`` / ``load_documents`` join each file's pages,
+    in page order, into one document.
+    """
+
+    def __init__(self, path: str, workers: int = None, min_files_for_pool: int = 4):
         self.documents = []
         self.path = path
-        print(f"PDFLoader initialized with path: {self.path}")
+        self.workers = workers or os.cpu_count() or 1
+        self.min_files_for_pool = min_files_for_pool
 
     def load(self):
-        print(f"Loading PDF from path: {self.path}")
-        print(f"Path exists: {os.path.exists(self.path)}")
-        print(f"Is file: {os.path.isfile(self.path)}")
-        print(f"Is directory: {os.path.isdir(self.path)}")
-        print(f"File permissions: {oct(os.stat(self.path).st_mode)[-3:]}")
-        
+        if not os.path.isdir(self.path) and not os.path.isfile(self.path):
+            raise ValueError(f"Provided path '{self.path}' is neither a file nor a directory.")
         try:
-            # Try to open the file first to verify access
-            with open(self.path, 'rb') as test_file:
-                pass
-            
-            # If we can open it, proceed with loading
-            self.load_file()
-            
+            if os.path.isdir(self.path):
+                self.load_directory()
+            else:
+                self.load_file()
         except IOError as e:
             raise ValueError(f"Cannot access file at '{self.path}': {str(e)}")
         except Exception as e:
             raise ValueError(f"Error processing file at '{self.path}': {str(e)}")
 
     def load_file(self):
-        with open(self.path, 'rb') as file:
-            # Create PDF reader object
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            # Extract text from each page
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            self.documents.append(text)
+        self.documents.extend(self._documents([self.path]))
 
     def load_directory(self):
-        for root, _, files in os.walk(self.path):
-            for file in files:
-                if file.lower().endswith('.pdf'):
-                    file_path = os.path.join(root, file)
-                    with open(file_path, 'rb') as f:
-                        pdf_reader = PyPDF2.PdfReader(f)
-                        
-                        # Extract text from each page
-                        text = ""
-                        for page in pdf_reader.pages:
-                            text += page.extract_text() + "\n"
-                        
-                        self.documents.append(text)
+        self.documents.extend(self._documents(self._paths()))
 
     def load_documents(self):
         self.load()
         return self.documents
 
+    def _paths(self) -> List[str]:
+        if os.path.isfile(self.path):
+            return [self.path]
+        return sorted(
+            os.path.join(root, file)
+            for root, _, files in os.walk(self.path)
+            for file in files
+            if file.lower().endswith(".pdf")
+        )
+
+    def _documents(self, paths: List[str]) -> List[str]:
+        pages: Dict[str, Dict[int, str]] = {path: {} for path in paths}
+        for path, number, text in self._iter_pages(paths):
+            pages[path][number] = text
+        # One join per document keeps the build linear in the text length.
+        return [
+            "".join(text + "\n" for _, text in sorted(pages[path].items())) for path in paths
+        ]
+
+    def iter_pages(self) -> Iterator[Tuple[str, int, str]]:
+        """Yields ``(path, page_number, text)`` for every page, file by file."""
+        return self._iter_pages(self._paths())
+
+    def _iter_pages(self, paths: List[str]) -> Iterator[Tuple[str, int, str]]:
+        workers = min(self.workers, len(paths))
+        if workers <= 1 or len(paths) < self.min_files_for_pool:
+            for path in paths:
+                yield from _iter_pdf(path)
+            return
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        pool = ProcessPoolExecutor(workers)
+        try:
+            waiting = iter(paths)
+            in_flight = {pool.submit(_extract_pdf, path) for path in itertools.islice(waiting, 2 * workers)}
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+                    for path in itertools.islice(waiting, 1):
+                        in_flight.add(pool.submit(_extract_pdf, path))
+        finally:
+            pool.shutdown(cancel_futures=True)
+
 
 if __name__ == "__main__":
     loader = TextFileLoader("data/KingLear.txt")
@@ -0,0 +1,136 @@
+"""Token-aware text splitting.
+
+Kept apart from ``text_utils`` because it needs NumPy and a tokenizer, which
+the loaders and ``CharacterTextSplitter`` do not.
+"""
+
+import re
+from collections import deque
+from typing import Hashable, Iterable, Iterator, List, Mapping, NamedTuple, Sequence, Tuple, Union
+
+import numpy as np
+
+from aimakerspace.openai_utils.batching import token_offsets
+
+
+class Span(NamedTuple):
+    """A chunk as the character range ``[start, end)`` of document ``doc_id``."""
+
+    doc_id: Hashable
+    start: int
+    end: int
+    token_count: int
+
+    def text(self, documents: Union[Sequence[str], Mapping[Hashable, str]]) -> str:
+        return documents[self.doc_id][self.start : self.end]
+
+
+# Paragraphs, then lines, then sentences, then words; tried in order.
+DEFAULT_SEPARATORS = (r"\n\s*\n", r"\n", r"(?<=[.!?])\s+", r"\s+")
+
+
+class TokenTextSplitter:
+    """Splits text into chunks of at most ``chunk_tokens`` model tokens.
+
+    Text is cut at the first of ``separators`` (regular expressions) that
+    occurs in it. A piece still over the limit is cut again at the next
+    separator, and cut between tokens as a last resort. Consecutive pieces
+    are then packed into chunks, and each chunk starts with whole trailing
+    pieces of the previous one, up to ``chunk_overlap`` tokens.
+
+    ``split_spans`` tokenizes a group of documents in one batched call and
+    returns ``Span`` tuples. Each holds a character range and its token
+    count, so overlapping chunks do not copy text. Materialise one with
+    ``Span.text``. The token count is the number of the document's tokens
+    that start inside the span, so it can differ by one at either edge from
+    re-tokenizing the chunk alone. ``split`` / ``split_texts`` return strings,
+    like ``CharacterTextSplitter``.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = 256,
+        chunk_overlap: int = 32,
+        model: str = "text-embedding-3-small",
+        separators: Sequence[str] = DEFAULT_SEPARATORS,
+        batch_size: int = 64,
+    ):
+        if chunk_tokens <= chunk_overlap:
+            raise ValueError("chunk_tokens must be greater than chunk_overlap")
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.model = model
+        self.separators = [re.compile(separator) for separator in separators]
+        self.batch_size = batch_size
+
+    def split_spans(self, documents: Union[Sequence[str], Mapping[Hashable, str]]) -> List[Span]:
+        """Spans of every document, in order; ``doc_id`` is the list index or mapping key."""
+        items = list(documents.items() if isinstance(documents, Mapping) else enumerate(documents))
+        spans = []
+        for group_start in range(0, len(items), self.batch_size):
+            group = items[group_start : group_start + self.batch_size]
+            offsets = token_offsets([text for _, text in group], self.model)
+            for (doc_id, text), byte_offsets in zip(group, offsets):
+                starts = _char_positions(text, byte_offsets)
+                spans.extend(self._merge(doc_id, self._pieces(text, starts, 0, len(text), 0)))
+        return spans
+
+    def split(self, text: str) -> List[str]:
+        return [span.text([text]) for span in self.split_spans([text])]
+
+    def split_texts(self, texts: List[str]) -> List[str]:
+        return [span.text(texts) for span in self.split_spans(texts)]
+
+    @staticmethod
+    def _count(starts: np.ndarray, start: int, end: int) -> int:
+        return int(np.searchsorted(starts, end) - np.searchsorted(starts, start))
+
+    def _pieces(
+        self, text: str, starts: np.ndarray, start: int, end: int, level: int
+    ) -> Iterator[Tuple[int, int, int]]:
+        """``(start, end, token_count)`` pieces of ``text[start:end]``, each within ``chunk_tokens``."""
+        count = self._count(starts, start, end)
+        if count <= self.chunk_tokens:
+            if end > start:
+                yield start, end, count
+            return
+        for depth in range(level, len(self.separators)):
+            cuts = [
+                match.end()
+                for match in self.separators[depth].finditer(text, start, end)
+                if start < match.end() < end
+            ]
+            if cuts:
+                bounds = [start, *cuts, end]
+                for piece_start, piece_end in zip(bounds, bounds[1:]):
+                    yield from self._pieces(text, starts, piece_start, piece_end, depth + 1)
+                return
+        # No separator left: cut every chunk_tokens tokens.
+        first, last = np.searchsorted(starts, [start, end])
+        cuts = np.unique(starts[first + self.chunk_tokens : last : self.chunk_tokens]).tolist()
+        bounds = [start, *(cut for cut in cuts if cut > start), end]
+        for piece_start, piece_end in zip(bounds, bounds[1:]):
+            yield piece_start, piece_end, self._count(starts, piece_start, piece_end)
+
+    def _merge(self, doc_id: Hashable, pieces: Iterable[Tuple[int, int, int]]) -> List[Span]:
+        spans = []
+        window = deque()
+        tokens = 0
+        for piece in pieces:
+            if window and tokens + piece[2] > self.chunk_tokens:
+                spans.append(Span(doc_id, window[0][0], window[-1][1], tokens))
+                # Carry whole trailing pieces over as overlap, leaving room for this one.
+                while window and (tokens > self.chunk_overlap or tokens + piece[2] > self.chunk_tokens):
+                    tokens -= window.popleft()[2]
+            window.append(piece)
+            tokens += piece[2]
+        if window:
+            spans.append(Span(doc_id, window[0][0], window[-1][1], tokens))
+        return spans
+
+
+def _char_positions(text: str, byte_offsets: np.ndarray) -> np.ndarray:
+    """Maps UTF-8 byte offsets of ``text`` to character offsets."""
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    char_of_byte = np.cumsum((data & 0xC0) != 0x80) - 1
+    return char_of_byte[byte_offsets]
@@ -0,0 +1,20 @@
+"""Top-k selection shared by ``VectorDatabase`` and the approximate indexes."""
+
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the indices of the ``k`` highest scores, best first.
+
+    Uses ``np.argpartition`` so only the selected candidates are sorted. Ties
+    keep their original order, matching a stable descending sort.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.sort(np.argpartition(scores, n - k)[n - k:])
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
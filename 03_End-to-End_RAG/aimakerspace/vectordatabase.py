@@ -1,8 +1,62 @@
 import numpy as np
-from collections import defaultdict
-from typing import List, Tuple, Callable
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Callable, Union
 from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.cache import LRUCache
+from aimakerspace.lexical import BM25Index, reciprocal_rank_fusion, weighted_fusion
+from aimakerspace.metadata import MetadataStore
+from aimakerspace.quantization import CODECS, VectorCodec
+from aimakerspace.text_store import TextStore
+from aimakerspace.topk import top_k_indices
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import copy
+import json
+import os
+import threading
+
+# Upper bound on the number of scores materialised at once by batched search.
+_SCORE_BLOCK_ELEMENTS = 1 << 24
+# Rows re-encoded at once when a codec is trained or widened.
+_ENCODE_BLOCK_ROWS = 1 << 16
+
+# On-disk index layout written by VectorDatabase.save.
+INDEX_FORMAT = "aimakerspace.vectordatabase"
+INDEX_FORMAT_VERSION = 3
+_HEADER_FILE = "header.json"
+_VECTORS_FILE = "vectors.f32"
+_NORMS_FILE = "norms.f32"
+_CODES_FILE = "codes.bin"
+_CODEC_FILE = "codec.npz"
+_METADATA_FILE = "metadata.npz"
+_KEYS_FILE = "keys.bin"
+_KEY_OFFSETS_FILE = "key_offsets.i64"
+
+
+_shard_pool: Optional[ThreadPoolExecutor] = None
+_shard_pool_lock = threading.Lock()
+
+
+def _get_shard_pool() -> ThreadPoolExecutor:
+    """Process-wide pool shared by every sharded VectorDatabase."""
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1, thread_name_prefix="vectordatabase-shard"
+            )
+        return _shard_pool
+
+
+def _unit_rows(vectors: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    norms = norms[:, None]
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _grow(array: np.ndarray, shape: Tuple[int, ...], dtype) -> np.ndarray:
+    grown = np.zeros(shape, dtype=dtype)
+    if array is not None:
+        grown[: len(array)] = array
+    return grown
 
 
 def cosine_similarity(vector_a: np.array, vector_b: np.array) -> float:
@@ -13,25 +67,703 @@ def cosine_similarity(vector_a: np.array, vector_b: np.array) -> float:
     return dot_product / (norm_a * norm_b)
 
 
+def _frozen(vector) -> np.ndarray:
+    """A read-only float32 copy, safe to hand out repeatedly from a cache."""
+    vector = np.array(vector, dtype=np.float32)
+    vector.flags.writeable = False
+    return vector
+
+
+def _filter_key(filter: Optional[Dict[str, Any]]) -> Optional[str]:
+    return None if filter is None else json.dumps(filter, sort_keys=True, default=str)
+
+
 class VectorDatabase:
-    def __init__(self, embedding_model: EmbeddingModel = None):
-        self.vectors = defaultdict(np.array)
-        self.embedding_model = embedding_model or EmbeddingModel()
+    """In-memory vector store backed by one contiguous float32 matrix.
+
+    Rows are appended in insertion order and their L2 norms are kept alongside,
+    so a cosine search is a single matrix-vector product followed by a partial
+    top-k selection.
+
+    A row's position is its integer id. Texts live in a ``TextStore`` (one
+    UTF-8 buffer plus offsets), and only the final top-k are decoded.
+    ``search_ids`` returns ids and scores without touching text at all.
+    ``append`` adds rows by id, so identical chunks from different documents
+    stay separate. The key-addressed methods (``insert_many``, ``delete``,
+    ``retrieve_from_key``) build a ``{key: id}`` dict on first use.
+
+    An optional ``index`` (see ``aimakerspace.indexes``) replaces the exhaustive
+    scan with an approximate search; pass ``exact=True`` to ``search`` to get
+    the brute-force reference results regardless.
+
+    An optional ``codec`` (see ``aimakerspace.quantization``) stores a compressed
+    copy of every unit vector and scans that instead of the float32 matrix. The
+    best ``k * rescore`` candidates are then re-scored against the full vectors.
+    With ``keep_vectors=False`` the float32 matrix is not kept at all, which
+    gives the full memory saving but disables re-scoring. The codec is
+    trained once ``codec.min_train_rows`` rows are stored (or on an explicit
+    ``train_codec``); until then rows are kept and searched as float32, so an
+    index grown one insert at a time is not coded from its first few rows.
+    With a
+    ``MatryoshkaCodec`` this is a two-stage search: a first pass over short,
+    renormalized prefixes of the vectors, then an exact re-rank of the
+    candidates on the full vectors. Raise ``rescore`` for more prefix
+    candidates and higher recall.
+
+    ``delete`` only tombstones rows, so it is O(1) per key; dead rows are
+    skipped by every search until ``compact`` rewrites the storage. Set
+    ``compact_threshold`` to compact automatically once that fraction of the
+    rows is dead.
+
+    Rows can carry a metadata dict (see ``aimakerspace.metadata``), and every
+    search accepts a ``filter`` over it. The filter is resolved to a row set
+    first and only those rows are scored, so selective filters make queries
+    cheaper. With an approximate index, filters that keep more than
+    ``filtered_scan_ratio`` of the rows go through the index with
+    over-fetching instead.
+
+    An optional ``lexical`` index (see ``aimakerspace.lexical``) keeps a BM25
+    inverted index over the keys, which are the chunk texts. ``search_lexical``
+    answers from it alone, with no embedding call, and ``search_hybrid`` fuses
+    its ranking with the dense one.
+
+    With ``shards > 1`` full scans (exact and compressed) split the rows into
+    up to ``shards`` contiguous ranges of at least ``min_shard_rows`` rows,
+    score them on a shared thread pool and merge the per-shard top-k. NumPy
+    releases the GIL inside the matrix products, so the threads run on
+    separate cores over the same memory. Results are identical to the
+    single-shard path.
+
+    ``query_cache`` (an ``aimakerspace.cache.LRUCache``) memoises query
+    embeddings for the ``*_by_text`` and hybrid searches, and ``result_cache``
+    memoises ``search_by_text`` results by ``(query, k, filter)``. The result
+    cache is cleared whenever the stored rows or the index change.
+    """
+
+    filtered_scan_ratio = 0.1
+    min_shard_rows = 1 << 14
+
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel = None,
+        index=None,
+        codec: VectorCodec = None,
+        keep_vectors: bool = True,
+        rescore: int = 4,
+        compact_threshold: float = None,
+        lexical: BM25Index = None,
+        shards: int = 1,
+        query_cache: LRUCache = None,
+        result_cache: LRUCache = None,
+    ):
+        self._embedding_model = embedding_model
+        self._embedding_model_name: Optional[str] = None
+        self._embedding_dimensions: Optional[int] = None
+        self.shards = shards
+        self.query_cache = query_cache
+        self.result_cache = result_cache
+        self.index = None
+        self.lexical = None
+        self.codec = codec
+        self.keep_vectors = keep_vectors
+        self.rescore = rescore
+        self.compact_threshold = compact_threshold
+        self._texts = TextStore()
+        self._key_index: Optional[Dict[str, int]] = None
+        self.metadata = MetadataStore()
+        self._dead = 0
+        self._dim = 0
+        self._norms = np.empty(0, dtype=np.float32)
+        self._live = np.empty(0, dtype=bool)
+        # An untrained codec cannot encode yet, so rows stay float32 until it is trained.
+        keep = keep_vectors or codec is None or not codec.is_trained
+        self._matrix = np.empty((0, 0), dtype=np.float32) if keep else None
+        self._codes: np.ndarray = None
+        if index is not None:
+            self.set_index(index)
+        if lexical is not None:
+            self.set_lexical(lexical)
+
+    def __len__(self) -> int:
+        return len(self._texts) - self._dead
+
+    @property
+    def _rows(self) -> Dict[str, int]:
+        """``{key: row}`` for the live rows, built on first key-addressed call.
+
+        A key stored more than once (see ``append``) maps to its newest row.
+        """
+        if self._key_index is None:
+            self._key_index = {
+                self._texts[row]: row for row in self._live_rows().tolist()
+            }
+        return self._key_index
+
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        """The query / document embedder, created on first use when none was given."""
+        if self._embedding_model is None:
+            settings = {"dimensions": self._embedding_dimensions}
+            if self._embedding_model_name:
+                settings["embeddings_model_name"] = self._embedding_model_name
+            self._embedding_model = EmbeddingModel(**settings)
+        return self._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, embedding_model: EmbeddingModel) -> None:
+        self._embedding_model = embedding_model
+
+    @property
+    def dimension(self) -> int:
+        return self._dim
+
+    @property
+    def vectors(self) -> Dict[str, np.ndarray]:
+        """A ``{key: vector}`` snapshot, kept for code written against the old dict storage."""
+        vectors = self._all_vectors()
+        return {key: vectors[row] for key, row in self._rows.items()}
+
+    def get_texts(self, ids: Iterable[int]) -> List[str]:
+        """The texts of the given row ids, decoded from the text store."""
+        return self._texts.get_many(np.fromiter(ids, dtype=np.int64))
+
+    def get_vectors(self, ids: Iterable[int]) -> np.ndarray:
+        """The stored vectors of the given row ids as a ``(len(ids), dim)`` matrix."""
+        return self._vectors_at(np.fromiter(ids, dtype=np.int64))
+
+    def find_ids(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Ids of the live rows whose metadata matches ``filter``."""
+        return np.flatnonzero(self._filter_mask(filter))
+
+    def insert(self, key: str, vector: np.array, metadata: Dict[str, Any] = None) -> None:
+        self.insert_many(
+            [key], np.asarray(vector).reshape(1, -1), None if metadata is None else [metadata]
+        )
+
+    def insert_many(
+        self,
+        keys: List[str],
+        vectors: np.ndarray,
+        metadata: List[Optional[Dict[str, Any]]] = None,
+    ) -> None:
+        """Inserts a batch of vectors in one copy. Existing keys are overwritten.
+
+        ``vectors`` may be any ``(n, dim)`` array-like; a C-contiguous float32
+        matrix is used as is, without an intermediate conversion.
+
+        ``metadata`` holds one dict per key; an existing row keeps its metadata
+        when the corresponding entry is ``None``.
+        """
+        vectors = self._checked(keys, vectors, metadata)
+        if vectors is None:
+            return
+
+        rows = np.empty(len(keys), dtype=np.int64)
+        key_rows = self._rows
+        new_keys = []
+        for i, key in enumerate(keys):
+            row = key_rows.get(key)
+            if row is None:
+                row = key_rows[key] = len(self._texts) + len(new_keys)
+                new_keys.append(key)
+            rows[i] = row
+
+        # When a key repeats within the batch, the last occurrence wins.
+        _, last = np.unique(rows[::-1], return_index=True)
+        keep = len(rows) - 1 - last
+        self._write(
+            rows[keep],
+            vectors[keep],
+            None if metadata is None else [metadata[i] for i in keep.tolist()],
+            new_keys,
+        )
+
+    def append(
+        self,
+        texts: List[str],
+        vectors: np.ndarray,
+        metadata: List[Optional[Dict[str, Any]]] = None,
+    ) -> np.ndarray:
+        """Adds every text as a new row and returns the rows' integer ids.
+
+        No key lookup is done, so identical texts (e.g. the same chunk in two
+        documents) get separate rows rather than overwriting each other, and
+        the texts are never hashed. Ids are dense and stable until ``compact``.
+        """
+        vectors = self._checked(texts, vectors, metadata)
+        if vectors is None:
+            return np.empty(0, dtype=np.int64)
+        rows = np.arange(len(self._texts), len(self._texts) + len(texts))
+        if self._key_index is not None:
+            self._key_index.update(zip(texts, rows.tolist()))
+        self._write(rows, vectors, metadata, list(texts))
+        return rows
+
+    def _checked(
+        self, keys: List[str], vectors: np.ndarray, metadata: Optional[List]
+    ) -> Optional[np.ndarray]:
+        """Validates an insert and returns the float32 matrix, or ``None`` when empty."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(keys):
+            raise ValueError(
+                f"Expected a ({len(keys)}, dim) matrix, got shape {vectors.shape}"
+            )
+        if metadata is not None and len(metadata) != len(keys):
+            raise ValueError(f"Expected {len(keys)} metadata entries, got {len(metadata)}")
+        if metadata is not None:
+            self.metadata.validate(metadata)
+        if len(keys) == 0:
+            return None
+        if self._dim and vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Vector dimension {vectors.shape[1]} does not match database dimension {self.dimension}"
+            )
+        if self.codec is not None:
+            self.codec.check_dimension(vectors.shape[1])
+        return vectors
+
+    def _write(
+        self,
+        rows: np.ndarray,
+        vectors: np.ndarray,
+        metadata: Optional[List[Optional[Dict[str, Any]]]],
+        new_texts: List[str],
+    ) -> None:
+        """Stores ``vectors`` at ``rows``; ``new_texts`` are the texts of rows past the current end."""
+        first_new = len(self._texts)
+        self._texts.append_many(new_texts)
+        if metadata is not None:
+            self.metadata.set(rows, metadata)
+
+        self._reserve(len(self._texts), vectors.shape[1])
+        norms = np.linalg.norm(vectors, axis=1)
+        self._norms[rows] = norms
+        self._live[rows] = True
+        if self._matrix is not None:
+            self._matrix[rows] = vectors
+        if self.codec is not None:
+            self._encode(rows, _unit_rows(vectors, norms))
+        if self.index is not None:
+            self.index.add(rows, vectors, self._fetch_unit)
+        if self.lexical is not None and new_texts:
+            # An overwritten row keeps its text, so only new rows have text to index.
+            self.lexical.add(np.arange(first_new, len(self._texts)), new_texts)
+        self._changed()
+
+    def _encode(self, rows: np.ndarray, unit: np.ndarray) -> None:
+        if not self.codec.is_trained:
+            if len(self) >= self.codec.min_train_rows:
+                self.train_codec()
+            return
+        if not self.codec.covers(unit):
+            unit_rows = self._unit_source()
+            self.codec.widen(unit)
+            self._reencode(unit_rows)
+        self._codes[rows] = self.codec.encode(unit)
+
+    def _unit_source(self) -> Callable[[int, int], np.ndarray]:
+        """``unit_rows(start, stop)`` from the float32 matrix, or decoded by the codec as it is now."""
+        if self._matrix is not None:
+            return lambda start, stop: _unit_rows(self._matrix[start:stop], self._norms[start:stop])
+        codec = copy.deepcopy(self.codec)
+        return lambda start, stop: codec.decode(self._codes[start:stop])
+
+    def _reencode(self, unit_rows: Callable[[int, int], np.ndarray]) -> None:
+        """Recomputes every row's code from ``unit_rows(start, stop)``, in blocks."""
+        for start in range(0, len(self._texts), _ENCODE_BLOCK_ROWS):
+            stop = min(start + _ENCODE_BLOCK_ROWS, len(self._texts))
+            self._codes[start:stop] = self.codec.encode(unit_rows(start, stop))
+
+    def train_codec(self) -> None:
+        """Trains the codec on the live rows and re-encodes every row.
+
+        Runs automatically once ``codec.min_train_rows`` rows are stored. Call
+        it to train on fewer rows, or to retrain after the data has drifted.
+        With ``keep_vectors=False`` the float32 matrix is dropped afterwards,
+        and later retrains learn from the decoded codes.
+        """
+        if self.codec is None:
+            raise ValueError("No codec is configured")
+        if not len(self):
+            raise ValueError("Cannot train a codec on an empty database")
+        unit_rows = self._unit_source()
+        self.codec.train(unit_rows(0, len(self._texts))[self._live_rows()])
+        self._reencode(unit_rows)
+        if not self.keep_vectors:
+            self._matrix = None
+        self._changed()
+
+    def upsert(self, items: Union[Dict[str, np.ndarray], Iterable[Tuple]]) -> None:
+        """Inserts or replaces ``(key, vector)`` or ``(key, vector, metadata)`` items.
+
+        Replaced rows are rewritten in place.
+        """
+        items = list(items.items() if isinstance(items, dict) else items)
+        if items:
+            keys = [item[0] for item in items]
+            vectors = np.stack([np.asarray(item[1]) for item in items])
+            metadata = [item[2] if len(item) > 2 else None for item in items]
+            self.insert_many(keys, vectors, metadata if any(metadata) else None)
+
+    def delete(self, keys: Union[str, Iterable[str]]) -> int:
+        """Tombstones the given keys and returns how many were present.
+
+        Deleting costs O(1) per key; the rows stay allocated until ``compact``.
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        key_rows = self._rows
+        rows = [row for row in (key_rows.pop(key, None) for key in keys) if row is not None]
+        return self._tombstone(np.asarray(rows, dtype=np.int64))
+
+    def delete_ids(self, ids: Iterable[int]) -> int:
+        """Tombstones rows by id and returns how many were live."""
+        rows = np.unique(np.fromiter(ids, dtype=np.int64))
+        rows = rows[(rows >= 0) & (rows < len(self._texts))]
+        rows = rows[self._live[rows]]
+        if self._key_index is not None:
+            for row, text in zip(rows.tolist(), self._texts.get_many(rows)):
+                if self._key_index.get(text) == row:
+                    del self._key_index[text]
+        return self._tombstone(rows)
+
+    def delete_where(self, filter: Dict[str, Any]) -> int:
+        """Tombstones every row whose metadata matches ``filter``; returns how many."""
+        return self.delete_ids(self.find_ids(filter))
+
+    def _tombstone(self, rows: np.ndarray) -> int:
+        if not len(rows):
+            return 0
+        self._live[rows] = False
+        self._dead += len(rows)
+        if self.index is not None:
+            self.index.remove(rows)
+        if self.lexical is not None:
+            self.lexical.remove(rows)
+        self._changed()
+        if (
+            self.compact_threshold is not None
+            and self._dead > self.compact_threshold * len(self._texts)
+        ):
+            self.compact()
+        return len(rows)
+
+    def compact(self) -> np.ndarray:
+        """Drops tombstoned rows, renumbering the live ones, and rebuilds the index.
+
+        Returns the old id of every surviving row, in new id order.
+        """
+        keep = self._live_rows()
+        if not self._dead:
+            return keep
+        self.metadata.take(keep, len(self._texts))
+        self._norms = self._norms[keep]
+        if self._matrix is not None:
+            self._matrix = self._matrix[keep]
+        if self._codes is not None:
+            self._codes = self._codes[keep]
+        self._live = np.ones(len(keep), dtype=bool)
+        self._texts = self._texts.take(keep)
+        self._key_index = None
+        self._dead = 0
+        if self.index is not None:
+            self.index.reset()
+            self.set_index(self.index)
+        if self.lexical is not None:
+            self.lexical.reset()
+            self.set_lexical(self.lexical)
+        self._changed()
+        return keep
+
+    def stats(self) -> Dict[str, float]:
+        """Row counts and storage footprint, live versus tombstoned."""
+        total = len(self._texts)
+        storage = [self._norms, self._live, self._matrix, self._codes]
+        return {
+            "rows": total,
+            "live": total - self._dead,
+            "dead": self._dead,
+            "dead_fraction": self._dead / total if total else 0.0,
+            "capacity": len(self._norms),
+            "dimension": self._dim,
+            "bytes": sum(a.nbytes for a in storage if a is not None),
+            "text_bytes": self._texts.nbytes,
+        }
+
+    def _changed(self) -> None:
+        """Drops cached results after any change to the rows or the index."""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    @property
+    def _coded(self) -> bool:
+        """Whether searches scan the codes, which needs a trained codec."""
+        return self.codec is not None and self.codec.is_trained
+
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._live[: len(self._texts)])
+
+    def set_index(self, index) -> None:
+        """Attaches an approximate index and feeds it every live row."""
+        self.index = index
+        self._changed()
+        if index is not None and len(self):
+            rows = self._live_rows() if self._dead else np.arange(len(self._texts))
+            index.add(rows, self._vectors_at(rows), self._fetch_unit)
+
+    def set_lexical(self, lexical: BM25Index) -> None:
+        """Attaches a BM25 index and feeds it the key of every live row."""
+        self.lexical = lexical
+        if lexical is not None and len(self):
+            rows = self._live_rows()
+            lexical.add(rows, self._texts.get_many(rows))
+
+    def _vectors_at(self, rows: np.ndarray) -> np.ndarray:
+        """Full-precision rows when kept, otherwise reconstructed from the codes."""
+        if self._matrix is not None:
+            return self._matrix[rows]
+        return self.codec.decode(self._codes[rows]) * self._norms[rows][:, None]
+
+    def _all_vectors(self) -> np.ndarray:
+        """Every allocated row, including tombstoned ones."""
+        n = len(self._texts)
+        return self._matrix[:n] if self._matrix is not None else self._vectors_at(np.arange(n))
+
+    def _fetch_unit(self, rows: np.ndarray) -> np.ndarray:
+        """Returns the given rows scaled to unit length, for index traversal."""
+        if self._matrix is None:
+            return self.codec.decode(self._codes[rows])
+        return _unit_rows(self._matrix[rows], self._norms[rows])
+
+    def _reserve(self, size: int, dim: int) -> None:
+        """Grows the backing arrays geometrically so appends are amortised O(1)."""
+        capacity = len(self._norms)
+        if dim == self._dim and size <= capacity:
+            return
+        same_dim = dim == self._dim
+        new_capacity = max(size, 2 * capacity if same_dim else 0, 16)
+        self._norms = _grow(self._norms if same_dim else None, (new_capacity,), np.float32)
+        self._live = _grow(self._live if same_dim else None, (new_capacity,), bool)
+        if self._matrix is not None:
+            self._matrix = _grow(
+                self._matrix if same_dim else None, (new_capacity, dim), np.float32
+            )
+        if self.codec is not None:
+            self._codes = _grow(
+                self._codes if same_dim else None,
+                (new_capacity, self.codec.code_size(dim)),
+                self.codec.code_dtype,
+            )
+        self._dim = dim
+
+    def _cosine_scores(self, query_vectors: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Scores a ``(q, dim)`` block of queries against every row, or just ``rows``, with one matmul."""
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if rows is None:
+            rows = slice(0, len(self._texts))
+        dots = queries @ self._matrix[rows].T
+        denom = np.linalg.norm(queries, axis=1)[:, None] * self._norms[rows]
+        return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
 
-    def insert(self, key: str, vector: np.array) -> None:
-        self.vectors[key] = vector
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        mask = self.metadata.mask(filter, len(self._texts))
+        if self._dead:
+            mask &= self._live[: len(self._texts)]
+        return mask
+
+    def _search_subset(
+        self, query: np.ndarray, rows: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores only ``rows`` (all live), e.g. the rows passing a filter."""
+        if self._matrix is None:
+            unit = _unit_rows(query[None, :], np.linalg.norm(query)[None])[0]
+            scores = self.codec.score(unit, self._codes[rows])
+        else:
+            scores = self._cosine_scores(query[None, :], rows)[0]
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+    def _search_index_filtered(
+        self, query: np.ndarray, k: int, mask: np.ndarray, selected: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Over-fetches from the approximate index in proportion to the filter's selectivity.
+
+        The fetch size doubles until ``k`` rows pass the filter; if the index runs
+        out of candidates first, the filtered rows are scanned exactly instead.
+        """
+        live = len(self)
+        fetch_k = min(live, k * int(np.ceil(live / max(selected, 1))) + k)
+        while True:
+            rows, scores = self.index.search(query, fetch_k, self._fetch_unit)
+            passed = mask[rows]
+            if np.count_nonzero(passed) >= k:
+                return rows[passed][:k], scores[passed][:k]
+            if len(rows) < fetch_k or fetch_k >= live:
+                return self._search_subset(query, np.flatnonzero(mask), k)
+            fetch_k = min(live, 2 * fetch_k)
+
+    def _search_codes(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Scans the compressed codes, then re-scores the best candidates exactly."""
+        unit = _unit_rows(query[None, :], np.linalg.norm(query)[None])[0]
+        rescore = self._matrix is not None and self.rescore > 0
+        candidates, scores = self._scan(
+            lambda start, stop: self.codec.score(unit, self._codes[start:stop])[None, :],
+            k * self.rescore if rescore else k,
+        )[0]
+        if not rescore:
+            return candidates, scores
+        exact_scores = self._fetch_unit(candidates) @ unit
+        top = top_k_indices(exact_scores, k)
+        return candidates[top], exact_scores[top]
+
+    def _top_live(self, scores: np.ndarray, k: int, start: int = 0) -> np.ndarray:
+        """``top_k_indices`` over the scores of rows ``start:``, skipping tombstoned rows.
+
+        Returned indices are relative to ``start``.
+        """
+        if not self._dead:
+            return top_k_indices(scores, k)
+        live = self._live[start:start + len(scores)]
+        scores[~live] = -np.inf
+        rows = top_k_indices(scores, k)
+        return rows[live[rows]]
+
+    def _shard_bounds(self, n: int) -> List[Tuple[int, int]]:
+        shards = max(1, min(self.shards, n // self.min_shard_rows))
+        edges = np.linspace(0, n, shards + 1).astype(np.int64).tolist()
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _scan(
+        self, score_rows: Callable[[int, int], np.ndarray], k: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top-``k`` live rows per query over every allocated row.
+
+        ``score_rows(start, stop)`` returns a ``(num_queries, stop - start)``
+        score block. Each shard keeps its own top-k, and the candidates are
+        merged in shard order so ties resolve exactly as in an unsharded scan.
+        """
+
+        def shard_top(bounds: Tuple[int, int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+            start, stop = bounds
+            tops = []
+            for scores in score_rows(start, stop):
+                rows = self._top_live(scores, k, start)
+                tops.append((rows + start, scores[rows]))
+            return tops
+
+        bounds = self._shard_bounds(len(self._texts))
+        if len(bounds) == 1:
+            return shard_top(bounds[0])
+        merged = []
+        for per_shard in zip(*_get_shard_pool().map(shard_top, bounds)):
+            rows = np.concatenate([rows for rows, _ in per_shard])
+            scores = np.concatenate([scores for _, scores in per_shard])
+            top = top_k_indices(scores, k)
+            merged.append((rows[top], scores[top]))
+        return merged
+
+    def _results(self, rows: np.ndarray, scores: np.ndarray) -> List[Tuple[str, float]]:
+        # Only the final top-k texts are ever decoded.
+        return [(self._texts[row], float(score)) for row, score in zip(rows.tolist(), scores)]
 
     def search(
         self,
         query_vector: np.array,
         k: int,
         distance_measure: Callable = cosine_similarity,
+        exact: bool = False,
+        filter: Dict[str, Any] = None,
     ) -> List[Tuple[str, float]]:
-        scores = [
-            (key, distance_measure(query_vector, vector))
-            for key, vector in self.vectors.items()
-        ]
-        return sorted(scores, key=lambda x: x[1], reverse=True)[:k]
+        mask = None if filter is None else self._filter_mask(filter)
+        if distance_measure is not cosine_similarity:
+            vectors = self._all_vectors()
+            rows = self._live_rows() if mask is None else np.flatnonzero(mask)
+            scores = [(row, distance_measure(query_vector, vectors[row])) for row in rows.tolist()]
+            top = sorted(scores, key=lambda x: x[1], reverse=True)[:k]
+            return [(self._texts[row], score) for row, score in top]
+
+        return self._results(*self.search_ids(query_vector, k, exact, filter, mask))
+
+    def search_ids(
+        self,
+        query_vector: np.array,
+        k: int,
+        exact: bool = False,
+        filter: Dict[str, Any] = None,
+        _mask: np.ndarray = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Cosine top-k as ``(ids, scores)`` arrays, without decoding any text."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        mask = _mask if _mask is not None or filter is None else self._filter_mask(filter)
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        return self._search_rows(query, k, exact, mask)
+
+    def _search_rows(
+        self, query: np.ndarray, k: int, exact: bool, mask: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Cosine top-k as ``(rows, scores)``, picking the cheapest exact or approximate path."""
+        if mask is not None:
+            selected = np.flatnonzero(mask)
+            if self.index is None or exact or len(selected) <= self.filtered_scan_ratio * len(self):
+                rows, scores = self._search_subset(query, selected, k)
+            else:
+                rows, scores = self._search_index_filtered(query, k, mask, len(selected))
+        elif self.index is not None and not exact:
+            rows, scores = self.index.search(query, k, self._fetch_unit)
+        elif self._coded:
+            rows, scores = self._search_codes(query, k)
+        else:
+            rows, scores = self._scan(
+                lambda start, stop: self._cosine_scores(query[None, :], slice(start, stop)), k
+            )[0]
+        return rows, scores
+
+    def search_many(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        exact: bool = False,
+        filter: Dict[str, Any] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """Searches a batch of query vectors, returning one top-k list per query.
+
+        Exact cosine scoring for the whole batch is a single matrix-matrix
+        product, computed in blocks of queries so the score matrix stays bounded.
+        A ``filter`` applies to every query.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim != 2:
+            raise ValueError(
+                f"query_vectors must be a (num_queries, dim) matrix, got shape {queries.shape}"
+            )
+        if (
+            distance_measure is not cosine_similarity
+            or (self.index is not None and not exact)
+            or self._coded
+        ):
+            return [
+                self.search(query, k, distance_measure, exact, filter) for query in queries
+            ]
+        if not len(self):
+            return [[] for _ in range(len(queries))]
+
+        selected = None if filter is None else np.flatnonzero(self._filter_mask(filter))
+        results = []
+        block = max(1, _SCORE_BLOCK_ELEMENTS // len(self._texts))
+        for start in range(0, len(queries), block):
+            batch = queries[start:start + block]
+            if selected is None:
+                for rows, scores in self._scan(
+                    lambda a, b: self._cosine_scores(batch, slice(a, b)), k
+                ):
+                    results.append(self._results(rows, scores))
+                continue
+            for scores in self._cosine_scores(batch, selected):
+                top = top_k_indices(scores, k)
+                results.append(self._results(selected[top], scores[top]))
+        return results
 
     def search_by_text(
         self,
@@ -39,18 +771,368 @@ class VectorDatabase:
         k: int,
         distance_measure: Callable = cosine_similarity,
         return_as_text: bool = False,
+        filter: Dict[str, Any] = None,
     ) -> List[Tuple[str, float]]:
-        query_vector = self.embedding_model.get_embedding(query_text)
-        results = self.search(query_vector, k, distance_measure)
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = (query_text, k, _filter_key(filter), distance_measure)
+            results = self.result_cache.get(cache_key)
+            if results is not None:
+                return [result[0] for result in results] if return_as_text else list(results)
+        results = self.search(self._embed_query(query_text), k, distance_measure, filter=filter)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, tuple(results))
         return [result[0] for result in results] if return_as_text else results
 
+    def _embed_query(self, query_text: str) -> np.ndarray:
+        if self.query_cache is None:
+            return self.embedding_model.get_embedding(query_text)
+        vector = self.query_cache.get(query_text)
+        if vector is None:
+            vector = _frozen(self.embedding_model.get_embedding(query_text))
+            self.query_cache.put(query_text, vector)
+        return vector
+
+    def _cached_queries(self, query_texts: List[str]) -> Tuple[List, List[str]]:
+        """Looks every query up in ``query_cache``; returns the vectors found and the distinct misses."""
+        if self.query_cache is None:
+            return [None] * len(query_texts), list(query_texts)
+        vectors = [self.query_cache.get(text) for text in query_texts]
+        misses = list(dict.fromkeys(t for t, v in zip(query_texts, vectors) if v is None))
+        return vectors, misses
+
+    def _fill_queries(
+        self, query_texts: List[str], vectors: List, misses: List[str], embeddings
+    ) -> np.ndarray:
+        if self.query_cache is None:
+            return embeddings
+        fetched = {text: _frozen(vector) for text, vector in zip(misses, embeddings)}
+        for text, vector in fetched.items():
+            self.query_cache.put(text, vector)
+        return np.stack([
+            fetched[text] if vector is None else vector
+            for text, vector in zip(query_texts, vectors)
+        ])
+
+    def search_many_by_text(
+        self,
+        query_texts: List[str],
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        return_as_text: bool = False,
+        filter: Dict[str, Any] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        if not query_texts:
+            return []
+        vectors, misses = self._cached_queries(query_texts)
+        embeddings = self.embedding_model.get_embeddings(misses) if misses else []
+        query_vectors = self._fill_queries(query_texts, vectors, misses, embeddings)
+        return self._format_many(
+            self.search_many(query_vectors, k, distance_measure, filter=filter), return_as_text
+        )
+
+    async def asearch_many_by_text(
+        self,
+        query_texts: List[str],
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        return_as_text: bool = False,
+        filter: Dict[str, Any] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        if not query_texts:
+            return []
+        vectors, misses = self._cached_queries(query_texts)
+        embeddings = await self.embedding_model.async_get_embeddings(misses) if misses else []
+        query_vectors = self._fill_queries(query_texts, vectors, misses, embeddings)
+        return self._format_many(
+            self.search_many(query_vectors, k, distance_measure, filter=filter), return_as_text
+        )
+
+    def _lexical_rows(
+        self, query_text: str, k: int, mask: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if self.lexical is None:
+            raise ValueError("Lexical search needs a BM25Index; pass lexical= or call set_lexical")
+        scores = self.lexical.scores(query_text, len(self._texts))
+        if mask is not None:
+            scores[~mask] = 0
+        rows = top_k_indices(scores, k)
+        rows = rows[scores[rows] > 0]
+        return rows, scores[rows]
+
+    def search_lexical(
+        self,
+        query_text: str,
+        k: int,
+        return_as_text: bool = False,
+        filter: Dict[str, Any] = None,
+    ) -> List[Tuple[str, float]]:
+        """BM25-only search over the keys. Makes no embedding call.
+
+        Only rows sharing at least one term with the query are returned, so
+        fewer than ``k`` results are possible.
+        """
+        mask = None if filter is None else self._filter_mask(filter)
+        results = self._results(*self._lexical_rows(query_text, k, mask))
+        return [result[0] for result in results] if return_as_text else results
+
+    def search_hybrid(
+        self,
+        query_text: str,
+        k: int,
+        fusion: str = "rrf",
+        alpha: float = 0.5,
+        candidates: int = None,
+        rrf_k: int = 60,
+        return_as_text: bool = False,
+        filter: Dict[str, Any] = None,
+        query_vector: np.ndarray = None,
+    ) -> List[Tuple[str, float]]:
+        """Fuses the dense and BM25 rankings of the top ``candidates`` rows of each.
+
+        ``fusion="rrf"`` uses reciprocal-rank fusion, ``1 / (rrf_k + rank)``
+        summed over both lists, and needs no score calibration.
+        ``fusion="weighted"`` min-max normalises each list and combines them as
+        ``alpha * dense + (1 - alpha) * lexical``. Returned scores are the fused
+        ones. Pass ``query_vector`` to reuse an embedding already computed.
+        """
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion '{fusion}', expected 'rrf' or 'weighted'")
+        if not len(self):
+            return []
+        candidates = max(k, candidates or 4 * k)
+        mask = None if filter is None else self._filter_mask(filter)
+        lexical = self._lexical_rows(query_text, candidates, mask)
+        if query_vector is None:
+            query_vector = self._embed_query(query_text)
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        dense = self._search_rows(query, candidates, False, mask)
+        if fusion == "rrf":
+            rows, scores = reciprocal_rank_fusion([dense[0], lexical[0]], rrf_k)
+        else:
+            rows, scores = weighted_fusion([dense, lexical], [alpha, 1 - alpha])
+        results = self._results(rows[:k], scores[:k])
+        return [result[0] for result in results] if return_as_text else results
+
+    @staticmethod
+    def _format_many(results: List[List[Tuple[str, float]]], return_as_text: bool):
+        if not return_as_text:
+            return results
+        return [[result[0] for result in query_results] for query_results in results]
+
     def retrieve_from_key(self, key: str) -> np.array:
-        return self.vectors.get(key, None)
+        row = self._rows.get(key)
+        return None if row is None else self._vectors_at(np.array([row]))[0]
+
+    def retrieve_metadata(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._rows.get(key)
+        return None if row is None else self.metadata.get(row)
+
+    def save(self, path: str) -> None:
+        """Writes the index to the directory ``path``.
+
+        Layout (version 3):
+
+        - ``header.json``: format, version, embedding model name and requested
+          dimensions, dimension, row count, whether full vectors are stored,
+          and the codec description
+        - ``vectors.f32``: row-major little-endian float32 matrix of shape
+          ``(count, dimension)``, present unless the database was built with
+          ``keep_vectors=False``
+        - ``norms.f32``: float32 L2 norm of every row
+        - ``keys.bin`` / ``key_offsets.i64``: UTF-8 keys concatenated, with ``count + 1`` int64 offsets
+        - ``codes.bin`` / ``codec.npz``: raw code matrix and codec state, when
+          a codec is configured (no codes while it is still untrained)
+        - ``metadata.npz``: one array per metadata column, described in the header
+
+        Version 1 and 2 indexes (no codec or metadata) still load.
+
+        Every file is written to a temporary name and renamed into place, and the
+        header is written last, so an interrupted save never leaves a readable
+        but inconsistent index.
+        """
+        os.makedirs(path, exist_ok=True)
+        # Tombstoned rows are not written, so a saved index is always compact.
+        rows = self._live_rows() if self._dead else slice(0, len(self._texts))
+        texts = self._texts.take(rows) if self._dead else self._texts
+        n = len(texts)
+        text_buffer, offsets = texts.buffers()
+
+        if self._matrix is not None:
+            self._write_atomic(path, _VECTORS_FILE, self._matrix[rows].astype("<f4", copy=False))
+        self._write_atomic(path, _NORMS_FILE, self._norms[rows].astype("<f4", copy=False))
+        self._write_atomic(path, _KEYS_FILE, text_buffer)
+        self._write_atomic(path, _KEY_OFFSETS_FILE, offsets.astype("<i8", copy=False))
+
+        codec_header = None
+        if self.codec is not None:
+            code_dtype = np.dtype(self.codec.code_dtype).newbyteorder("<")
+            params, arrays = self.codec.state()
+            codec_header = {
+                "name": self.codec.name,
+                "params": params,
+                "dtype": code_dtype.str,
+                "code_size": self.codec.code_size(self.dimension),
+            }
+            if n and self.codec.is_trained:
+                self._write_atomic(path, _CODES_FILE, self._codes[rows].astype(code_dtype, copy=False))
+            with open(os.path.join(path, _CODEC_FILE + ".tmp"), "wb") as f:
+                np.savez(f, **{name: a for name, a in arrays.items() if a is not None})
+            os.replace(os.path.join(path, _CODEC_FILE + ".tmp"), os.path.join(path, _CODEC_FILE))
+
+        metadata_header, metadata_arrays = self.metadata.state(rows, len(self._texts))
+        if metadata_header:
+            with open(os.path.join(path, _METADATA_FILE + ".tmp"), "wb") as f:
+                np.savez(f, **metadata_arrays)
+            os.replace(
+                os.path.join(path, _METADATA_FILE + ".tmp"), os.path.join(path, _METADATA_FILE)
+            )
+
+        header = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_FORMAT_VERSION,
+            "embedding_model": (
+                getattr(self._embedding_model, "embeddings_model_name", None)
+                if self._embedding_model is not None
+                else self._embedding_model_name
+            ),
+            "embedding_dimensions": (
+                getattr(self._embedding_model, "dimensions", None)
+                if self._embedding_model is not None
+                else self._embedding_dimensions
+            ),
+            "dimension": self.dimension if n else 0,
+            "count": n,
+            "vectors": self._matrix is not None,
+            "keep_vectors": self.keep_vectors,
+            "codec": codec_header,
+            "metadata": metadata_header,
+        }
+        self._write_atomic(path, _HEADER_FILE, json.dumps(header, indent=2).encode("utf-8"))
+
+    @staticmethod
+    def _write_atomic(directory: str, name: str, data) -> None:
+        target = os.path.join(directory, name)
+        with open(target + ".tmp", "wb") as f:
+            if isinstance(data, np.ndarray):
+                np.ascontiguousarray(data).tofile(f)
+            else:
+                f.write(data)
+        os.replace(target + ".tmp", target)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        mmap: bool = True,
+        embedding_model: EmbeddingModel = None,
+        index=None,
+        lexical: BM25Index = None,
+        shards: int = 1,
+    ) -> "VectorDatabase":
+        """Opens an index written by ``save``.
+
+        With ``mmap=True`` the vector, norm and code files are mapped copy-on-write via
+        ``np.memmap``: nothing is read until a search touches it, pages are shared
+        with other processes through the OS page cache, and later inserts never
+        modify the files on disk. With ``mmap=False`` they are read into memory.
+
+        When no ``embedding_model`` is given, one is created for the model named in
+        the header the first time it is needed; passing a model with a different name raises ``ValueError``.
+        An ``index`` and a ``lexical`` index are built over the loaded rows
+        before returning.
+        """
+        with open(os.path.join(path, _HEADER_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != INDEX_FORMAT:
+            raise ValueError(f"'{path}' is not a VectorDatabase index")
+        if header.get("version", 0) > INDEX_FORMAT_VERSION:
+            raise ValueError(
+                f"Index version {header['version']} is newer than supported version {INDEX_FORMAT_VERSION}"
+            )
+
+        model_name = header.get("embedding_model")
+        model_dimensions = header.get("embedding_dimensions")
+        if embedding_model is not None:
+            if model_name and getattr(embedding_model, "embeddings_model_name", model_name) != model_name:
+                raise ValueError(
+                    f"Index was built with '{model_name}', not '{embedding_model.embeddings_model_name}'"
+                )
+            if model_dimensions and getattr(embedding_model, "dimensions", model_dimensions) != model_dimensions:
+                raise ValueError(
+                    f"Index was built with {model_dimensions}-dimensional embeddings, "
+                    f"not {embedding_model.dimensions or 'full-length'}"
+                )
+
+        codec_header = header.get("codec")
+        codec = None
+        if codec_header:
+            with np.load(os.path.join(path, _CODEC_FILE)) as arrays:
+                codec = CODECS[codec_header["name"]].from_state(
+                    codec_header["params"], dict(arrays)
+                )
+        has_vectors = header.get("vectors", True)
+        db = cls(
+            embedding_model,
+            codec=codec,
+            keep_vectors=header.get("keep_vectors", has_vectors),
+            shards=shards,
+        )
+        db._embedding_model_name = model_name
+        db._embedding_dimensions = model_dimensions
+        n, dim = header["count"], header["dimension"]
+        if n == 0:
+            db.set_index(index)
+            db.set_lexical(lexical)
+            return db
+
+        def read_array(name: str, dtype: str, shape: Tuple[int, ...]) -> np.ndarray:
+            file_path = os.path.join(path, name)
+            if mmap:
+                return np.memmap(file_path, dtype=dtype, mode="c", shape=shape)
+            return np.fromfile(file_path, dtype=dtype).reshape(shape)
+
+        db._dim = dim
+        db._norms = read_array(_NORMS_FILE, "<f4", (n,))
+        db._live = np.ones(n, dtype=bool)
+        if has_vectors:
+            db._matrix = read_array(_VECTORS_FILE, "<f4", (n, dim))
+        if codec is not None and codec.is_trained:
+            db._codes = read_array(
+                _CODES_FILE, codec_header["dtype"], (n, codec_header["code_size"])
+            )
+        # Texts stay encoded (and, with mmap, on disk) until a result needs them.
+        offsets = np.fromfile(os.path.join(path, _KEY_OFFSETS_FILE), dtype="<i8")
+        keys_path = os.path.join(path, _KEYS_FILE)
+        if mmap and offsets[-1]:
+            text_buffer = np.memmap(keys_path, dtype=np.uint8, mode="r", shape=(int(offsets[-1]),))
+        else:
+            with open(keys_path, "rb") as f:
+                text_buffer = bytearray(f.read())
+        db._texts = TextStore(text_buffer, offsets)
+        if header.get("metadata"):
+            with np.load(os.path.join(path, _METADATA_FILE)) as arrays:
+                db.metadata = MetadataStore.from_state(header["metadata"], dict(arrays))
+        db.set_index(index)
+        db.set_lexical(lexical)
+        return db
+
+    async def abuild_from_list(
+        self,
+        list_of_text: List[str],
+        metadata: List[Optional[Dict[str, Any]]] = None,
+        embeddings: np.ndarray = None,
+    ) -> "VectorDatabase":
+        """Embeds and inserts ``list_of_text``.
 
-    async def abuild_from_list(self, list_of_text: List[str]) -> "VectorDatabase":
-        embeddings = await self.embedding_model.async_get_embeddings(list_of_text)
-        for text, embedding in zip(list_of_text, embeddings):
-            self.insert(text, np.array(embedding))
+        Pass ``embeddings`` (e.g. a float32 matrix from a base64 ``EmbeddingModel``)
+        to skip the embedding call; a float32 matrix is inserted without conversion.
+        """
+        if not list_of_text:
+            return self
+        if embeddings is None:
+            embeddings = await self.embedding_model.async_get_embeddings(list_of_text)
+        self.insert_many(list_of_text, np.asarray(embeddings, dtype=np.float32), metadata)
         return self
 
 
@@ -0,0 +1,226 @@
+"""A local stand-in for the OpenAI embeddings and chat completions endpoints.
+
+Responses are deterministic: an embedding is a unit vector seeded by a hash
+of the input text, and a chat reply is built from a hash of the messages.
+Latency and a requests-per-minute limit are configurable, so client-side
+batching, concurrency and retry behaviour can be measured offline.
+
+Run standalone with::
+
+    python -m benchmarks.fake_openai_server --port 8011 --latency 0.05 --rpm 3000
+
+then point the SDK at it with ``OPENAI_BASE_URL=http://127.0.0.1:8011/v1``.
+"""
+
+import argparse
+import base64
+import collections
+import contextlib
+import hashlib
+import json
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+_WORDS = (
+    "the aid program grant loan student award school year federal cost "
+    "eligible verification income family period payment office rule"
+).split()
+
+
+@dataclass
+class FakeServerConfig:
+    dimensions: int = 1536
+    latency: float = 0.0  # seconds added to every request
+    latency_per_input: float = 0.0  # seconds added per embedding input
+    token_latency: float = 0.0  # seconds between streamed chat chunks
+    reply_words: int = 64
+    rpm: Optional[int] = None  # requests per minute before answering 429
+
+
+def fake_embedding(text: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_reply(messages: List[dict], words: int) -> str:
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+    return " ".join(_WORDS[digest[i % len(digest)] % len(_WORDS)] for i in range(words))
+
+
+class _RateLimiter:
+    def __init__(self, rpm: Optional[int]):
+        self.rpm = rpm
+        self._requests = collections.deque()
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """Seconds until the next request is allowed, or 0 and the request is counted."""
+        if self.rpm is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            while self._requests and now - self._requests[0] >= 60:
+                self._requests.popleft()
+            if len(self._requests) >= self.rpm:
+                return 60 - (now - self._requests[0])
+            self._requests.append(now)
+            return 0.0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeOpenAIServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.count("requests")
+        wait = self.server.limiter.retry_after()
+        if wait:
+            self.server.count("rate_limited")
+            return self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after-ms": str(int(wait * 1000))},
+            )
+        time.sleep(self.server.config.latency)
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(body)
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _embeddings(self, body: dict) -> None:
+        config = self.server.config
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        time.sleep(config.latency_per_input * len(inputs))
+        dimensions = body.get("dimensions") or config.dimensions
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(str(text), dimensions)
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self.server.count("embedded", len(inputs))
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat(self, body: dict) -> None:
+        config = self.server.config
+        reply = fake_reply(body.get("messages", []), config.reply_words)
+        completion_id, created, model = f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), body.get("model")
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": config.reply_words, "total_tokens": config.reply_words},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: dict, finish_reason: Optional[str] = None) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for i, word in enumerate(reply.split(" ")):
+            time.sleep(config.token_latency)
+            event({"content": word if i == 0 else " " + word})
+        event({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: FakeServerConfig, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.config = config
+        self.limiter = _RateLimiter(config.rpm)
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += n
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+@contextlib.contextmanager
+def serve(config: FakeServerConfig = None, port: int = 0) -> Iterator[FakeOpenAIServer]:
+    """Runs a server on a background thread for the duration of the ``with`` block."""
+    server = FakeOpenAIServer(config or FakeServerConfig(), port=port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-per-input", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None)
+    args = parser.parse_args()
+    config = FakeServerConfig(
+        dimensions=args.dimensions,
+        latency=args.latency,
+        latency_per_input=args.latency_per_input,
+        token_latency=args.token_latency,
+        rpm=args.rpm,
+    )
+    server = FakeOpenAIServer(config, port=args.port)
+    print(f"Serving fake OpenAI API at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Import-time budget for ``aimakerspace``, measured with ``python -X importtime``.
+
+Each module is imported in a fresh interpreter. The check fails when a
+module's cumulative import time exceeds its budget in ``BUDGETS_MS``, or
+when importing it pulls in a dependency that should only load on first use
+(the OpenAI SDK, ``httpx``, ``dotenv``, ``tiktoken``, ``PyPDF2``, and NumPy
+for the modules in ``NUMPY_FREE``).
+
+From ``03_End-to-End_RAG``::
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 250 --repeat 5
+
+Exits non-zero when any module is over budget, so it can gate CI.
+``tests/test_import_time.py`` runs the same check under pytest.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Cumulative import time allowed per module, in ms. NumPy alone takes about 60-90 ms,
+# and asyncio about 35 ms; everything else should add little on top.
+BUDGETS_MS: Dict[str, float] = {
+    "aimakerspace.text_utils": 20.0,
+    "aimakerspace.cache": 20.0,
+    "aimakerspace.openai_utils.chatmodel": 100.0,
+    "aimakerspace.vectordatabase": 250.0,
+    "aimakerspace.openai_utils.embedding": 250.0,
+    "aimakerspace.openai_utils.response_cache": 250.0,
+    "aimakerspace.ingestion": 275.0,
+    "aimakerspace.reindex": 275.0,
+}
+MODULES = list(BUDGETS_MS)
+
+# Only imported on first use: creating a client, counting tokens or reading a PDF.
+DEFERRED = ("openai", "httpx", "dotenv", "tiktoken", "PyPDF2")
+# Loaders, CharacterTextSplitter and the caches do not need NumPy.
+NUMPY_FREE = ("aimakerspace.text_utils", "aimakerspace.cache")
+
+
+def import_profile(module: str) -> Tuple[float, Dict[str, float]]:
+    """Imports ``module`` in a fresh interpreter; returns its cumulative ms and every module's self ms."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_ROOT, capture_output=True, text=True, check=True,
+    )
+    total, self_ms = 0.0, {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        self_ms[name] = int(own) / 1000
+        if name == module:
+            total = int(cumulative) / 1000
+    return total, self_ms
+
+
+def eager_imports(module: str, self_ms: Dict[str, float]) -> List[str]:
+    """The deferred dependencies that importing ``module`` loaded."""
+    deferred = DEFERRED + ("numpy",) if module in NUMPY_FREE else DEFERRED
+    return sorted(name for name in self_ms if name in deferred)
+
+
+def best_profile(module: str, repeat: int) -> Tuple[float, Dict[str, float]]:
+    # The fastest of a few runs discards noise from a cold page cache.
+    profiles = [import_profile(module) for _ in range(repeat)]
+    return min(profiles, key=lambda profile: profile[0])
+
+
+def check(modules: List[str], budget_ms: Optional[float], repeat: int) -> List[str]:
+    failures = []
+    for module in modules:
+        total, self_ms = best_profile(module, repeat)
+        deferred = eager_imports(module, self_ms)
+        slowest = sorted(self_ms.items(), key=lambda item: -item[1])[:3]
+        print(f"{module:<40} {total:>8.1f} ms   slowest: "
+              + ", ".join(f"{name} {ms:.1f}" for name, ms in slowest))
+        budget = budget_ms if budget_ms is not None else BUDGETS_MS.get(module, 250.0)
+        if total > budget:
+            failures.append(f"{module} took {total:.1f} ms, budget is {budget:.0f} ms")
+        if deferred:
+            failures.append(f"{module} imports {', '.join(deferred)} eagerly")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check aimakerspace import times")
+    parser.add_argument("--budget-ms", type=float, default=None, help="one budget for every module")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+    failures = check(args.modules, args.budget_ms, args.repeat)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Offline benchmarks for ``aimakerspace``, run against the fake OpenAI server.
+
+From ``03_End-to-End_RAG``::
+
+    python -m benchmarks.run_benchmarks --out results.json
+    python -m benchmarks.run_benchmarks --out new.json --compare results.json
+
+Results are written as JSON: a ``meta`` block (git commit, versions, the
+configuration used) and a ``results`` block of plain numbers, so two runs
+can be diffed with ``--compare`` or any JSON tool.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.fake_openai_server import FakeServerConfig, serve
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEXT = os.path.join(_HERE, "..", "..", "02_Embeddings_and_RAG", "data", "PMarcaBlogs.txt")
+
+RAG_SYSTEM_TEMPLATE = (
+    "You are a helpful assistant. Answer using only the provided context. "
+    "If the context does not contain the answer, say you don't know."
+)
+RAG_USER_TEMPLATE = "Context:\n{context}\n\nQuestion:\n{user_query}"
+
+QUERIES = [
+    "What is the most important factor in a startup's success?",
+    "How should founders think about hiring?",
+    "What does product/market fit mean?",
+    "Why do big companies have trouble innovating?",
+]
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    samples = np.asarray(samples_ms)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+    }
+
+
+def timed_ms(function: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def load_chunks(path: str, limit: int = None) -> List[str]:
+    from aimakerspace.text_utils import CharacterTextSplitter, TextFileLoader
+
+    chunks = CharacterTextSplitter().split_texts(TextFileLoader(path).load_documents())
+    return chunks[:limit] if limit else chunks
+
+
+def bench_splitter(path: str, repeat: int) -> Dict[str, float]:
+    from aimakerspace.text_utils import CharacterTextSplitter, TextFileLoader
+
+    documents = TextFileLoader(path).load_documents()
+    size_mb = sum(len(document.encode("utf-8")) for document in documents) / 1e6
+    splitter = CharacterTextSplitter()
+    chunks = splitter.split_texts(documents)
+    samples = timed_ms(lambda: splitter.split_texts(documents), repeat)
+    seconds = float(np.median(samples)) / 1000
+    return {
+        "input_mb": size_mb,
+        "chunks": len(chunks),
+        "mb_per_s": size_mb / seconds,
+        "chunks_per_s": len(chunks) / seconds,
+        **percentiles(samples),
+    }
+
+
+def bench_build(chunks: List[str]) -> Dict[str, float]:
+    from aimakerspace.vectordatabase import VectorDatabase
+
+    vector_db = VectorDatabase()
+    started = time.perf_counter()
+    asyncio.run(vector_db.abuild_from_list(chunks))
+    seconds = time.perf_counter() - started
+    return {"chunks": len(chunks), "seconds": seconds, "chunks_per_s": len(chunks) / seconds}
+
+
+def bench_search(size: int, dim: int, queries: int, k: int, seed: int = 0) -> Dict[str, float]:
+    from aimakerspace.vectordatabase import VectorDatabase
+
+    rng = np.random.default_rng(seed)
+    vector_db = VectorDatabase()
+    block = 100_000
+    for start in range(0, size, block):
+        count = min(block, size - start)
+        vector_db.insert_many(
+            [str(i) for i in range(start, start + count)],
+            rng.standard_normal((count, dim), dtype=np.float32),
+        )
+    query_vectors = rng.standard_normal((queries, dim), dtype=np.float32)
+    vector_db.search(query_vectors[0], k)  # warm-up
+    samples = []
+    for query in query_vectors:
+        started = time.perf_counter()
+        vector_db.search(query, k)
+        samples.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    vector_db.search_many(query_vectors, k)
+    batch_seconds = time.perf_counter() - started
+    return {
+        "vectors": size,
+        "dimension": dim,
+        "queries": queries,
+        **percentiles(samples),
+        "search_many_qps": queries / batch_seconds,
+    }
+
+
+def bench_rag(chunks: List[str], repeat: int, k: int) -> Dict[str, float]:
+    from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+    from aimakerspace.openai_utils.prompts import SystemRolePrompt, UserRolePrompt
+    from aimakerspace.vectordatabase import VectorDatabase
+
+    vector_db = asyncio.run(VectorDatabase().abuild_from_list(chunks))
+    chat = ChatOpenAI()
+    system_prompt = SystemRolePrompt(RAG_SYSTEM_TEMPLATE)
+    user_prompt = UserRolePrompt(RAG_USER_TEMPLATE)
+
+    def answer(query: str) -> str:
+        context = "\n\n".join(vector_db.search_by_text(query, k=k, return_as_text=True))
+        messages = [
+            system_prompt.create_message(),
+            user_prompt.create_message(context=context, user_query=query),
+        ]
+        return chat.run(messages)
+
+    samples = []
+    for i in range(repeat):
+        query = QUERIES[i % len(QUERIES)]
+        samples.extend(timed_ms(lambda: answer(query), 1))
+    return {"queries": repeat, **percentiles(samples)}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=_HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for name, value in results.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, key + "."))
+        elif isinstance(value, (int, float)):
+            flat[key] = value
+    return flat
+
+
+def compare(old_path: str, new: dict) -> None:
+    """Prints every metric present in both runs with its ratio new / old."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = _flatten(json.load(f)["results"])
+    current = _flatten(new["results"])
+    print(f"{'metric':<48} {'old':>12} {'new':>12} {'new/old':>8}")
+    for key in sorted(old.keys() & current.keys()):
+        ratio = current[key] / old[key] if old[key] else float("nan")
+        print(f"{key:<48} {old[key]:>12.4g} {current[key]:>12.4g} {ratio:>8.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline aimakerspace benchmarks")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--text", default=DEFAULT_TEXT, help="corpus for the splitter, build and RAG runs")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000],
+        help="index sizes for the search benchmark; 1000000 at 1536 dims needs ~6 GB",
+    )
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--build-chunks", type=int, default=2000)
+    parser.add_argument("--rag-queries", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server latency per request (s)")
+    parser.add_argument("--latency-per-input", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None, help="fake server requests-per-minute limit")
+    parser.add_argument(
+        "--only", nargs="+", choices=["splitter", "build", "search", "rag"],
+        default=["splitter", "build", "search", "rag"],
+    )
+    args = parser.parse_args()
+
+    config = FakeServerConfig(
+        dimensions=args.dim,
+        latency=args.latency,
+        latency_per_input=args.latency_per_input,
+        rpm=args.rpm,
+    )
+    results: Dict[str, dict] = {}
+    with serve(config) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "sk-fake-benchmark"
+        if "splitter" in args.only:
+            results["splitter"] = bench_splitter(args.text, repeat=20)
+            print("splitter", results["splitter"])
+        if "build" in args.only:
+            results["build"] = bench_build(load_chunks(args.text, args.build_chunks))
+            print("build", results["build"])
+        if "search" in args.only:
+            results["search"] = {
+                str(size): bench_search(size, args.dim, args.queries, args.k) for size in args.sizes
+            }
+            print("search", results["search"])
+        if "rag" in args.only:
+            results["rag"] = bench_rag(load_chunks(args.text, 500), args.rag_queries, args.k)
+            print("rag", results["rag"])
+        server_stats = dict(server.stats)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": vars(args),
+            "server": server_stats,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
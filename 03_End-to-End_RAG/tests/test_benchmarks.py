@@ -0,0 +1,85 @@
+import base64
+import json
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from benchmarks.fake_openai_server import FakeServerConfig, fake_embedding, fake_reply, serve
+from benchmarks.import_time import _ROOT
+from benchmarks.run_benchmarks import bench_search
+
+
+def post(server, path, body):
+    request = urllib.request.Request(
+        server.base_url + path,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode("utf-8")
+
+
+def test_embeddings_are_deterministic_unit_vectors_in_both_encodings():
+    with serve(FakeServerConfig(dimensions=32)) as server:
+        floats = json.loads(post(server, "/embeddings", {"input": ["a", "b"], "model": "m"}))
+        body = {"input": "a", "model": "m", "encoding_format": "base64", "dimensions": 8}
+        packed = json.loads(post(server, "/embeddings", body))
+    vectors = np.array([item["embedding"] for item in floats["data"]], dtype=np.float32)
+    np.testing.assert_array_equal(vectors, np.stack([fake_embedding("a", 32), fake_embedding("b", 32)]))
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-6)
+    decoded = np.frombuffer(base64.b64decode(packed["data"][0]["embedding"]), dtype="<f4")
+    np.testing.assert_array_equal(decoded, fake_embedding("a", 8))
+
+
+def test_streamed_chat_reply_equals_the_plain_one():
+    messages = [{"role": "user", "content": "hello"}]
+    with serve(FakeServerConfig(reply_words=12)) as server:
+        plain = json.loads(post(server, "/chat/completions", {"model": "m", "messages": messages}))
+        stream = post(server, "/chat/completions", {"model": "m", "messages": messages, "stream": True})
+    pieces = [
+        json.loads(line[len("data: "):])["choices"][0]["delta"].get("content") or ""
+        for line in stream.splitlines()
+        if line.startswith("data: {")
+    ]
+    assert plain["choices"][0]["message"]["content"] == "".join(pieces) == fake_reply(messages, 12)
+    assert stream.rstrip().endswith("data: [DONE]")
+
+
+def test_requests_over_the_limit_get_429_with_a_retry_hint():
+    with serve(FakeServerConfig(dimensions=4, rpm=2)) as server:
+        for _ in range(2):
+            post(server, "/embeddings", {"input": "x", "model": "m"})
+        with pytest.raises(urllib.error.HTTPError) as raised:
+            post(server, "/embeddings", {"input": "x", "model": "m"})
+        assert raised.value.code == 429
+        assert 0 < int(raised.value.headers["retry-after-ms"]) <= 60_000
+        assert (server.stats["requests"], server.stats["rate_limited"]) == (3, 1)
+
+
+def test_bench_search_reports_latency_percentiles():
+    result = bench_search(size=2000, dim=16, queries=10, k=4)
+    assert (result["vectors"], result["dimension"], result["queries"]) == (2000, 16, 10)
+    assert 0 < result["p50_ms"] <= result["p99_ms"] and result["search_many_qps"] > 0
+
+
+def test_runner_writes_comparable_reports(tmp_path):
+    corpus = tmp_path / "corpus.txt"
+    corpus.write_text("Startups hire slowly and fire quickly. " * 400, encoding="utf-8")
+    common = [
+        sys.executable, "-m", "benchmarks.run_benchmarks", "--text", str(corpus), "--dim", "16",
+        "--sizes", "500", "--queries", "5", "--build-chunks", "20", "--rag-queries", "2", "--latency", "0",
+    ]
+    first, second = tmp_path / "first.json", tmp_path / "second.json"
+    subprocess.run(common + ["--out", str(first)], cwd=_ROOT, check=True, capture_output=True)
+    completed = subprocess.run(
+        common + ["--out", str(second), "--compare", str(first), "--only", "search"],
+        cwd=_ROOT, check=True, capture_output=True, text=True,
+    )
+    report = json.loads(first.read_text())
+    assert set(report["results"]) == {"splitter", "build", "search", "rag"}
+    assert report["meta"]["server"]["requests"] > 0
+    assert "search.500.p50_ms" in completed.stdout
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from aimakerspace.cache import LRUCache
+from aimakerspace.vectordatabase import VectorDatabase
+
+rng = np.random.default_rng(13)
+TEXTS = [f"text {i}" for i in range(200)]
+VECTORS = rng.standard_normal((len(TEXTS), 8)).astype(np.float32)
+METADATA = [{"half": "first" if i < 100 else "second"} for i in range(len(TEXTS))]
+
+
+class TableEmbedder:
+    """Embeds a query as a fixed random vector and counts how often it was asked."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def vector(self, text):
+        return np.random.default_rng(sum(map(ord, text))).standard_normal(8).astype(np.float32)
+
+    def get_embedding(self, text):
+        self.requests += 1
+        return self.vector(text)
+
+    def get_embeddings(self, texts):
+        self.requests += 1
+        return np.stack([self.vector(text) for text in texts])
+
+
+def uncached(query, k, filter=None):
+    db = VectorDatabase(TableEmbedder())
+    db.insert_many(TEXTS, VECTORS, METADATA)
+    return db.search_by_text(query, k, filter=filter)
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_lru_entries_expire_after_the_ttl():
+    now = [0.0]
+    cache = LRUCache(maxsize=4, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    now[0] = 10.0
+    assert cache.get("a") == 1
+    now[0] = 10.5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=0)
+
+
+def test_query_cache_embeds_each_query_once():
+    embedder = TableEmbedder()
+    db = VectorDatabase(embedder, query_cache=LRUCache())
+    db.insert_many(TEXTS, VECTORS)
+    for _ in range(3):
+        assert db.search_by_text("how much aid", 5) == uncached("how much aid", 5)
+    db.search_many_by_text(["how much aid", "new question", "new question"], 5)
+    assert embedder.requests == 2
+    assert not db.query_cache.get("how much aid").flags.writeable
+
+
+def test_result_cache_hits_and_is_keyed_by_filter():
+    embedder = TableEmbedder()
+    db = VectorDatabase(embedder, result_cache=LRUCache())
+    db.insert_many(TEXTS, VECTORS, METADATA)
+    first = db.search_by_text("loans", 4)
+    assert db.search_by_text("loans", 4) == first
+    assert db.search_by_text("loans", 4, return_as_text=True) == [t for t, _ in first]
+    assert embedder.requests == 1
+    second_half = db.search_by_text("loans", 4, filter={"half": "second"})
+    assert second_half == uncached("loans", 4, filter={"half": "second"})
+    assert embedder.requests == 2
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda db: db.insert("a closer text", db._embed_query("loans")),
+        lambda db: db.delete(db.search_by_text("loans", 1, return_as_text=True)),
+        lambda db: db.upsert({TEXTS[0]: db._embed_query("loans")}),
+    ],
+    ids=["insert", "delete", "upsert"],
+)
+def test_result_cache_is_dropped_when_rows_change(change):
+    db = VectorDatabase(TableEmbedder(), query_cache=LRUCache(), result_cache=LRUCache())
+    db.insert_many(TEXTS, VECTORS)
+    before = db.search_by_text("loans", 3)
+    change(db)
+    after = db.search_by_text("loans", 3)
+    assert after != before
+    reference = VectorDatabase(TableEmbedder())
+    reference.insert_many(db.get_texts(db._live_rows()), db.get_vectors(db._live_rows()))
+    assert after == reference.search_by_text("loans", 3)
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from aimakerspace.openai_utils import clients
+from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+from aimakerspace.openai_utils.embedding import EmbeddingModel
+from benchmarks.fake_openai_server import FakeServerConfig, fake_reply, serve
+
+
+@pytest.fixture
+def api(monkeypatch):
+    with serve(FakeServerConfig(dimensions=8, reply_words=6)) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        yield server
+
+
+def test_chat_and_embeddings_share_one_connection_pool(api):
+    chat, embedder = ChatOpenAI(), EmbeddingModel()
+    messages = [{"role": "user", "content": "hi"}]
+    assert chat.run(messages) == fake_reply(messages, 6)
+    embedder.get_embeddings(["a", "b"])
+
+    shared = clients.get_client()
+    assert clients.get_client() is shared
+    # The embedder's no-retry copy reuses the same HTTP client, and so its connections.
+    assert embedder.client is clients.get_client(max_retries=0)
+    assert embedder.client._client is shared._client
+    assert embedder.client.max_retries == 0 and shared.max_retries == clients.PoolConfig().max_retries
+    assert api.stats["requests"] == 2
+
+
+def test_new_credentials_get_a_new_client(api, monkeypatch):
+    first = clients.get_client()
+    monkeypatch.setenv("OPENAI_API_KEY", "another-key")
+    second = clients.get_client()
+    assert second is not first and second.api_key == "another-key"
+
+
+def test_async_clients_belong_to_their_event_loop(api):
+    async def pair():
+        return clients.get_async_client(), clients.get_async_client()
+
+    first_a, first_b = asyncio.run(pair())
+    second_a, _ = asyncio.run(pair())
+    assert first_a is first_b
+    assert second_a is not first_a
+
+
+def test_streaming_through_the_shared_async_client(api):
+    messages = [{"role": "user", "content": "stream please"}]
+
+    async def collect():
+        return "".join([piece async for piece in ChatOpenAI().astream(messages)])
+
+    assert asyncio.run(collect()) == asyncio.run(collect()) == fake_reply(messages, 6)
+
+
+def test_configure_clients_replaces_the_pool(api):
+    before = clients.get_client()
+    try:
+        config = clients.configure_clients(max_connections=4, timeout=5.0)
+        assert (config.max_connections, config.timeout) == (4, 5.0)
+        after = clients.get_client()
+        assert after is not before and after.timeout == 5.0
+    finally:
+        clients.configure_clients(**vars(clients.PoolConfig()))
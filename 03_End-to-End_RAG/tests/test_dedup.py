@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+
+from aimakerspace.dedup import NearDuplicateIndex, lsh_bands, minhash_signatures
+from aimakerspace.ingestion import IngestionPipeline
+from aimakerspace.text_utils import CharacterTextSplitter
+from aimakerspace.vectordatabase import VectorDatabase
+
+rng = np.random.default_rng(24)
+WORDS = [f"word{i}" for i in range(300)]
+
+
+def sentence(n):
+    return " ".join(rng.choice(WORDS, size=n))
+
+
+def edited(text, changes):
+    """``text`` with ``changes`` of its words replaced."""
+    words = text.split(" ")
+    for position in rng.choice(len(words), size=changes, replace=False):
+        words[position] = "EDIT"
+    return " ".join(words)
+
+
+def shingles(text, size=8):
+    data = text.encode("utf-8")
+    if len(data) < size:
+        return {data + bytes(size - len(data))}
+    return {data[i : i + size] for i in range(len(data) - size + 1)}
+
+
+def jaccard(a, b):
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def test_minhash_estimates_exact_jaccard():
+    base = [sentence(60) for _ in range(20)]
+    pairs = [(text, edited(text, changes)) for text in base for changes in (1, 5, 20)]
+    pairs += [(base[i], base[i + 1]) for i in range(19)]
+    left = minhash_signatures([a for a, _ in pairs], num_perm=256)
+    right = minhash_signatures([b for _, b in pairs], num_perm=256)
+    estimates = (left == right).mean(axis=1)
+    exact = np.array([jaccard(a, b) for a, b in pairs])
+    assert np.abs(estimates - exact).max() < 0.15
+    assert np.abs(estimates - exact).mean() < 0.04
+    # Identical texts always agree.
+    assert (minhash_signatures(base, num_perm=256) == left[:60:3]).all()
+
+
+def test_signatures_do_not_depend_on_batching():
+    texts = [sentence(int(n)) for n in rng.integers(0, 40, size=50)] + ["", "short", "日本語のテキスト"]
+    together = minhash_signatures(texts, num_perm=64)
+    one_by_one = np.concatenate([minhash_signatures([text], num_perm=64) for text in texts])
+    np.testing.assert_array_equal(together, one_by_one)
+    assert together.dtype == np.uint32 and together.shape == (len(texts), 64)
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.95])
+def test_lsh_bands_fit_the_signature(threshold):
+    bands, rows = lsh_bands(threshold, 128)
+    assert bands * rows <= 128
+    assert (1 / bands) ** (1 / rows) <= threshold
+    assert rows == 128 or (1 / (128 // (rows + 1))) ** (1 / (rows + 1)) > threshold
+
+
+def test_assignment_matches_pairwise_jaccard():
+    originals = [sentence(80) for _ in range(40)]
+    copies = [edited(text, 1) for text in originals[:20]]
+    far = [edited(text, 40) for text in originals[20:30]]
+    texts = originals + copies + far
+    index = NearDuplicateIndex(threshold=0.7)
+    entries, new = index.assign(texts[:50])
+    more_entries, more_new = index.assign(texts[50:])
+    entries, new = np.concatenate([entries, more_entries]), np.concatenate([new, more_new])
+
+    # The brute-force view: every pair's exact similarity, first match wins.
+    for i, text in enumerate(texts):
+        similar = [j for j in range(i) if new[j] and jaccard(text, texts[j]) >= 0.85]
+        unrelated = [j for j in range(i) if new[j] and jaccard(text, texts[j]) < 0.5]
+        if similar:
+            assert not new[i] and entries[i] == entries[similar[0]]
+        assert entries[i] not in entries[unrelated]
+    assert new[:40].all() and not new[40:60].any() and new[60:].all()
+    assert len(index) == 50 and entries[new].tolist() == list(range(50))
+
+
+def test_threshold_and_sizes_are_checked():
+    for threshold in (0, 1.5):
+        with pytest.raises(ValueError):
+            NearDuplicateIndex(threshold=threshold)
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=0)
+
+
+DIM = 8
+SPLITTER = CharacterTextSplitter(chunk_size=120, chunk_overlap=0)
+
+
+class HashEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    async def async_get_embeddings(self, texts, token_counts=None):
+        self.embedded.extend(texts)
+        return np.stack(
+            [
+                np.random.default_rng(int(hashlib.sha1(text.encode()).hexdigest()[:8], 16)).standard_normal(DIM)
+                for text in texts
+            ]
+        )
+
+
+def corpus():
+    shared = sentence(60)
+    documents = [(f"doc{i}.txt", sentence(100) + " " + shared) for i in range(6)]
+    # A lightly edited mirror of the first document.
+    documents.append(("mirror.txt", edited(documents[0][1], 1)))
+    return documents
+
+
+def check_provenance(pipeline, documents):
+    db = pipeline.vector_db
+    stored = {}
+    for row, text in zip(db._live_rows().tolist(), db.get_texts(db._live_rows())):
+        metadata = db.metadata.get(row)
+        stored[(metadata["source"], metadata["chunk"])] = text
+    duplicates = {(source, j): (canonical, k) for source, j, canonical, k in pipeline.duplicates}
+    # Every chunk of the split-then-embed baseline is either stored or points at a stored chunk.
+    for source, text in documents:
+        for j, chunk in enumerate(SPLITTER.split(text)):
+            if (source, j) in stored:
+                assert stored[(source, j)] == chunk and (source, j) not in duplicates
+            else:
+                canonical_source, canonical_j = duplicates[(source, j)]
+                assert db.find_ids({"source": canonical_source, "chunk": canonical_j}).size == 1
+                assert jaccard(chunk, stored[(canonical_source, canonical_j)]) >= 0.5
+    return stored, duplicates
+
+
+def test_pipeline_embeds_only_canonical_chunks_and_keeps_provenance():
+    documents = corpus()
+    embedder = HashEmbedder()
+    pipeline = IngestionPipeline(
+        VectorDatabase(embedder), SPLITTER, batch_size=4, deduplicator=NearDuplicateIndex(0.8)
+    )
+    stats = asyncio.run(pipeline.run(documents))
+    stored, duplicates = check_provenance(pipeline, documents)
+    total = sum(len(SPLITTER.split(text)) for _, text in documents)
+    assert len(stored) + len(duplicates) == total == stats["chunks"] + stats["duplicates"]
+    assert sorted(embedder.embedded) == sorted(stored.values())
+    # The mirror adds (almost) nothing new.
+    assert sum(source == "mirror.txt" for source, _ in stored) <= 1
+    assert stats["duplicates"] >= len(SPLITTER.split(documents[-1][1])) - 1
+
+
+@pytest.mark.parametrize("with_deduplicator", [True, False])
+def test_checkpoint_restores_duplicates(tmp_path, with_deduplicator):
+    documents = corpus()
+    directory = str(tmp_path / "ingest")
+    first = IngestionPipeline(
+        VectorDatabase(HashEmbedder()), SPLITTER, checkpoint_dir=directory, deduplicator=NearDuplicateIndex(0.8)
+    )
+    asyncio.run(first.run(documents[:5]))
+
+    settings = {"deduplicator": NearDuplicateIndex(0.8)} if with_deduplicator else {}
+    resumed = IngestionPipeline.from_checkpoint(directory, HashEmbedder(), splitter=SPLITTER, **settings)
+    assert resumed.duplicates == first.duplicates
+    asyncio.run(resumed.run(documents))
+    assert resumed.duplicates[: len(first.duplicates)] == first.duplicates
+    if with_deduplicator:
+        # The restored index still knows the earlier chunks, so the mirror is matched against them.
+        check_provenance(resumed, documents)
+        assert any(source == "mirror.txt" for source, *_ in resumed.duplicates)
+    reopened = IngestionPipeline.from_checkpoint(directory, HashEmbedder())
+    assert reopened.duplicates == resumed.duplicates
@@ -0,0 +1,159 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import openai
+import pytest
+
+from aimakerspace.openai_utils.batching import token_batches
+from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.openai_utils.embedding_cache import SQLiteEmbeddingCache, embedding_key
+from benchmarks.fake_openai_server import FakeServerConfig, fake_embedding, serve
+
+DIM = 16
+TEXTS = [f"sentence number {i}" for i in range(40)]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with serve(FakeServerConfig(dimensions=DIM)) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        yield server
+
+
+def expected(texts, dimensions=DIM):
+    """What the fake server answers for each text, computed without any request."""
+    return np.stack([fake_embedding(text, dimensions) for text in texts])
+
+
+def test_cached_texts_are_never_sent_again(server, tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    first = EmbeddingModel(cache=SQLiteEmbeddingCache(path))
+    np.testing.assert_allclose(first.get_embeddings(TEXTS[:30]), expected(TEXTS[:30]), rtol=1e-6)
+    assert server.stats["embedded"] == 30
+
+    # A new process would open the same file: only the ten unseen texts go out.
+    second = EmbeddingModel(cache=SQLiteEmbeddingCache(path))
+    np.testing.assert_allclose(second.get_embeddings(TEXTS), expected(TEXTS), rtol=1e-6)
+    assert server.stats["embedded"] == 40
+    np.testing.assert_allclose(second.get_embedding(TEXTS[3]), expected(TEXTS[3:4])[0], rtol=1e-6)
+    assert server.stats["requests"] == 2
+
+
+def test_duplicates_within_a_batch_are_embedded_once(server):
+    texts = ["same", "other", "same", "same"]
+    result = EmbeddingModel().get_embeddings(texts)
+    np.testing.assert_allclose(result, expected(texts), rtol=1e-6)
+    assert server.stats["embedded"] == 2
+
+
+def test_concurrent_async_calls_share_requests(server, tmp_path):
+    model = EmbeddingModel(cache=SQLiteEmbeddingCache(str(tmp_path / "cache.db")))
+
+    async def run():
+        return await asyncio.gather(
+            model.async_get_embeddings(TEXTS[:20]), model.async_get_embeddings(TEXTS[10:30])
+        )
+
+    first, second = asyncio.run(run())
+    np.testing.assert_allclose(first, expected(TEXTS[:20]), rtol=1e-6)
+    np.testing.assert_allclose(second, expected(TEXTS[10:30]), rtol=1e-6)
+    assert server.stats["embedded"] == 30
+
+
+def test_shortened_embeddings_are_cached_apart(server, tmp_path):
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.db"))
+    full = EmbeddingModel(cache=cache).get_embeddings(TEXTS[:5])
+    short = EmbeddingModel(cache=cache, dimensions=8).get_embeddings(TEXTS[:5])
+    assert np.asarray(full).shape == (5, DIM) and np.asarray(short).shape == (5, 8)
+    np.testing.assert_allclose(short, expected(TEXTS[:5], 8), rtol=1e-6)
+    assert len(cache) == 10
+    assert embedding_key("model-a", "x") != embedding_key("model-b", "x")
+
+
+def test_token_batches_respect_both_limits():
+    counts = np.random.default_rng(0).integers(1, 50, size=300).tolist() + [500]
+    batches = token_batches(counts, max_tokens=200, max_items=16)
+    assert [i for batch in batches for i in batch] == list(range(len(counts)))
+    for batch in batches[:-1]:
+        assert len(batch) <= 16 and sum(counts[i] for i in batch) <= 200
+        # Greedy packing: the next input would not have fitted.
+        next_count = counts[batch.stop]
+        assert len(batch) == 16 or sum(counts[i] for i in batch) + next_count > 200
+    # An oversized input still gets a batch of its own.
+    assert list(batches[-1]) == [len(counts) - 1]
+
+
+@pytest.mark.parametrize("get", ["sync", "async"])
+def test_small_batches_return_results_in_input_order(server, get):
+    model = EmbeddingModel(max_batch_size=3, max_batch_tokens=1000, max_concurrency=2)
+    if get == "sync":
+        result = model.get_embeddings(TEXTS)
+    else:
+        result = asyncio.run(model.async_get_embeddings(TEXTS))
+    np.testing.assert_allclose(result, expected(TEXTS), rtol=1e-6)
+    assert server.stats["requests"] == -(-len(TEXTS) // 3)
+
+
+def test_token_counts_from_the_caller_drive_the_packing(server):
+    model = EmbeddingModel(max_batch_tokens=10)
+    progress = []
+    model.get_embeddings(
+        TEXTS[:6], progress=lambda done, total: progress.append((done, total)), token_counts=[5] * 6
+    )
+    assert server.stats["requests"] == 3
+    assert progress == [(2, 6), (4, 6), (6, 6)]
+
+
+def test_at_most_max_concurrency_requests_are_in_flight(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    in_flight = {"now": 0, "peak": 0}
+
+    async def create(input, **kwargs):
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        data = [SimpleNamespace(index=i, embedding=[float(len(text))]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data)
+
+    model = EmbeddingModel(max_batch_size=1, max_concurrency=3)
+    model.async_client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    result = asyncio.run(model.async_get_embeddings(TEXTS[:12]))
+    assert result == [[float(len(text))] for text in TEXTS[:12]]
+    assert in_flight["peak"] == 3
+
+
+def test_rate_limited_requests_are_retried_by_us_only(monkeypatch):
+    monkeypatch.setattr("aimakerspace.openai_utils.batching.backoff_delay", lambda *args: 0)
+    with serve(FakeServerConfig(dimensions=DIM, rpm=1)) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        model = EmbeddingModel(max_retries=2)
+        model.get_embeddings(["allowed"])
+        with pytest.raises(openai.RateLimitError):
+            model.get_embeddings(["throttled"])
+        # One request plus two retries; the SDK's own retries are off.
+        assert server.stats["requests"] == 1 + 3
+
+
+def test_base64_responses_decode_to_the_same_float32_matrix(server, tmp_path):
+    as_floats = EmbeddingModel().get_embeddings(TEXTS[:10])
+    model = EmbeddingModel(encoding_format="base64", max_batch_size=4)
+    matrix = model.get_embeddings(TEXTS[:10])
+    assert isinstance(matrix, np.ndarray) and matrix.dtype == np.float32 and matrix.shape == (10, DIM)
+    np.testing.assert_array_equal(matrix, np.asarray(as_floats, dtype=np.float32))
+    np.testing.assert_array_equal(asyncio.run(model.async_get_embeddings(TEXTS[:10])), matrix)
+    row = model.get_embedding(TEXTS[0])
+    assert row.dtype == np.float32
+    np.testing.assert_array_equal(row, matrix[0])
+
+    cached = EmbeddingModel(encoding_format="base64", cache=SQLiteEmbeddingCache(str(tmp_path / "c.db")))
+    cached.get_embeddings(TEXTS[:5])
+    np.testing.assert_array_equal(cached.get_embeddings(TEXTS[:10]), matrix)
+
+
+def test_encoding_format_is_checked():
+    with pytest.raises(ValueError):
+        EmbeddingModel(encoding_format="binary")
@@ -0,0 +1,34 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.import_time import _ROOT, BUDGETS_MS, best_profile, eager_imports
+
+HEAVY = ("numpy", "openai", "tiktoken", "PyPDF2")
+
+
+def loaded_after_import(module: str):
+    """The ``HEAVY`` modules in ``sys.modules`` after importing ``module`` in a fresh interpreter."""
+    code = f"import json, sys, {module}; print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=_ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout)
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS_MS))
+def test_import_within_budget(module):
+    total, self_ms = best_profile(module, repeat=3)
+    assert total <= BUDGETS_MS[module], f"{module} took {total:.1f} ms"
+    assert eager_imports(module, self_ms) == []
+
+
+def test_text_utils_imports_nothing_heavy():
+    assert loaded_after_import("aimakerspace.text_utils") == []
+
+
+def test_vectordatabase_defers_clients_tokenizer_and_pdf():
+    # Rows live in NumPy arrays, so NumPy is the one heavy import a VectorDatabase needs.
+    assert loaded_after_import("aimakerspace.vectordatabase") == ["numpy"]
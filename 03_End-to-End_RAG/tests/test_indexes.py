@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from aimakerspace.indexes import HNSWIndex, IVFIndex, VectorIndex
+from aimakerspace.vectordatabase import VectorDatabase
+
+K = 10
+
+
+def clustered(n, dim, n_clusters, seed):
+    """Points scattered around random centres, the shape real embeddings have."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim))
+    points = centres[rng.integers(n_clusters, size=n)] + 0.3 * rng.standard_normal((n, dim))
+    return points.astype(np.float32)
+
+
+VECTORS = clustered(1200, 32, 30, seed=7)
+QUERIES = clustered(30, 32, 30, seed=8)
+TEXTS = [str(i) for i in range(len(VECTORS))]
+
+
+def exact_top_k(vectors, query, k):
+    scores = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    return [str(i) for i in np.argsort(-scores, kind="stable")[:k]]
+
+
+def recall(db, rows=None):
+    vectors = VECTORS if rows is None else VECTORS[rows]
+    names = TEXTS if rows is None else [TEXTS[i] for i in rows]
+    hits = 0
+    for query in QUERIES:
+        truth = {names[int(i)] for i in exact_top_k(vectors, query, K)}
+        hits += len(truth & {text for text, _ in db.search(query, K)})
+    return hits / (K * len(QUERIES))
+
+
+def make_ivf():
+    return IVFIndex(nlist=24, nprobe=6, train_size=600)
+
+
+def make_hnsw():
+    return HNSWIndex(M=12, ef_construction=80, ef_search=60)
+
+
+@pytest.mark.parametrize("make_index", [make_ivf, make_hnsw])
+def test_approximate_search_recall(make_index):
+    db = VectorDatabase(index=make_index())
+    db.insert_many(TEXTS, VECTORS)
+    assert recall(db) >= 0.9
+
+
+@pytest.mark.parametrize("make_index", [make_ivf, make_hnsw])
+def test_exact_flag_returns_the_brute_force_ranking(make_index):
+    db = VectorDatabase(index=make_index())
+    db.insert_many(TEXTS, VECTORS)
+    for query in QUERIES[:5]:
+        assert [text for text, _ in db.search(query, K, exact=True)] == exact_top_k(VECTORS, query, K)
+
+
+@pytest.mark.parametrize("make_index", [make_ivf, make_hnsw])
+def test_deleted_rows_never_come_back(make_index):
+    db = VectorDatabase(index=make_index())
+    db.insert_many(TEXTS, VECTORS)
+    deleted = TEXTS[::2]
+    db.delete(deleted)
+    survivors = np.arange(1, len(TEXTS), 2)
+    returned = {text for query in QUERIES for text, _ in db.search(query, K)}
+    assert not returned & set(deleted)
+    assert recall(db, survivors) >= 0.85
+
+
+def test_index_attached_later_sees_existing_rows():
+    db = VectorDatabase()
+    db.insert_many(TEXTS, VECTORS)
+    db.set_index(make_hnsw())
+    assert len(db.index) == len(TEXTS)
+    assert recall(db) >= 0.9
+
+
+def test_untrained_ivf_scans_every_buffered_row():
+    db = VectorDatabase(index=IVFIndex(nlist=24, train_size=10_000))
+    db.insert_many(TEXTS[:500], VECTORS[:500])
+    assert not db.index.is_trained
+    for query in QUERIES[:5]:
+        assert [text for text, _ in db.search(query, K)] == exact_top_k(VECTORS[:500], query, K)
+
+
+def test_vector_index_is_abstract():
+    with pytest.raises(TypeError):
+        VectorIndex()
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+from aimakerspace.ingestion import IngestionPipeline
+from aimakerspace.text_utils import CharacterTextSplitter
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+DIM = 12
+
+
+def embed(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+class HashEmbedder:
+    """Deterministic offline embeddings; optionally fails after a number of calls."""
+
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    async def async_get_embeddings(self, texts, token_counts=None):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise ConnectionError("embedding service went away")
+        self.calls += 1
+        await asyncio.sleep(0)
+        return np.stack([embed(text) for text in texts])
+
+
+rng = np.random.default_rng(2)
+DOCUMENTS = [
+    (f"doc{i}.txt", " ".join(f"w{n}" for n in rng.integers(0, 500, size=rng.integers(50, 400))))
+    for i in range(25)
+]
+SPLITTER = CharacterTextSplitter(chunk_size=200, chunk_overlap=40)
+
+
+def baseline_rows():
+    """Every ``(source, chunk)`` the notebook's split-then-embed loop would store."""
+    return sorted((source, chunk) for source, text in DOCUMENTS for chunk in SPLITTER.split(text))
+
+
+def stored_rows(db):
+    ids = db._live_rows()
+    return sorted(
+        (db.metadata.get(row)["source"], text) for row, text in zip(ids.tolist(), db.get_texts(ids))
+    )
+
+
+def ingest(documents, **settings):
+    db = VectorDatabase(HashEmbedder())
+    stats = asyncio.run(IngestionPipeline(db, SPLITTER, **settings).run(documents))
+    return db, stats
+
+
+@pytest.mark.parametrize("batch_size, embed_workers", [(1, 1), (16, 2), (1000, 3)])
+def test_pipeline_stores_what_split_then_embed_would(batch_size, embed_workers):
+    db, stats = ingest(DOCUMENTS, batch_size=batch_size, embed_workers=embed_workers, queue_size=2)
+    assert stored_rows(db) == baseline_rows()
+    assert stats["documents"] == len(DOCUMENTS) and stats["chunks"] == len(baseline_rows())
+    query = embed("a question")
+    expected = sorted(baseline_rows(), key=lambda row: -cosine_similarity(query, embed(row[1])))[:5]
+    assert [text for text, _ in db.search(query, 5)] == [chunk for _, chunk in expected]
+
+
+def test_async_sources_and_bare_texts():
+    async def documents():
+        for _, text in DOCUMENTS[:3]:
+            yield text
+
+    db, _ = ingest(documents())
+    texts = [text for _, text in DOCUMENTS[:3]]
+    for text in texts:
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        assert db.get_texts(db.find_ids({"document": digest})) == SPLITTER.split(text)
+
+
+def test_identical_chunks_of_different_documents_keep_their_own_rows():
+    db, _ = ingest([("a.txt", "same text"), ("b.txt", "same text")])
+    assert len(db) == 2
+    assert [db.metadata.get(row)["source"] for row in range(2)] == ["a.txt", "b.txt"]
+
+
+def test_resuming_after_a_crash_matches_an_uninterrupted_run(tmp_path):
+    checkpoints = str(tmp_path / "ingest")
+    db = VectorDatabase(HashEmbedder(fail_after=6))
+    pipeline = IngestionPipeline(
+        db, SPLITTER, batch_size=8, embed_workers=1, checkpoint_dir=checkpoints, checkpoint_every=8
+    )
+    with pytest.raises(ConnectionError):
+        asyncio.run(pipeline.run(DOCUMENTS))
+    assert os.path.exists(os.path.join(checkpoints, "state.json"))
+
+    resumed = IngestionPipeline.from_checkpoint(
+        checkpoints, embedding_model=HashEmbedder(), splitter=SPLITTER
+    )
+    done_before = len(resumed.completed)
+    assert 0 < done_before < len(DOCUMENTS)
+    stats = asyncio.run(resumed.run(DOCUMENTS))
+    assert stats["skipped"] == done_before
+    assert stored_rows(resumed.vector_db) == baseline_rows()
+
+    reopened = VectorDatabase.load(os.path.join(checkpoints, f"index-{resumed._generation}"))
+    assert stored_rows(reopened) == baseline_rows()
+    generations = [name for name in os.listdir(checkpoints) if name.startswith("index-")]
+    assert generations == [f"index-{resumed._generation}"]
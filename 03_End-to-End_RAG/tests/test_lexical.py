@@ -0,0 +1,124 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from aimakerspace.lexical import BM25Index, reciprocal_rank_fusion, tokenize, weighted_fusion
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+WORDS = "loan grant aid student federal pell award interest rate repayment school year form".split()
+rng = np.random.default_rng(21)
+TEXTS = [" ".join(rng.choice(WORDS, size=rng.integers(3, 15))) + f" doc{i}" for i in range(300)]
+VECTORS = rng.standard_normal((len(TEXTS), 12)).astype(np.float32)
+QUERIES = ["pell grant", "interest rate repayment", "federal student loan form", "doc17 award"]
+
+
+def textbook_bm25(documents, query, k1=1.5, b=0.75):
+    """Okapi BM25 straight from the formula, one document at a time."""
+    tokenized = [text.split() for text in documents]
+    avg_len = sum(map(len, tokenized)) / len(tokenized)
+    scores = []
+    for tokens in tokenized:
+        counts, score = Counter(tokens), 0.0
+        for term in set(query.split()):
+            df = sum(term in other for other in tokenized)
+            if not counts[term]:
+                continue
+            idf = math.log(1 + (len(tokenized) - df + 0.5) / (df + 0.5))
+            tf = counts[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avg_len))
+        scores.append(score)
+    return scores
+
+
+def ranked(texts, scores, k):
+    order = sorted(range(len(texts)), key=lambda i: -scores[i])
+    return [(texts[i], scores[i]) for i in order[:k] if scores[i] > 0]
+
+
+def dense_reference(texts, vectors, query_vector, k):
+    scores = [cosine_similarity(query_vector, v) for v in vectors]
+    return [texts[i] for i in sorted(range(len(texts)), key=lambda i: -scores[i])[:k]]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_bm25_scores_match_the_formula(query):
+    db = VectorDatabase(lexical=BM25Index())
+    db.insert_many(TEXTS, VECTORS)
+    expected = textbook_bm25(TEXTS, query)
+    np.testing.assert_allclose(db.lexical.scores(query, len(TEXTS)), expected, rtol=1e-5)
+    got = db.search_lexical(query, 10)
+    # Ties make the order of equal scores arbitrary, so compare the scores only.
+    np.testing.assert_allclose([s for _, s in got], [s for _, s in ranked(TEXTS, expected, 10)], rtol=1e-5)
+    assert all(expected[TEXTS.index(t)] == pytest.approx(s, rel=1e-5) for t, s in got)
+
+
+def test_deleted_rows_leave_the_statistics():
+    db = VectorDatabase(lexical=BM25Index())
+    db.insert_many(TEXTS, VECTORS)
+    db.delete(TEXTS[:100])
+    db.compact()
+    survivors = TEXTS[100:]
+    for query in QUERIES[:2]:
+        got = db.search_lexical(query, 5)
+        expected = ranked(survivors, textbook_bm25(survivors, query), 5)
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-5)
+
+
+def test_search_lexical_returns_only_rows_sharing_a_term():
+    db = VectorDatabase(lexical=BM25Index())
+    db.insert_many(["apple pie", "banana bread"], VECTORS[:2])
+    assert db.search_lexical("apple", 5, return_as_text=True) == ["apple pie"]
+    assert db.search_lexical("cherry", 5) == []
+
+
+def test_tokenize_keeps_identifiers_and_accents_together():
+    assert tokenize("Form I-9, W-2 and 1040-ES cost $12.50") == ["form", "i-9", "w-2", "and", "1040-es", "cost", "12.50"]
+    assert tokenize("Café") == tokenize("Café")
+
+
+def test_rrf_hybrid_equals_fusing_the_two_reference_rankings():
+    db = VectorDatabase(lexical=BM25Index())
+    db.insert_many(TEXTS, VECTORS)
+    query, query_vector, k, candidates = QUERIES[2], VECTORS[5], 5, 20
+
+    dense = dense_reference(TEXTS, VECTORS, query_vector, candidates)
+    lexical = [t for t, _ in ranked(TEXTS, textbook_bm25(TEXTS, query), candidates)]
+    fused = {}
+    for ranking in (dense, lexical):
+        for rank, text in enumerate(ranking, start=1):
+            fused[text] = fused.get(text, 0.0) + 1 / (60 + rank)
+    expected = sorted(fused.items(), key=lambda x: -x[1])[:k]
+
+    got = db.search_hybrid(query, k, candidates=candidates, query_vector=query_vector)
+    assert [t for t, _ in got] == [t for t, _ in expected]
+    np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-6)
+
+
+def test_weighted_hybrid_with_alpha_one_is_the_dense_ranking():
+    db = VectorDatabase(lexical=BM25Index())
+    db.insert_many(TEXTS, VECTORS)
+    got = db.search_hybrid(QUERIES[0], 5, fusion="weighted", alpha=1.0, query_vector=VECTORS[9])
+    assert [t for t, _ in got] == dense_reference(TEXTS, VECTORS, VECTORS[9], 5)
+
+
+def test_fusion_functions():
+    rows, scores = reciprocal_rank_fusion([np.array([3, 1, 2]), np.array([1, 4])], k=1)
+    assert rows.tolist() == [1, 3, 4, 2]
+    np.testing.assert_allclose(scores, [1 / 3 + 1 / 2, 1 / 2, 1 / 3, 1 / 4])
+
+    rows, scores = weighted_fusion(
+        [(np.array([7, 8]), np.array([0.9, 0.1])), (np.array([8, 9]), np.array([5.0, 1.0]))], [0.5, 0.5]
+    )
+    assert rows.tolist() == [7, 8, 9]
+    np.testing.assert_allclose(scores, [0.5, 0.5, 0.0])
+
+
+def test_hybrid_rejects_unknown_fusion_and_needs_a_lexical_index():
+    db = VectorDatabase()
+    db.insert_many(TEXTS[:3], VECTORS[:3])
+    with pytest.raises(ValueError):
+        db.search_hybrid("loan", 2, fusion="max", query_vector=VECTORS[0])
+    with pytest.raises(ValueError):
+        db.search_lexical("loan", 2)
@@ -0,0 +1,162 @@
+import operator
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from aimakerspace.indexes import HNSWIndex
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+_COMPARE = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def matches(metadata, filter):
+    """A row-at-a-time reading of the filter syntax, to check the columnar masks against."""
+    for field, condition in filter.items():
+        if field == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        present = field in metadata
+        value = metadata.get(field)
+        for op, target in condition.items():
+            if op == "$eq":
+                ok = present and value == target
+            elif op == "$ne":
+                ok = not present or value != target
+            elif op == "$in":
+                ok = present and value in target
+            elif op == "$nin":
+                ok = not present or value not in target
+            else:
+                ok = present and _COMPARE[op](value, target)
+            if not ok:
+                return False
+    return True
+
+
+rng = np.random.default_rng(9)
+N = 600
+TEXTS = [f"chunk {i}" for i in range(N)]
+VECTORS = rng.standard_normal((N, 16)).astype(np.float32)
+METADATA = [
+    {
+        "source": ["a.pdf", "b.pdf", "c.txt"][i % 3],
+        "page": int(i % 40),
+        "score": float(rng.random()),
+        "public": bool(i % 4 == 0),
+        "published": date(2024, 1, 1 + i % 28),
+        **({"tenant": "acme"} if i % 5 == 0 else {}),
+    }
+    for i in range(N)
+]
+FILTERS = [
+    {"source": "a.pdf"},
+    {"source": {"$ne": "a.pdf"}},
+    {"source": {"$in": ["b.pdf", "c.txt"]}, "public": True},
+    {"source": {"$nin": ["c.txt"]}},
+    {"page": {"$gte": 3, "$lt": 10}},
+    {"page": {"$gt": 3, "$lte": 10}},
+    {"page": 7},
+    {"page": {"$in": [1, 2, 39]}},
+    {"score": {"$lt": 0.25}},
+    {"tenant": "acme"},
+    {"tenant": {"$ne": "acme"}},
+    {"tenant": {"$nin": ["acme"]}},
+    {"missing": {"$gte": 1}},
+    {"published": {"$gte": date(2024, 1, 20)}},
+    {"$or": [{"tenant": "acme"}, {"public": True}]},
+    {"$and": [{"page": {"$lt": 20}}, {"$or": [{"source": "c.txt"}, {"score": {"$gt": 0.9}}]}]},
+]
+
+
+def reference(query, k, filter):
+    scored = [
+        (text, cosine_similarity(query, vector))
+        for text, vector, metadata in zip(TEXTS, VECTORS, METADATA)
+        if matches(metadata, filter)
+    ]
+    return [text for text, _ in sorted(scored, key=lambda x: x[1], reverse=True)[:k]]
+
+
+def database(**settings):
+    db = VectorDatabase(**settings)
+    db.insert_many(TEXTS, VECTORS, METADATA)
+    return db
+
+
+@pytest.mark.parametrize("filter", FILTERS, ids=[str(f) for f in FILTERS])
+def test_filtered_search_matches_filtering_first(filter):
+    db = database()
+    assert set(db.get_texts(db.find_ids(filter))) == {
+        t for t, m in zip(TEXTS, METADATA) if matches(m, filter)
+    }
+    for query in VECTORS[:3]:
+        assert [t for t, _ in db.search(query, 10, filter=filter)] == reference(query, 10, filter)
+
+
+def test_search_many_applies_the_filter_to_every_query():
+    db = database()
+    filter = {"source": "b.pdf", "page": {"$lt": 15}}
+    results = db.search_many(VECTORS[:4], 5, filter=filter)
+    assert [[t for t, _ in r] for r in results] == [reference(q, 5, filter) for q in VECTORS[:4]]
+
+
+def test_filters_through_an_approximate_index_skip_non_matching_rows():
+    db = database(index=HNSWIndex(M=8, ef_construction=60, ef_search=80))
+    # Keeps two thirds of the rows, so the search goes through the index with over-fetching.
+    filter = {"source": {"$ne": "c.txt"}}
+    for query in VECTORS[:5]:
+        got = [t for t, _ in db.search(query, 10, filter=filter)]
+        assert all(matches(METADATA[TEXTS.index(t)], filter) for t in got)
+        assert len(set(got) & set(reference(query, 10, filter))) >= 8
+
+
+def test_deleted_rows_do_not_match_filters():
+    db = database()
+    db.delete_where({"source": "a.pdf"})
+    assert len(db.find_ids({"source": "a.pdf"})) == 0
+    assert db.search(VECTORS[0], 5, filter={"source": "a.pdf"}) == []
+    assert len(db) == N - N // 3
+
+
+def test_values_round_trip_with_their_types(tmp_path):
+    stamp = datetime(2024, 5, 6, 7, 8, 9)
+    db = VectorDatabase()
+    db.insert_many(["x"], VECTORS[:1], [{"day": date(2024, 5, 6), "at": stamp, "n": 3, "f": 0.5, "ok": False}])
+    db.save(str(tmp_path))
+    for loaded in (db, VectorDatabase.load(str(tmp_path))):
+        metadata = loaded.retrieve_metadata("x")
+        assert metadata == {"day": date(2024, 5, 6), "at": stamp, "n": 3, "f": 0.5, "ok": False}
+        assert type(metadata["day"]) is date
+
+
+@pytest.mark.parametrize("value", [["a"], ("a",), {"a": 1}, object()])
+def test_non_scalar_values_raise_type_error(value):
+    db = VectorDatabase()
+    with pytest.raises(TypeError):
+        db.insert_many(["a"], VECTORS[:1], [{"tags": value}])
+    assert len(db) == 0
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [(1, "one"), ("x", 2), (True, 1), (date(2024, 1, 1), datetime(2024, 1, 1))],
+)
+def test_values_of_another_type_than_the_column_raise_type_error(first, second):
+    db = VectorDatabase()
+    db.insert_many(["a"], VECTORS[:1], [{"field": first}])
+    with pytest.raises(TypeError):
+        db.insert_many(["b"], VECTORS[1:2], [{"field": second}])
+    assert len(db) == 1
+
+
+def test_unknown_operator_raises():
+    with pytest.raises(ValueError):
+        database().search(VECTORS[0], 3, filter={"page": {"$regex": "1"}})
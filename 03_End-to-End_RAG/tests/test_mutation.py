@@ -0,0 +1,95 @@
+import numpy as np
+
+from aimakerspace.indexes import IVFIndex
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+rng = np.random.default_rng(5)
+DIM = 16
+QUERIES = rng.standard_normal((6, DIM)).astype(np.float32)
+
+
+def reference(store, query, k):
+    """Top-k over a plain ``{key: vector}`` dict, the storage the database replaced."""
+    return sorted(
+        ((key, cosine_similarity(query, vector)) for key, vector in store.items()),
+        key=lambda x: x[1],
+        reverse=True,
+    )[:k]
+
+
+def check_against(db, store, k=8):
+    assert len(db) == len(store)
+    for query in QUERIES:
+        got = db.search(query, k, exact=True)
+        expected = reference(store, query, k)
+        assert [key for key, _ in got] == [key for key, _ in expected]
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-5)
+
+
+def test_random_inserts_deletes_and_upserts_match_a_dict():
+    db = VectorDatabase()
+    store = {}
+    for step in range(30):
+        keys = [f"k{i}" for i in rng.integers(0, 200, size=20)]
+        vectors = rng.standard_normal((len(keys), DIM)).astype(np.float32)
+        if step % 3 == 0:
+            db.upsert(list(zip(keys, vectors)))
+        else:
+            db.insert_many(keys, vectors)
+        store.update(zip(keys, vectors))
+
+        doomed = [f"k{i}" for i in rng.integers(0, 200, size=8)]
+        assert db.delete(doomed) == len({key for key in doomed if key in store})
+        for key in doomed:
+            store.pop(key, None)
+        check_against(db, store)
+
+    db.compact()
+    assert db.stats()["dead"] == 0
+    check_against(db, store)
+
+
+def test_compact_renumbers_ids_and_reports_the_old_ones():
+    db = VectorDatabase()
+    vectors = rng.standard_normal((10, DIM))
+    ids = db.append([f"t{i}" for i in range(10)], vectors)
+    db.delete_ids(ids[[1, 4, 5]])
+    old = db.compact()
+    np.testing.assert_array_equal(old, [0, 2, 3, 6, 7, 8, 9])
+    assert db.get_texts(range(7)) == [f"t{i}" for i in old]
+    np.testing.assert_allclose(db.get_vectors(range(7)), vectors[old], rtol=1e-6)
+
+
+def test_compact_threshold_compacts_automatically():
+    db = VectorDatabase(compact_threshold=0.25)
+    db.insert_many([f"k{i}" for i in range(100)], rng.standard_normal((100, DIM)))
+    db.delete([f"k{i}" for i in range(25)])
+    assert db.stats()["dead"] == 25
+    db.delete("k25")
+    stats = db.stats()
+    assert (stats["rows"], stats["live"], stats["dead"]) == (74, 74, 0)
+    assert db.get_texts(range(74)) == [f"k{i}" for i in range(26, 100)]
+
+
+def test_upsert_keeps_metadata_unless_replaced():
+    db = VectorDatabase()
+    db.upsert([("a", np.ones(DIM), {"source": "x.txt"}), ("b", -np.ones(DIM), {"source": "y.txt"})])
+    db.upsert({"a": np.full(DIM, 2.0)})
+    assert db.retrieve_metadata("a") == {"source": "x.txt"}
+    np.testing.assert_array_equal(db.retrieve_from_key("a"), np.full(DIM, 2.0))
+    db.upsert([("b", np.ones(DIM), {"source": "z.txt"})])
+    assert db.retrieve_metadata("b") == {"source": "z.txt"}
+    assert len(db) == 2
+
+
+def test_deletes_reach_the_approximate_index():
+    store = {f"k{i}": v for i, v in enumerate(rng.standard_normal((400, DIM)).astype(np.float32))}
+    db = VectorDatabase(index=IVFIndex(nlist=8, nprobe=8, train_size=200))
+    db.insert_many(list(store), np.stack(list(store.values())))
+    doomed = [f"k{i}" for i in range(0, 400, 3)]
+    db.delete(doomed)
+    for key in doomed:
+        del store[key]
+    # With every list probed the IVF search is exhaustive, so it must equal the reference.
+    for query in QUERIES:
+        assert [key for key, _ in db.search(query, 5)] == [key for key, _ in reference(store, query, 5)]
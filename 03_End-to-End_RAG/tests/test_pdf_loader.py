@@ -0,0 +1,89 @@
+import functools
+import os
+
+import PyPDF2
+import pytest
+
+from aimakerspace.text_utils import PDFLoader
+
+SOURCE = os.path.join(os.path.dirname(__file__), "..", "..", "08_Evaluating_RAG_With_Ragas", "data")
+
+
+@pytest.fixture(scope="module")
+def pdf_dir(tmp_path_factory):
+    """Six short PDFs cut from the course's sample documents, one nested a level down."""
+    root = tmp_path_factory.mktemp("pdfs")
+    (root / "nested").mkdir()
+    sources = sorted(name for name in os.listdir(SOURCE) if name.endswith(".pdf"))
+    for i in range(6):
+        reader = PyPDF2.PdfReader(os.path.join(SOURCE, sources[i % len(sources)]))
+        writer = PyPDF2.PdfWriter()
+        for number in range(2 * i, 2 * i + 1 + i % 3):
+            writer.add_page(reader.pages[number])
+        folder = root / "nested" if i == 5 else root
+        with open(folder / f"file{i}.PDF" if i == 4 else folder / f"file{i}.pdf", "wb") as f:
+            writer.write(f)
+    (root / "readme.txt").write_text("skipped", encoding="utf-8")
+    return root
+
+
+@functools.lru_cache(maxsize=None)
+def page_texts(path):
+    return tuple(page.extract_text() for page in PyPDF2.PdfReader(path).pages)
+
+
+def baseline(path):
+    """The original loader: every page's text followed by a newline, one file at a time."""
+    text = ""
+    for page in page_texts(path):
+        text += page + "\n"
+    return text
+
+
+def pdf_paths(root):
+    return sorted(
+        os.path.join(folder, name)
+        for folder, _, names in os.walk(root)
+        for name in names
+        if name.lower().endswith(".pdf")
+    )
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [{"workers": 1}, {"workers": 2, "min_files_for_pool": 1}, {"workers": 8, "min_files_for_pool": 100}],
+    ids=["serial", "pool", "below-pool-threshold"],
+)
+def test_directory_documents_match_the_sequential_loader(pdf_dir, settings):
+    documents = PDFLoader(str(pdf_dir), **settings).load_documents()
+    assert documents == [baseline(path) for path in pdf_paths(pdf_dir)]
+    assert all(document.strip() for document in documents)
+
+
+def test_pool_and_in_process_pages_agree(pdf_dir):
+    expected = [
+        (path, number, text)
+        for path in pdf_paths(pdf_dir)
+        for number, text in enumerate(page_texts(path), 1)
+    ]
+    serial = list(PDFLoader(str(pdf_dir), workers=1).iter_pages())
+    pooled = list(PDFLoader(str(pdf_dir), workers=3, min_files_for_pool=2).iter_pages())
+    # Serial pages come in order; pooled ones file by file, in completion order.
+    assert serial == expected
+    assert sorted(pooled) == expected
+    for path in pdf_paths(pdf_dir):
+        assert [number for p, number, _ in pooled if p == path] == sorted(
+            number for p, number, _ in expected if p == path
+        )
+
+
+def test_single_file(pdf_dir):
+    path = pdf_paths(pdf_dir)[0]
+    assert PDFLoader(path, workers=4, min_files_for_pool=1).load_documents() == [baseline(path)]
+
+
+def test_errors_become_value_errors(pdf_dir):
+    with pytest.raises(ValueError, match="neither a file nor a directory"):
+        PDFLoader(str(pdf_dir / "missing.pdf")).load()
+    with pytest.raises(ValueError, match="Error processing file"):
+        PDFLoader(str(pdf_dir / "readme.txt")).load()
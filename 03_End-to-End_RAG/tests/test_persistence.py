@@ -0,0 +1,114 @@
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from aimakerspace.quantization import Int8Codec
+from aimakerspace.vectordatabase import INDEX_FORMAT_VERSION, VectorDatabase, cosine_similarity
+
+rng = np.random.default_rng(3)
+TEXTS = [f"passage {i} – café №{i}" for i in range(300)]
+VECTORS = rng.standard_normal((len(TEXTS), 24)).astype(np.float32)
+QUERY = rng.standard_normal(24).astype(np.float32)
+
+
+def reference_top(texts, vectors, k):
+    scored = sorted(
+        ((t, cosine_similarity(QUERY, v)) for t, v in zip(texts, vectors)),
+        key=lambda x: x[1],
+        reverse=True,
+    )
+    return [t for t, _ in scored[:k]]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip_keeps_texts_vectors_and_results(tmp_path, mmap):
+    db = VectorDatabase()
+    db.insert_many(TEXTS, VECTORS)
+    db.save(str(tmp_path))
+
+    loaded = VectorDatabase.load(str(tmp_path), mmap=mmap)
+    assert len(loaded) == len(TEXTS)
+    assert loaded.get_texts(range(len(TEXTS))) == TEXTS
+    np.testing.assert_array_equal(loaded.get_vectors(range(len(TEXTS))), VECTORS)
+    assert [t for t, _ in loaded.search(QUERY, 10)] == reference_top(TEXTS, VECTORS, 10)
+    assert loaded.search(QUERY, 10) == db.search(QUERY, 10)
+
+
+def test_header_describes_the_layout(tmp_path):
+    db = VectorDatabase(SimpleNamespace(embeddings_model_name="text-embedding-3-small", dimensions=24))
+    db.insert_many(TEXTS[:5], VECTORS[:5])
+    db.save(str(tmp_path))
+    with open(tmp_path / "header.json") as f:
+        header = json.load(f)
+    assert header["version"] == INDEX_FORMAT_VERSION == 3
+    assert (header["count"], header["dimension"]) == (5, 24)
+    assert header["embedding_model"] == "text-embedding-3-small"
+    assert os.path.getsize(tmp_path / "vectors.f32") == 5 * 24 * 4
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+
+def test_inserts_after_an_mmap_load_leave_the_files_alone(tmp_path):
+    db = VectorDatabase()
+    db.insert_many(TEXTS[:10], VECTORS[:10])
+    db.save(str(tmp_path))
+    before = (tmp_path / "vectors.f32").read_bytes()
+
+    loaded = VectorDatabase.load(str(tmp_path))
+    loaded.insert(TEXTS[0], -VECTORS[0])
+    loaded.insert_many(TEXTS[10:20], VECTORS[10:20])
+    assert (tmp_path / "vectors.f32").read_bytes() == before
+    np.testing.assert_array_equal(loaded.retrieve_from_key(TEXTS[0]), -VECTORS[0])
+    assert len(VectorDatabase.load(str(tmp_path))) == 10
+
+
+def test_deleted_rows_and_metadata_survive_as_saved(tmp_path):
+    db = VectorDatabase()
+    metadata = [{"source": f"doc{i % 3}.txt", "page": i} for i in range(len(TEXTS))]
+    db.insert_many(TEXTS, VECTORS, metadata)
+    db.delete(TEXTS[:100])
+    db.save(str(tmp_path))
+
+    loaded = VectorDatabase.load(str(tmp_path))
+    assert len(loaded) == 200
+    assert loaded.retrieve_from_key(TEXTS[0]) is None
+    assert loaded.retrieve_metadata(TEXTS[150]) == {"source": "doc0.txt", "page": 150}
+    kept = [i for i in range(100, 300) if i % 3 == 1]
+    expected = reference_top([TEXTS[i] for i in kept], VECTORS[kept], 5)
+    assert [t for t, _ in loaded.search(QUERY, 5, filter={"source": "doc1.txt"})] == expected
+
+
+def test_codec_state_round_trips(tmp_path):
+    db = VectorDatabase(codec=Int8Codec(min_train_rows=1))
+    db.insert_many(TEXTS, VECTORS)
+    db.save(str(tmp_path))
+
+    loaded = VectorDatabase.load(str(tmp_path), mmap=False)
+    assert isinstance(loaded.codec, Int8Codec)
+    np.testing.assert_array_equal(loaded.codec.offset, db.codec.offset)
+    assert loaded.search(QUERY, 10) == db.search(QUERY, 10)
+
+
+def test_empty_index_round_trips(tmp_path):
+    VectorDatabase().save(str(tmp_path))
+    loaded = VectorDatabase.load(str(tmp_path))
+    assert len(loaded) == 0
+    assert loaded.search(QUERY, 3) == []
+
+
+def test_load_rejects_other_models_and_newer_versions(tmp_path):
+    db = VectorDatabase(SimpleNamespace(embeddings_model_name="text-embedding-3-small", dimensions=None))
+    db.insert_many(TEXTS[:3], VECTORS[:3])
+    db.save(str(tmp_path))
+    with pytest.raises(ValueError):
+        VectorDatabase.load(str(tmp_path), embedding_model=SimpleNamespace(embeddings_model_name="other", dimensions=None))
+
+    with open(tmp_path / "header.json") as f:
+        header = json.load(f)
+    header["version"] = INDEX_FORMAT_VERSION + 1
+    with open(tmp_path / "header.json", "w") as f:
+        json.dump(header, f)
+    with pytest.raises(ValueError):
+        VectorDatabase.load(str(tmp_path))
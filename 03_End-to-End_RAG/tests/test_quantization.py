@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from aimakerspace.quantization import (
+    Float16Codec,
+    Int8Codec,
+    MatryoshkaCodec,
+    ProductQuantizationCodec,
+    VectorCodec,
+)
+from aimakerspace.vectordatabase import VectorDatabase
+
+K = 10
+_rng = np.random.default_rng(11)
+_centres = _rng.standard_normal((25, 64))
+VECTORS = (_centres[_rng.integers(25, size=2000)] + 0.4 * _rng.standard_normal((2000, 64))).astype(np.float32)
+QUERIES = (_centres[_rng.integers(25, size=20)] + 0.4 * _rng.standard_normal((20, 64))).astype(np.float32)
+TEXTS = [f"row {i}" for i in range(len(VECTORS))]
+UNIT = VECTORS / np.linalg.norm(VECTORS, axis=1, keepdims=True)
+
+
+def truth(query):
+    return {TEXTS[i] for i in np.argsort(-(UNIT @ query))[:K]}
+
+
+def recall_at_k(db):
+    found = sum(len(truth(q) & {t for t, _ in db.search(q, K)}) for q in QUERIES)
+    return found / (K * len(QUERIES))
+
+
+@pytest.mark.parametrize(
+    "codec, keep_vectors, minimum",
+    [
+        (Float16Codec(), False, 0.99),
+        (Int8Codec(min_train_rows=500), False, 0.9),
+        (Int8Codec(min_train_rows=500), True, 0.99),
+        # Two dimensions per sub-vector: coarse on its own, close to exact once re-scored.
+        (ProductQuantizationCodec(m=32, n_centroids=32, min_train_rows=500), False, 0.4),
+        (ProductQuantizationCodec(m=32, n_centroids=32, min_train_rows=500), True, 0.85),
+    ],
+    ids=["float16", "int8", "int8-rescored", "pq", "pq-rescored"],
+)
+def test_codec_recall_against_exact_scan(codec, keep_vectors, minimum):
+    db = VectorDatabase(codec=codec, keep_vectors=keep_vectors)
+    db.insert_many(TEXTS, VECTORS)
+    assert codec.is_trained
+    assert (db._matrix is not None) == keep_vectors
+    assert recall_at_k(db) >= minimum
+
+
+def test_rescored_scores_are_exact_cosines():
+    db = VectorDatabase(codec=Int8Codec(min_train_rows=1))
+    db.insert_many(TEXTS, VECTORS)
+    query = QUERIES[0] / np.linalg.norm(QUERIES[0])
+    for text, score in db.search(QUERIES[0], K):
+        assert score == pytest.approx(float(UNIT[TEXTS.index(text)] @ query), abs=1e-5)
+
+
+def test_compressed_storage_is_smaller():
+    plain = VectorDatabase()
+    plain.insert_many(TEXTS, VECTORS)
+    pq = VectorDatabase(codec=ProductQuantizationCodec(m=16, n_centroids=32, min_train_rows=500), keep_vectors=False)
+    pq.insert_many(TEXTS, VECTORS)
+    int8 = VectorDatabase(codec=Int8Codec(min_train_rows=500), keep_vectors=False)
+    int8.insert_many(TEXTS, VECTORS)
+    assert pq._codes.nbytes == len(TEXTS) * 16
+    assert int8._codes.nbytes * 4 == plain._matrix.nbytes
+
+
+def test_rows_stay_float32_until_the_codec_trains():
+    db = VectorDatabase(codec=Int8Codec(min_train_rows=1000), keep_vectors=False)
+    db.insert_many(TEXTS[:999], VECTORS[:999])
+    assert not db.codec.is_trained and db._matrix is not None
+    db.insert(TEXTS[999], VECTORS[999])
+    assert db.codec.is_trained and db._matrix is None
+
+
+def test_int8_widens_for_vectors_outside_its_range():
+    stored = VECTORS.copy()
+    stored[:100] = np.abs(stored[:100])
+    db = VectorDatabase(codec=Int8Codec(min_train_rows=100), keep_vectors=False)
+    db.insert_many(TEXTS[:100], stored[:100])
+    # Trained on positive components only; the negative ones must not be clipped.
+    db.insert_many(TEXTS[100:], stored[100:])
+    decoded = db.codec.decode(db._codes[: len(TEXTS)])
+    unit = stored / np.linalg.norm(stored, axis=1, keepdims=True)
+    assert np.abs(decoded - unit).max() < 0.02
+
+
+def test_pq_rejects_an_indivisible_dimension_before_storing_anything():
+    db = VectorDatabase(codec=ProductQuantizationCodec(m=7, min_train_rows=1))
+    with pytest.raises(ValueError):
+        db.insert_many(TEXTS[:10], VECTORS[:10])
+    assert len(db) == 0 and db.dimension == 0
+
+
+def test_pq_state_round_trips_its_training_parameters():
+    codec = ProductQuantizationCodec(m=8, n_centroids=16, n_iter=5, train_size=300, seed=4)
+    codec.train(UNIT[:400])
+    params, arrays = codec.state()
+    restored = ProductQuantizationCodec.from_state(params, arrays)
+    assert (restored.n_iter, restored.train_size, restored.seed) == (5, 300, 4)
+    np.testing.assert_array_equal(restored.encode(UNIT[:50]), codec.encode(UNIT[:50]))
+
+
+def test_vector_codec_is_abstract():
+    with pytest.raises(TypeError):
+        VectorCodec()
+
+
+def front_loaded(n, seed):
+    """Vectors whose leading components carry most of the variance, as Matryoshka embeddings do."""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((n, 128)) * np.exp(-np.arange(128) / 24)).astype(np.float32)
+
+
+@pytest.mark.parametrize("half_precision", [False, True])
+def test_matryoshka_two_stage_search_recall(half_precision):
+    vectors, queries = front_loaded(3000, 1), front_loaded(20, 2)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [str(i) for i in range(len(vectors))]
+    db = VectorDatabase(codec=MatryoshkaCodec(dims=32, half_precision=half_precision), rescore=8)
+    db.insert_many(texts, vectors)
+    hits = 0
+    for query in queries:
+        exact = [str(i) for i in np.argsort(-(unit @ query))[:K]]
+        found = db.search(query, K)
+        hits += len(set(exact) & {text for text, _ in found})
+        # Re-ranked scores are full-length cosines, not prefix ones.
+        for text, score in found:
+            assert score == pytest.approx(float(unit[int(text)] @ query / np.linalg.norm(query)), abs=1e-5)
+    assert hits / (K * len(queries)) >= 0.95
+    assert db._codes.shape == (len(vectors), 32)
+
+
+def test_matryoshka_prefix_only_storage_round_trips(tmp_path):
+    vectors = front_loaded(200, 3)
+    db = VectorDatabase(codec=MatryoshkaCodec(dims=16), keep_vectors=False)
+    db.insert_many([str(i) for i in range(200)], vectors)
+    decoded = db.get_vectors([0])[0]
+    assert decoded.shape == (128,) and not decoded[16:].any()
+    # The renormalised prefix, scaled back by the full vector's stored norm.
+    prefix = vectors[0, :16] / np.linalg.norm(vectors[0, :16]) * np.linalg.norm(vectors[0])
+    np.testing.assert_allclose(decoded[:16], prefix, rtol=1e-5)
+
+    db.save(str(tmp_path))
+    loaded = VectorDatabase.load(str(tmp_path))
+    assert loaded.codec.dims == 16 and loaded.codec.dim == 128
+    assert loaded.search(vectors[5], 3) == db.search(vectors[5], 3)
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+from aimakerspace.reindex import MANIFEST_FILE, IncrementalIndexer
+from aimakerspace.text_utils import CharacterTextSplitter
+from aimakerspace.vectordatabase import VectorDatabase
+
+DIM = 10
+SPLITTER = CharacterTextSplitter(chunk_size=60, chunk_overlap=0)
+
+
+def embed(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+class RecordingEmbedder:
+    """Deterministic embeddings that remember every text they were asked for."""
+
+    def __init__(self):
+        self.embedded = []
+
+    async def async_get_embeddings(self, texts):
+        self.embedded.extend(texts)
+        return np.stack([embed(text) for text in texts])
+
+
+def paragraph(seed, sentences=8):
+    rng = np.random.default_rng(seed)
+    words = ["grant", "loan", "award", "student", "college", "year", "aid", "form"]
+    return "".join(" ".join(rng.choice(words, size=9)).capitalize() + ". " for _ in range(sentences))
+
+
+def write(root, relative, text, mtime_ns):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # Explicit mtimes, so a rewrite is never hidden by a coarse file-system clock.
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def rebuilt(root):
+    """Full rebuild from scratch: every file split and every chunk embedded."""
+    rows = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(".txt"):
+                path = os.path.join(directory, name)
+                with open(path, "r", encoding="utf-8") as f:
+                    rows.extend((os.path.relpath(path, root), chunk) for chunk in SPLITTER.split(f.read()))
+    return sorted(rows)
+
+
+def stored(db):
+    ids = db._live_rows()
+    rows = sorted(
+        (db.metadata.get(row)["source"], text, row) for row, text in zip(ids.tolist(), db.get_texts(ids))
+    )
+    for _, text, row in rows:
+        np.testing.assert_allclose(db.get_vectors([row])[0], embed(text), rtol=1e-6)
+    return [(source, text) for source, text, _ in rows]
+
+
+def same_search_as_rebuild(db, root):
+    reference = VectorDatabase()
+    rows = rebuilt(root)
+    reference.append([text for _, text in rows], np.stack([embed(text) for _, text in rows]))
+    for query in np.random.default_rng(0).standard_normal((4, DIM)):
+        got, expected = db.search(query, 5), reference.search(query, 5)
+        assert [text for text, _ in got] == [text for text, _ in expected]
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-5)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "docs"
+    for i in range(6):
+        write(str(root), f"{'nested/' if i % 2 else ''}doc{i}.txt", paragraph(i), 10**18 + i)
+    # Not indexed: no loader for the extension.
+    write(str(root), "notes.md", "ignored", 10**18)
+    return str(root), str(tmp_path / "index")
+
+
+def run(indexer):
+    return asyncio.run(indexer.run())
+
+
+def counts(stats):
+    return {key: value for key, value in stats.items() if value and key != "seconds"}
+
+
+def test_first_run_matches_a_full_rebuild(corpus):
+    root, index_dir = corpus
+    embedder = RecordingEmbedder()
+    stats = run(IncrementalIndexer(root, index_dir, embedder, SPLITTER, batch_chunks=5))
+    assert stored(IncrementalIndexer(root, index_dir, embedder, SPLITTER).vector_db) == rebuilt(root)
+    assert counts(stats) == {"added": 6, "chunks_embedded": len(rebuilt(root))}
+    assert sorted(embedder.embedded) == sorted(text for _, text in rebuilt(root))
+
+
+def test_only_what_changed_costs_anything(corpus):
+    root, index_dir = corpus
+    run(IncrementalIndexer(root, index_dir, RecordingEmbedder(), SPLITTER))
+
+    # Nothing changed: no reads, no embeddings, no new generation.
+    embedder = RecordingEmbedder()
+    indexer = IncrementalIndexer(root, index_dir, embedder, SPLITTER)
+    generation = indexer._generation
+    assert counts(run(indexer)) == {"unchanged": 6}
+    assert embedder.embedded == [] and indexer._generation == generation
+
+    # Touched: the same bytes under a new mtime only refresh the fingerprint.
+    os.utime(os.path.join(root, "doc0.txt"), ns=(2 * 10**18, 2 * 10**18))
+    assert counts(run(indexer)) == {"unchanged": 5, "touched": 1}
+    assert embedder.embedded == [] and indexer._generation == generation + 1
+
+    # Changed, removed and added in one run.
+    old_chunks = set(SPLITTER.split(paragraph(2)))
+    edited = paragraph(2)[:120] + "A brand new sentence about work study. " + paragraph(2)[120:]
+    write(root, "doc2.txt", edited, 3 * 10**18)
+    os.remove(os.path.join(root, "nested", "doc3.txt"))
+    write(root, "nested/doc9.txt", paragraph(9), 3 * 10**18)
+    stats = run(indexer)
+
+    new_chunks = SPLITTER.split(edited)
+    rewritten = [chunk for chunk in new_chunks if chunk not in old_chunks]
+    fresh = rewritten + SPLITTER.split(paragraph(9))
+    assert counts(stats) == {
+        "unchanged": 4,
+        "changed": 1,
+        "removed": 1,
+        "added": 1,
+        "chunks_embedded": len(fresh),
+        "chunks_reused": len(new_chunks) - len(rewritten),
+    }
+    assert 0 < len(rewritten) < len(new_chunks)
+    assert sorted(embedder.embedded) == sorted(fresh)
+    assert stored(indexer.vector_db) == rebuilt(root)
+    same_search_as_rebuild(indexer.vector_db, root)
+
+    # The saved generation reopens to the same rows, and is the only one left.
+    reopened = IncrementalIndexer(root, index_dir, RecordingEmbedder(), SPLITTER)
+    assert stored(reopened.vector_db) == rebuilt(root)
+    assert counts(run(reopened)) == {"unchanged": 6}
+    with open(os.path.join(index_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert [name for name in os.listdir(index_dir) if name.startswith("index-")] == [manifest["index"]]
+    assert set(manifest["files"]) == {source for source, _ in rebuilt(root)}
+
+
+def test_a_file_emptied_or_sharing_chunks_with_another(corpus):
+    root, index_dir = corpus
+    indexer = IncrementalIndexer(root, index_dir, RecordingEmbedder(), SPLITTER)
+    run(indexer)
+    write(root, "doc0.txt", "", 4 * 10**18)
+    # A copy of another file reuses nothing across sources: its own rows are embedded.
+    write(root, "nested/doc1.txt", paragraph(4), 4 * 10**18)
+    stats = run(indexer)
+    assert stats["changed"] == 2 and stats["chunks_reused"] == 0
+    assert stored(indexer.vector_db) == rebuilt(root)
+    assert indexer.vector_db.find_ids({"source": "doc0.txt"}).tolist() == []
+
+
+def test_rows_of_unknown_files_are_deleted(corpus):
+    root, index_dir = corpus
+    indexer = IncrementalIndexer(root, index_dir, RecordingEmbedder(), SPLITTER)
+    # Rows from an index built elsewhere, for files this tree does not have.
+    indexer.vector_db.append(["stray chunk"], embed("stray chunk")[None, :], [{"source": "elsewhere.txt"}])
+    run(indexer)
+    assert stored(indexer.vector_db) == rebuilt(root)
+
+
+def test_custom_loaders_and_bad_arguments(corpus, tmp_path):
+    root, index_dir = corpus
+    loaders = {".md": lambda path: pathlib.Path(path).read_text(encoding="utf-8").upper()}
+    indexer = IncrementalIndexer(root, index_dir, RecordingEmbedder(), SPLITTER, loaders=loaders)
+    assert counts(run(indexer)) == {"added": 1, "chunks_embedded": 1}
+    assert indexer.vector_db.get_texts([0]) == ["IGNORED"]
+
+    with pytest.raises(ValueError):
+        IncrementalIndexer(str(tmp_path / "missing"), index_dir)
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": 99, "files": {}}, f)
+    with pytest.raises(ValueError):
+        IncrementalIndexer(root, index_dir)
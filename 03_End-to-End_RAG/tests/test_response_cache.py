@@ -0,0 +1,193 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+from aimakerspace.openai_utils.response_cache import ResponseCache, SemanticResponseCache, response_key
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+from benchmarks.fake_openai_server import FakeServerConfig, fake_reply, serve
+
+DIM = 16
+MODEL = "gpt-4o-mini"
+rng = np.random.default_rng(25)
+TOPICS = {f"question {i}": rng.standard_normal(DIM) for i in range(20)}
+
+
+def nearby(vector, noise, seed):
+    direction = np.random.default_rng(seed).standard_normal(DIM)
+    return vector + noise * np.linalg.norm(vector) * direction / np.sqrt(DIM)
+
+
+# Rephrasings of the first five questions, close to them in embedding space.
+VECTORS = dict(TOPICS)
+VECTORS.update({f"rephrased {i}": nearby(TOPICS[f"question {i}"], 0.1, seed=i) for i in range(5)})
+VECTORS.update({f"unrelated {i}": rng.standard_normal(DIM) for i in range(5)})
+
+
+class TableEmbedder:
+    """Query embeddings from a fixed table, with a count of how many were computed."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_embedding(self, text):
+        self.calls += 1
+        return VECTORS[text].astype(np.float32)
+
+    async def async_get_embedding(self, text):
+        return self.get_embedding(text)
+
+
+def ask(question, system="Answer briefly."):
+    return [{"role": "system", "content": system}, {"role": "user", "content": question}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def semantic_cache(threshold=0.95, **settings):
+    return SemanticResponseCache(VectorDatabase(TableEmbedder()), threshold=threshold, **settings)
+
+
+def test_exact_hits_depend_on_model_messages_and_kwargs():
+    cache = ResponseCache(maxsize=8)
+    cache.put(MODEL, ask("question 1"), {"temperature": 0, "seed": 1}, "answer 1")
+    assert cache.get(MODEL, ask("question 1"), {"seed": 1, "temperature": 0}) == "answer 1"
+    assert cache.get(MODEL, ask("question 1"), {"temperature": 1, "seed": 1}) is None
+    assert cache.get("gpt-4o", ask("question 1"), {"temperature": 0, "seed": 1}) is None
+    assert cache.get(MODEL, ask("question 2"), {"temperature": 0, "seed": 1}) is None
+    assert cache.stats() == {"hits": 1, "semantic_hits": 0, "misses": 3, "hit_rate": 0.25, "memory_size": 1}
+    assert response_key(MODEL, [{"a": 1, "b": 2}], {}) == response_key(MODEL, [{"b": 2, "a": 1}], {})
+
+
+def test_ttl_applies_to_memory_and_disk(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(path, ttl=60, clock=clock)
+    cache.put(MODEL, ask("question 1"), {}, "answer 1")
+    clock.now += 60
+    assert cache.get(MODEL, ask("question 1"), {}) == "answer 1"
+    # A new process finds it on disk until it expires there too.
+    reopened = ResponseCache(path, ttl=60, clock=clock)
+    assert reopened.get(MODEL, ask("question 1"), {}) == "answer 1"
+    clock.now += 1
+    assert cache.get(MODEL, ask("question 1"), {}) is None
+    assert ResponseCache(path, ttl=60, clock=clock).get(MODEL, ask("question 1"), {}) is None
+    # The expired row was deleted, so even without a TTL it is gone.
+    assert ResponseCache(path, clock=clock).get(MODEL, ask("question 1"), {}) is None
+    for opened in (cache, reopened):
+        opened.close()
+
+
+def test_disk_keeps_the_most_recently_used_entries(tmp_path):
+    clock = Clock()
+    cache = ResponseCache(str(tmp_path / "r.db"), maxsize=1, max_disk_entries=3, clock=clock)
+    for i in range(4):
+        clock.now += 1
+        cache.put(MODEL, ask(f"question {i}"), {}, f"answer {i}")
+        if i == 2:
+            clock.now += 1
+            # Read from disk, so question 0 becomes recently used and question 1 is evicted.
+            assert cache.get(MODEL, ask("question 0"), {}) == "answer 0"
+    reopened = ResponseCache(str(tmp_path / "r.db"))
+    found = [reopened.get(MODEL, ask(f"question {i}"), {}) for i in range(4)]
+    assert found == ["answer 0", None, "answer 2", "answer 3"]
+
+
+def brute_force(stored, query, threshold):
+    """The stored question closest to ``query``, if within the threshold."""
+    scored = [(cosine_similarity(VECTORS[query], VECTORS[q]), q) for q in stored]
+    score, best = max(scored)
+    return best if score >= threshold else None
+
+
+@pytest.mark.parametrize("threshold", [0.9, 0.95, 0.99])
+def test_semantic_hits_match_a_brute_force_nearest_question(threshold):
+    cache = ResponseCache(semantic=semantic_cache(threshold))
+    stored = list(TOPICS)
+    for question in stored:
+        cache.put(MODEL, ask(question), {}, f"answer to {question}")
+    for query in VECTORS:
+        expected = brute_force(stored, query, threshold)
+        assert cache.get(MODEL, ask(query), {}) == (None if expected is None else f"answer to {expected}")
+    assert cache.hits == len(TOPICS)
+    # Another system prompt is another scope: nothing is shared with it.
+    assert cache.get(MODEL, ask("rephrased 0", system="Answer at length."), {}) is None
+
+
+def test_each_query_is_embedded_once_between_lookup_and_store():
+    semantic = semantic_cache()
+    cache = ResponseCache(semantic=semantic)
+    assert cache.get(MODEL, ask("question 3"), {}) is None
+    cache.put(MODEL, ask("question 3"), {}, "answer 3")
+    assert semantic.vector_db.embedding_model.calls == 1
+    assert asyncio.run(cache.aget(MODEL, ask("rephrased 3"), {})) == "answer 3"
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_semantic_candidates_skip_evicted_responses(monkeypatch):
+    base = TOPICS["question 0"]
+    monkeypatch.setitem(VECTORS, "closest", nearby(base, 0.02, seed=100))
+    monkeypatch.setitem(VECTORS, "further", nearby(base, 0.2, seed=101))
+    assert cosine_similarity(base, VECTORS["closest"]) > cosine_similarity(base, VECTORS["further"]) > 0.5
+    semantic = semantic_cache(threshold=0.5, candidates=4)
+    # Room for one response: every earlier one is evicted from the exact layer.
+    cache = ResponseCache(maxsize=1, semantic=semantic)
+    cache.put(MODEL, ask("closest"), {}, "evicted")
+    cache.put(MODEL, ask("further"), {}, "kept")
+    # The closest question's response is gone, so the next candidate answers.
+    assert cache.get(MODEL, ask("question 0"), {}) == "kept"
+    # And the row of the evicted response was dropped.
+    assert semantic.vector_db.get_texts(semantic.vector_db._live_rows()) == [
+        response_key(MODEL, ask("further"), {})
+    ]
+
+
+def test_semantic_rows_expire_and_are_bounded():
+    clock = Clock()
+    semantic = semantic_cache(maxsize=3, clock=clock)
+    cache = ResponseCache(ttl=100, semantic=semantic, clock=clock)
+    for i in range(5):
+        cache.put(MODEL, ask(f"question {i}"), {}, f"answer {i}")
+    assert len(semantic.vector_db) == 3
+    assert cache.get(MODEL, ask("rephrased 1"), {}) is None
+    assert cache.get(MODEL, ask("rephrased 4"), {}) == "answer 4"
+    clock.now += 101
+    assert cache.get(MODEL, ask("rephrased 4"), {}) is None
+
+
+@pytest.fixture
+def api(monkeypatch):
+    with serve(FakeServerConfig(reply_words=8)) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        yield server
+
+
+def test_chat_answers_repeats_from_the_cache(api, tmp_path):
+    cache = ResponseCache(str(tmp_path / "chat.db"), semantic=semantic_cache())
+    chat = ChatOpenAI(cache=cache)
+    messages = ask("question 2")
+    assert chat.run(messages) == chat.run(messages) == fake_reply(messages, 8)
+    assert chat.run(ask("rephrased 2")) == fake_reply(messages, 8)
+    assert api.stats["requests"] == 1
+
+    async def stream(question):
+        return [piece async for piece in chat.astream(ask(question))]
+
+    # A fresh question is streamed from the API and then cached; the replay has the same text.
+    first = asyncio.run(stream("question 7"))
+    replay = asyncio.run(stream("question 7"))
+    assert "".join(first) == "".join(replay) == fake_reply(ask("question 7"), 8)
+    assert len(replay) == len(fake_reply(ask("question 7"), 8).split())
+    assert api.stats["requests"] == 2
+    # Non-text responses bypass the cache.
+    assert chat.run(messages, text_only=False).choices[0].message.content == fake_reply(messages, 8)
+    assert api.stats["requests"] == 3
+    cache.close()
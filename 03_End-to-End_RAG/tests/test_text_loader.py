@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+from aimakerspace.text_utils import CharacterTextSplitter, TextFileLoader
+
+WORDS = ["aid", "loan", "grant", "école", "naïve", "日本", "€", "\r\n", "\n", "\r"]
+
+
+def random_text(length, seed=19):
+    return " ".join(np.random.default_rng(seed).choice(WORDS, size=length)) + " "
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Nested ``.txt`` files of mixed size and line endings, plus files the loader skips."""
+    for i in range(40):
+        folder = tmp_path / f"part{i % 3}" / ("deep" if i % 2 else "")
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"doc{i}.txt").write_bytes(random_text(7 * i, seed=i).encode("utf-8"))
+    (tmp_path / "notes.md").write_text("not a text file", encoding="utf-8")
+    return tmp_path
+
+
+def plain_read(path):
+    """The original loader: one text-mode read per file."""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def walked(root):
+    return [
+        os.path.join(folder, name)
+        for folder, _, names in os.walk(root)
+        for name in names
+        if name.endswith(".txt")
+    ]
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"workers": 1},
+        {"workers": 4, "files_per_task": 3},
+        {"workers": 2, "files_per_task": 1, "mmap_threshold": 0},
+    ],
+    ids=["serial", "threaded", "mmap"],
+)
+def test_directory_loads_match_plain_reads(tree, settings):
+    expected = [(path, plain_read(path)) for path in walked(tree)]
+    assert list(TextFileLoader(str(tree), **settings).iter_documents()) == expected
+    assert TextFileLoader(str(tree), **settings).load_documents() == [text for _, text in expected]
+
+
+def test_single_file_and_bad_paths(tree):
+    path = walked(tree)[0]
+    assert TextFileLoader(path, mmap_threshold=0).load_documents() == [plain_read(path)]
+    with pytest.raises(ValueError):
+        TextFileLoader(str(tree / "notes.md")).load()
+    with pytest.raises(ValueError):
+        list(TextFileLoader(str(tree / "missing")).iter_documents())
+
+
+def test_stopping_early_leaves_no_work_behind(tree):
+    documents = TextFileLoader(str(tree), workers=2, files_per_task=1).iter_documents()
+    first = next(documents)
+    documents.close()
+    assert first == (walked(tree)[0], plain_read(walked(tree)[0]))
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1 << 20])
+def test_blocks_decode_to_the_whole_file(tmp_path, block_size):
+    # Small blocks cut multi-byte characters and \r\n pairs in half.
+    path = tmp_path / "big.txt"
+    path.write_bytes(random_text(2000).encode("utf-8"))
+    blocks = list(TextFileLoader(str(path)).iter_blocks(block_size=block_size))
+    assert "".join(blocks) == plain_read(path)
+    assert all(blocks)
+
+
+def test_empty_file_has_no_blocks(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert list(TextFileLoader(str(path)).iter_blocks()) == []
+    assert TextFileLoader(str(path), mmap_threshold=0).load_documents() == [""]
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(10, 0), (50, 20), (1000, 200)])
+@pytest.mark.parametrize("block_size", [1, 13, 1 << 20])
+def test_split_blocks_equals_split(tmp_path, chunk_size, chunk_overlap, block_size):
+    path = tmp_path / "big.txt"
+    path.write_bytes(random_text(1500).encode("utf-8"))
+    splitter = CharacterTextSplitter(chunk_size, chunk_overlap)
+    blocks = TextFileLoader(str(path)).iter_blocks(block_size=block_size)
+    assert list(splitter.split_blocks(blocks)) == splitter.split(plain_read(path))
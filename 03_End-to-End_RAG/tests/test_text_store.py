@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from aimakerspace.text_store import TextStore
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+rng = np.random.default_rng(22)
+DIM = 12
+ALPHABET = list("abc xyz\n") + ["é", "日本", "€", "𝄞"]
+
+
+def random_texts(n):
+    return ["".join(rng.choice(ALPHABET, size=rng.integers(0, 40))) for _ in range(n)]
+
+
+def test_appends_read_back_like_a_list():
+    store, texts = TextStore(), []
+    # Batches of all sizes, including empty ones and empty strings, push the offsets past their first growth.
+    for size in [0, 1, 5, 0, 30, 2, 100]:
+        batch = random_texts(size)
+        store.append_many(batch)
+        texts.extend(batch)
+        assert len(store) == len(texts)
+        assert list(store) == texts
+    ids = rng.integers(0, len(texts), size=50)
+    assert store.get_many(ids) == [texts[i] for i in ids]
+    assert store.nbytes >= sum(len(text.encode("utf-8")) for text in texts)
+
+
+def test_take_and_buffers_round_trip():
+    texts = random_texts(60)
+    store = TextStore()
+    store.append_many(texts)
+    ids = np.array([59, 0, 7, 7, 31])
+    assert list(store.take(ids)) == [texts[i] for i in ids]
+
+    buffer, offsets = store.buffers()
+    assert bytes(buffer) == "".join(texts).encode("utf-8") and len(offsets) == len(texts) + 1
+    # A read-only buffer, as from a memory map, is copied on the first append.
+    frozen = np.frombuffer(bytes(buffer), dtype=np.uint8)
+    reopened = TextStore(frozen, offsets.copy())
+    assert list(reopened) == texts
+    reopened.append_many(["new é"])
+    assert list(reopened) == texts + ["new é"]
+    assert list(TextStore(frozen, offsets.copy())) == texts
+
+
+def reference_top(rows, query, k):
+    """Brute-force top-k over a list of ``(text, vector)`` rows; the index is the id."""
+    scored = sorted(
+        ((i, cosine_similarity(query, vector)) for i, (_, vector) in enumerate(rows)),
+        key=lambda x: x[1],
+        reverse=True,
+    )
+    return scored[:k]
+
+
+def test_append_keeps_identical_texts_as_separate_rows():
+    db = VectorDatabase()
+    rows = []
+    for batch in range(4):
+        # The same chunk text recurs in every batch, with a different vector each time.
+        texts = ["shared chunk"] + [f"chunk {batch}-{i}" for i in range(20)]
+        vectors = rng.standard_normal((len(texts), DIM)).astype(np.float32)
+        ids = db.append(texts, vectors, [{"batch": batch}] * len(texts))
+        np.testing.assert_array_equal(ids, np.arange(len(rows), len(rows) + len(texts)))
+        rows.extend(zip(texts, vectors))
+
+    assert len(db) == len(rows) == 84
+    assert db.get_texts(range(len(rows))) == [text for text, _ in rows]
+    np.testing.assert_allclose(db.get_vectors(range(len(rows))), np.stack([v for _, v in rows]), rtol=1e-6)
+    for query in rng.standard_normal((5, DIM)):
+        ids, scores = db.search_ids(query, 10)
+        expected = reference_top(rows, query, 10)
+        assert ids.tolist() == [i for i, _ in expected]
+        np.testing.assert_allclose(scores, [s for _, s in expected], rtol=1e-5)
+        assert db.search(query, 10) == [(rows[i][0], float(s)) for i, s in zip(ids.tolist(), scores)]
+
+    # Key-addressed calls see the newest row of a repeated text.
+    np.testing.assert_allclose(db.retrieve_from_key("shared chunk"), rows[63][1], rtol=1e-6)
+    assert db.retrieve_metadata("shared chunk") == {"batch": 3}
+    assert db.find_ids({"batch": 1}).tolist() == list(range(21, 42))
+
+
+def test_append_after_key_lookups_updates_the_key_map():
+    db = VectorDatabase()
+    db.insert_many(["a", "b"], rng.standard_normal((2, DIM)))
+    assert db.retrieve_from_key("c") is None
+    vector = rng.standard_normal(DIM).astype(np.float32)
+    (row,) = db.append(["c"], vector[None, :]).tolist()
+    assert row == 2
+    np.testing.assert_allclose(db.retrieve_from_key("c"), vector, rtol=1e-6)
+    assert db.append([], np.empty((0, DIM))).tolist() == []
+    with pytest.raises(ValueError):
+        db.append(["x", "y"], rng.standard_normal((1, DIM)))
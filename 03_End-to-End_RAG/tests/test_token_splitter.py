@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from aimakerspace.openai_utils.batching import count_tokens, token_offsets
+from aimakerspace.token_splitter import Span, TokenTextSplitter, _char_positions
+
+MODEL = "text-embedding-3-small"
+rng = np.random.default_rng(21)
+
+
+def paragraph(sentences):
+    words = ["Students", "apply", "for", "aid", "each", "year", "naïve", "coût", "学生", "loans"]
+    return " ".join(
+        " ".join(rng.choice(words, size=rng.integers(4, 15))) + rng.choice([".", "!", "?"])
+        for _ in range(sentences)
+    )
+
+
+DOCUMENTS = [
+    "\n\n".join(paragraph(int(rng.integers(1, 12))) for _ in range(int(rng.integers(1, 10))))
+    for _ in range(12)
+] + ["", "one", "x" * 5000]
+
+
+def token_starts(text):
+    """Character offset of every token start, worked out one character at a time."""
+    byte_offsets = set(token_offsets([text], MODEL)[0].tolist())
+    starts, byte = [], 0
+    for position, char in enumerate(text):
+        width = len(char.encode("utf-8"))
+        # A token starting inside a multi-byte character is counted at that character.
+        starts.extend(position for offset in range(byte, byte + width) if offset in byte_offsets)
+        byte += width
+    return starts
+
+
+def tokens_in(starts, start, end):
+    return sum(start <= position < end for position in starts)
+
+
+def test_char_positions_match_a_per_character_walk():
+    for text in DOCUMENTS + ["é日€x", "𝄞a"]:
+        offsets = token_offsets([text], MODEL)[0]
+        assert _char_positions(text, offsets).tolist() == token_starts(text)
+
+
+@pytest.mark.parametrize("chunk_tokens, chunk_overlap", [(16, 0), (40, 10), (200, 50)])
+def test_spans_tile_each_document_within_the_limits(chunk_tokens, chunk_overlap):
+    splitter = TokenTextSplitter(chunk_tokens, chunk_overlap, model=MODEL, batch_size=5)
+    spans = splitter.split_spans(DOCUMENTS)
+    assert [span.doc_id for span in spans] == sorted(span.doc_id for span in spans)
+    for doc_id, text in enumerate(DOCUMENTS):
+        own = [span for span in spans if span.doc_id == doc_id]
+        starts = token_starts(text)
+        if not text:
+            assert own == []
+            continue
+        assert own[0].start == 0 and own[-1].end == len(text)
+        for span in own:
+            assert span.token_count == tokens_in(starts, span.start, span.end)
+            assert 0 < span.token_count <= chunk_tokens
+        for previous, span in zip(own, own[1:]):
+            # No gaps, always progress, and the shared part is within the overlap.
+            assert previous.start < span.start <= previous.end < span.end
+            assert tokens_in(starts, span.start, previous.end) <= chunk_overlap
+
+
+def test_token_counts_agree_with_counting_the_chunk():
+    splitter = TokenTextSplitter(50, 10, model=MODEL)
+    for span in splitter.split_spans(DOCUMENTS):
+        # Counted in place, a chunk may gain or lose a token at either edge.
+        assert abs(count_tokens([span.text(DOCUMENTS)], MODEL)[0] - span.token_count) <= 2
+
+
+def test_without_separators_chunks_are_fixed_token_windows():
+    text = DOCUMENTS[0]
+    starts = token_starts(text)
+    splitter = TokenTextSplitter(25, 0, model=MODEL, separators=())
+    expected = [
+        (starts[i], starts[i + 25] if i + 25 < len(starts) else len(text))
+        for i in range(0, len(starts), 25)
+    ]
+    assert [(span.start, span.end) for span in splitter.split_spans([text])] == expected
+
+
+def test_paragraphs_are_kept_whole_when_they_fit():
+    paragraphs = [paragraph(2) for _ in range(30)]
+    text = "\n\n".join(paragraphs)
+    limit = max(tokens_in(token_starts(p), 0, len(p)) for p in paragraphs) + 4
+    spans = TokenTextSplitter(limit * 3, limit, model=MODEL).split_spans([text])
+    assert len(spans) > 1
+    for span in spans:
+        assert span.start == 0 or text[span.start - 2 : span.start] == "\n\n"
+        assert span.end == len(text) or text[span.end - 2 : span.end] == "\n\n"
+
+
+def test_string_api_and_mapping_ids():
+    splitter = TokenTextSplitter(30, 5, model=MODEL)
+    spans = splitter.split_spans(DOCUMENTS)
+    assert splitter.split_texts(DOCUMENTS) == [span.text(DOCUMENTS) for span in spans]
+    assert splitter.split(DOCUMENTS[3]) == [span.text(DOCUMENTS) for span in spans if span.doc_id == 3]
+
+    named = {f"doc{i}": text for i, text in enumerate(DOCUMENTS)}
+    keyed = splitter.split_spans(named)
+    assert [span._replace(doc_id=int(span.doc_id[3:])) for span in keyed] == spans
+    assert Span("doc1", 0, 5, 1).text(named) == DOCUMENTS[1][:5]
+
+
+def test_overlap_must_be_below_the_chunk_size():
+    with pytest.raises(ValueError):
+        TokenTextSplitter(chunk_tokens=10, chunk_overlap=10)
@@ -0,0 +1,173 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import aimakerspace.vectordatabase as vectordatabase
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+DIM = 32
+
+
+def brute_force(texts, vectors, query, k):
+    """The original per-key loop: cosine similarity against every vector, sorted."""
+    scores = [(text, cosine_similarity(query, vector)) for text, vector in zip(texts, vectors)]
+    return sorted(scores, key=lambda x: x[1], reverse=True)[:k]
+
+
+def assert_same_results(got, expected):
+    assert [text for text, _ in got] == [text for text, _ in expected]
+    np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-5, atol=1e-6)
+
+
+rng = np.random.default_rng(1)
+TEXTS = [f"chunk {i}" for i in range(500)]
+VECTORS = rng.standard_normal((len(TEXTS), DIM)).astype(np.float32)
+QUERIES = rng.standard_normal((8, DIM)).astype(np.float32)
+
+
+def build(texts=TEXTS, vectors=VECTORS, **settings):
+    db = VectorDatabase(**settings)
+    db.insert_many(texts, vectors)
+    return db
+
+
+@pytest.mark.parametrize("k", [1, 5, 50, 500, 600])
+def test_search_matches_brute_force(k):
+    db = build()
+    for query in QUERIES:
+        assert_same_results(db.search(query, k), brute_force(TEXTS, VECTORS, query, k))
+
+
+def test_insert_one_at_a_time_matches_batch_insert():
+    db = VectorDatabase()
+    for text, vector in zip(TEXTS[:50], VECTORS[:50]):
+        db.insert(text, vector)
+    assert_same_results(db.search(QUERIES[0], 10), brute_force(TEXTS[:50], VECTORS[:50], QUERIES[0], 10))
+    np.testing.assert_array_equal(db.retrieve_from_key("chunk 7"), VECTORS[7])
+
+
+def test_reinserting_a_key_replaces_its_vector():
+    db = build()
+    replacement = -VECTORS[3]
+    db.insert(TEXTS[3], replacement)
+    vectors = VECTORS.copy()
+    vectors[3] = replacement
+    assert len(db) == len(TEXTS)
+    assert_same_results(db.search(QUERIES[1], 20), brute_force(TEXTS, vectors, QUERIES[1], 20))
+
+
+def test_custom_distance_measure_uses_it():
+    def negative_euclidean(a, b):
+        return -float(np.linalg.norm(a - b))
+
+    db = build()
+    expected = sorted(
+        ((text, negative_euclidean(QUERIES[2], vector)) for text, vector in zip(TEXTS, VECTORS)),
+        key=lambda x: x[1],
+        reverse=True,
+    )[:5]
+    assert_same_results(db.search(QUERIES[2], 5, distance_measure=negative_euclidean), expected)
+
+
+def test_zero_vectors_score_zero_instead_of_nan():
+    vectors = VECTORS[:4].copy()
+    vectors[2] = 0
+    db = build(TEXTS[:4], vectors)
+    results = dict(db.search(QUERIES[0], 4))
+    assert results["chunk 2"] == 0.0
+    assert not np.isnan(list(results.values())).any()
+
+
+def test_empty_database_and_dimension_mismatch():
+    db = VectorDatabase()
+    assert db.search(QUERIES[0], 3) == []
+    db.insert_many(TEXTS[:2], VECTORS[:2])
+    with pytest.raises(ValueError):
+        db.insert("other", np.ones(DIM + 1))
+
+
+class CountingEmbedder:
+    """Looks texts up in a fixed table and counts the calls made."""
+
+    def __init__(self, table):
+        self.table = table
+        self.calls = []
+
+    def get_embedding(self, text):
+        self.calls.append([text])
+        return self.table[text]
+
+    def get_embeddings(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([self.table[text] for text in texts])
+
+    async def async_get_embeddings(self, texts):
+        return self.get_embeddings(texts)
+
+
+@pytest.mark.parametrize("k", [1, 7, 500])
+def test_search_many_matches_one_search_per_query(k):
+    db = build()
+    batched = db.search_many(QUERIES, k)
+    assert len(batched) == len(QUERIES)
+    for query, results in zip(QUERIES, batched):
+        assert_same_results(results, brute_force(TEXTS, VECTORS, query, k))
+
+
+def test_search_many_in_several_score_blocks(monkeypatch):
+    # Three queries per block against 500 rows.
+    monkeypatch.setattr(vectordatabase, "_SCORE_BLOCK_ELEMENTS", 3 * len(TEXTS))
+    db = build()
+    for query, results in zip(QUERIES, db.search_many(QUERIES, 4)):
+        assert_same_results(results, brute_force(TEXTS, VECTORS, query, 4))
+
+
+def test_search_many_rejects_a_single_vector():
+    with pytest.raises(ValueError):
+        build().search_many(QUERIES[0], 3)
+
+
+def test_search_many_by_text_embeds_the_queries_in_one_call():
+    questions = [f"question {i}" for i in range(len(QUERIES))]
+    embedder = CountingEmbedder(dict(zip(questions, QUERIES)))
+    db = build(embedding_model=embedder)
+    results = db.search_many_by_text(questions, 3, return_as_text=True)
+    assert embedder.calls == [questions]
+    assert results == [[text for text, _ in brute_force(TEXTS, VECTORS, q, 3)] for q in QUERIES]
+
+
+def test_async_search_many_by_text_matches_sync():
+    questions = ["a", "b", "c"]
+    embedder = CountingEmbedder(dict(zip(questions, QUERIES)))
+    db = build(embedding_model=embedder)
+    expected = db.search_many_by_text(questions, 5)
+    assert asyncio.run(db.asearch_many_by_text(questions, 5)) == expected
+    assert asyncio.run(db.asearch_many_by_text([], 5)) == []
+
+
+@pytest.mark.parametrize("shards", [2, 3, 8])
+def test_sharded_search_matches_brute_force(shards):
+    db = build(shards=shards)
+    db.min_shard_rows = 50
+    assert len(db._shard_bounds(len(TEXTS))) == shards
+    for query in QUERIES:
+        assert_same_results(db.search(query, 9), brute_force(TEXTS, VECTORS, query, 9))
+    for query, results in zip(QUERIES, db.search_many(QUERIES, 9)):
+        assert_same_results(results, brute_force(TEXTS, VECTORS, query, 9))
+
+
+def test_sharded_search_skips_deleted_rows_in_every_shard():
+    db = build(shards=4)
+    db.min_shard_rows = 50
+    doomed = set(TEXTS[::7])
+    db.delete(doomed)
+    kept = [i for i, text in enumerate(TEXTS) if text not in doomed]
+    for query in QUERIES:
+        expected = brute_force([TEXTS[i] for i in kept], VECTORS[kept], query, 20)
+        assert_same_results(db.search(query, 20), expected)
+
+
+def test_small_databases_are_not_split():
+    db = build(shards=8)
+    assert db._shard_bounds(len(TEXTS)) == [(0, len(TEXTS))]